@@ -0,0 +1,55 @@
+"""create_offence_rollups
+
+Revision ID: a5c2e9d4b716
+Revises: f4a9c3e7b182
+Create Date: 2026-10-19 18:57:12.448105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c2e9d4b716'
+down_revision: Union[str, None] = 'f4a9c3e7b182'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Вимір -> (вираз значення, додатковий FROM) для заповнення лічильників з наявних офенсів.
+# severity зберігається як ім'я Enum (LOW, ...), лічильники — за значенням (low, ...)
+ROLLUP_BACKFILL_DIMENSIONS = {
+    "severity": ("lower(o.severity)", ""),
+    "rule": ("o.correlation_rule_id::text", ""),
+    # Як і record_offences, кожна APT-група рахується для офенса один раз, навіть якщо ID повторюється
+    "apt": ("apt.apt_id::text", ", LATERAL (SELECT DISTINCT unnest(o.attributed_apt_group_ids) AS apt_id) AS apt"),
+    "ioc_type": ("o.matched_ioc_type", ""),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('offence_rollups',
+    sa.Column('dimension', sa.String(length=16), nullable=False),
+    sa.Column('granularity', sa.String(length=8), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('dimension_value', sa.String(length=255), nullable=False),
+    sa.Column('offence_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('dimension', 'granularity', 'bucket_start', 'dimension_value')
+    )
+    for dimension, (value_expr, extra_from) in ROLLUP_BACKFILL_DIMENSIONS.items():
+        for granularity in ("hour", "day"):
+            op.execute(f"""
+                INSERT INTO offence_rollups (dimension, granularity, bucket_start, dimension_value, offence_count)
+                SELECT '{dimension}', '{granularity}',
+                       date_trunc('{granularity}', o.detected_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                       {value_expr}, count(*)
+                FROM offences o{extra_from}
+                WHERE {value_expr} IS NOT NULL
+                GROUP BY 3, 4
+            """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('offence_rollups')
@@ -0,0 +1,35 @@
+"""create_correlation_engine_members_table
+
+Revision ID: a8e3f6c2d915
+Revises: f1c9d4a7b260
+Create Date: 2026-10-19 15:12:53.402871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e3f6c2d915'
+down_revision: Union[str, None] = 'f1c9d4a7b260'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('correlation_engine_members',
+    sa.Column('instance_id', sa.String(length=128), nullable=False),
+    sa.Column('hostname', sa.String(length=255), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('instance_id')
+    )
+    op.create_index(op.f('ix_correlation_engine_members_heartbeat_at'), 'correlation_engine_members', ['heartbeat_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_correlation_engine_members_heartbeat_at'), table_name='correlation_engine_members')
+    op.drop_table('correlation_engine_members')
@@ -0,0 +1,41 @@
+"""add_fetch_schedule_to_ioc_sources
+
+Revision ID: b4d8e2f7a1c6
+Revises: a8e3f6c2d915
+Create Date: 2026-10-19 16:04:21.518340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d8e2f7a1c6'
+down_revision: Union[str, None] = 'a8e3f6c2d915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ioc_sources', sa.Column('fetch_interval_minutes', sa.Integer(), nullable=True))
+    op.add_column('ioc_sources', sa.Column('http_etag', sa.String(length=512), nullable=True))
+    op.add_column('ioc_sources', sa.Column('http_last_modified', sa.String(length=128), nullable=True))
+    op.add_column('ioc_sources', sa.Column('last_fetch_status', sa.String(length=32), nullable=True))
+    op.add_column('ioc_sources', sa.Column('last_fetch_duration_ms', sa.Integer(), nullable=True))
+    op.add_column('ioc_sources', sa.Column('last_fetch_added', sa.Integer(), nullable=True))
+    op.add_column('ioc_sources', sa.Column('last_fetch_updated', sa.Integer(), nullable=True))
+    op.add_column('ioc_sources', sa.Column('last_fetch_failed', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ioc_sources', 'last_fetch_failed')
+    op.drop_column('ioc_sources', 'last_fetch_updated')
+    op.drop_column('ioc_sources', 'last_fetch_added')
+    op.drop_column('ioc_sources', 'last_fetch_duration_ms')
+    op.drop_column('ioc_sources', 'last_fetch_status')
+    op.drop_column('ioc_sources', 'http_last_modified')
+    op.drop_column('ioc_sources', 'http_etag')
+    op.drop_column('ioc_sources', 'fetch_interval_minutes')
@@ -0,0 +1,32 @@
+"""add_generic_threshold_fields_to_correlation_rules
+
+Revision ID: c2f4e8a1d3b7
+Revises: 88848fa89488
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f4e8a1d3b7'
+down_revision: Union[str, None] = '88848fa89488'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('correlation_rules', sa.Column('threshold_metric', sa.Enum('COUNT', 'SUM', 'CARDINALITY', name='threshold_metric_enum_db', native_enum=False), nullable=True))
+    op.add_column('correlation_rules', sa.Column('threshold_metric_field', sa.Enum('SOURCE_IP', 'DESTINATION_IP', 'USERNAME', 'HOSTNAME', 'EVENT_MESSAGE', 'NETWORK_BYTES_TOTAL', 'REPORTER_IP', 'DESTINATION_PORT', 'SOURCE_AS', 'DESTINATION_AS', name='threshold_metric_field_enum_db', native_enum=False), nullable=True))
+    op.add_column('correlation_rules', sa.Column('event_filter', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('correlation_rules', 'event_filter')
+    op.drop_column('correlation_rules', 'threshold_metric_field')
+    op.drop_column('correlation_rules', 'threshold_metric')
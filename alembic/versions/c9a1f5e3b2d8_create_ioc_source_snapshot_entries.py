@@ -0,0 +1,38 @@
+"""create_ioc_source_snapshot_entries
+
+Revision ID: c9a1f5e3b2d8
+Revises: b4d8e2f7a1c6
+Create Date: 2026-10-19 16:41:07.226914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9a1f5e3b2d8'
+down_revision: Union[str, None] = 'b4d8e2f7a1c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ioc_source_snapshot_entries',
+    sa.Column('source_id', sa.Integer(), nullable=False),
+    sa.Column('doc_id', sa.String(length=40), nullable=False),
+    sa.Column('content_hash', sa.String(length=40), nullable=False),
+    sa.Column('es_last_seen', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['source_id'], ['ioc_sources.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('source_id', 'doc_id')
+    )
+    op.create_index(op.f('ix_ioc_source_snapshot_entries_doc_id'), 'ioc_source_snapshot_entries', ['doc_id'], unique=False)
+    op.add_column('ioc_sources', sa.Column('last_fetch_removed', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ioc_sources', 'last_fetch_removed')
+    op.drop_index(op.f('ix_ioc_source_snapshot_entries_doc_id'), table_name='ioc_source_snapshot_entries')
+    op.drop_table('ioc_source_snapshot_entries')
@@ -0,0 +1,27 @@
+"""add_offences_keyset_index
+
+Revision ID: d3f7a2c8e415
+Revises: c9a1f5e3b2d8
+Create Date: 2026-10-19 17:12:48.604213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f7a2c8e415'
+down_revision: Union[str, None] = 'c9a1f5e3b2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_offences_detected_at_id', 'offences', ['detected_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_offences_detected_at_id', table_name='offences')
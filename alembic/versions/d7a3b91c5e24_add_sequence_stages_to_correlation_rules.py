@@ -0,0 +1,30 @@
+"""add_sequence_stages_to_correlation_rules
+
+Revision ID: d7a3b91c5e24
+Revises: c2f4e8a1d3b7
+Create Date: 2026-10-19 11:04:17.552913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3b91c5e24'
+down_revision: Union[str, None] = 'c2f4e8a1d3b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # rule_type зберігається як VARCHAR(27) (native_enum=False), тож 'SEQUENCE_OF_EVENTS' вміщується без зміни типу
+    op.add_column('correlation_rules', sa.Column('sequence_stages', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM correlation_rules WHERE rule_type = 'SEQUENCE_OF_EVENTS'")
+    op.drop_column('correlation_rules', 'sequence_stages')
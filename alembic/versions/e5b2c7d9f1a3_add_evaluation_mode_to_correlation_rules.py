@@ -0,0 +1,27 @@
+"""add_evaluation_mode_to_correlation_rules
+
+Revision ID: e5b2c7d9f1a3
+Revises: d7a3b91c5e24
+Create Date: 2026-10-19 12:31:40.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b2c7d9f1a3'
+down_revision: Union[str, None] = 'd7a3b91c5e24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('correlation_rules', sa.Column('evaluation_mode', sa.Enum('BATCH', 'STREAM', name='rule_evaluation_mode_enum_db', native_enum=False), server_default='BATCH', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('correlation_rules', 'evaluation_mode')
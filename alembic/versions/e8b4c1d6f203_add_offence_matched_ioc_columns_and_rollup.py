@@ -0,0 +1,52 @@
+"""add_offence_matched_ioc_columns_and_rollup
+
+Revision ID: e8b4c1d6f203
+Revises: d3f7a2c8e415
+Create Date: 2026-10-19 17:48:31.902716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4c1d6f203'
+down_revision: Union[str, None] = 'd3f7a2c8e415'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('offences', sa.Column('matched_ioc_value', sa.String(),
+                                        sa.Computed("matched_ioc_details->>'value'", persisted=True), nullable=True))
+    op.add_column('offences', sa.Column('matched_ioc_type', sa.String(),
+                                        sa.Computed("matched_ioc_details->>'type'", persisted=True), nullable=True))
+    op.create_index('ix_offences_detected_at_matched_ioc', 'offences',
+                    ['detected_at', 'matched_ioc_value', 'matched_ioc_type'], unique=False,
+                    postgresql_where=sa.text('matched_ioc_value IS NOT NULL'))
+    # Лише повні доби UTC: поточна доба рахується з offences напряму, тож знімок не треба оновлювати частіше за раз на добу
+    op.execute("""
+        CREATE MATERIALIZED VIEW offence_ioc_daily_counts AS
+        SELECT (detected_at AT TIME ZONE 'UTC')::date AS day,
+               matched_ioc_value AS ioc_value,
+               matched_ioc_type AS ioc_type,
+               count(*)::integer AS trigger_count
+        FROM offences
+        WHERE matched_ioc_value IS NOT NULL
+          AND matched_ioc_type IS NOT NULL
+          AND detected_at < date_trunc('day', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+        GROUP BY 1, 2, 3
+    """)
+    # Унікальний індекс потрібен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index('ux_offence_ioc_daily_counts', 'offence_ioc_daily_counts', ['day', 'ioc_value', 'ioc_type'],
+                    unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS offence_ioc_daily_counts")
+    op.drop_index('ix_offences_detected_at_matched_ioc', table_name='offences')
+    op.drop_column('offences', 'matched_ioc_type')
+    op.drop_column('offences', 'matched_ioc_value')
@@ -0,0 +1,44 @@
+"""add_anomaly_netflow_volume_rules
+
+Revision ID: f1c9d4a7b260
+Revises: e5b2c7d9f1a3
+Create Date: 2026-10-19 13:47:02.917351
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c9d4a7b260'
+down_revision: Union[str, None] = 'e5b2c7d9f1a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # rule_type — VARCHAR(27) (native_enum=False), 'ANOMALY_NETFLOW_VOLUME' вміщується без зміни типу
+    op.add_column('correlation_rules', sa.Column('anomaly_sigma', sa.Float(), nullable=True))
+    op.add_column('correlation_rules', sa.Column('anomaly_alpha', sa.Float(), nullable=True))
+    op.add_column('correlation_rules', sa.Column('anomaly_min_samples', sa.Integer(), nullable=True))
+    op.create_table('anomaly_baselines',
+    sa.Column('correlation_rule_id', sa.Integer(), nullable=False),
+    sa.Column('baseline_key', sa.String(length=512), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('variance', sa.Float(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['correlation_rule_id'], ['correlation_rules.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('correlation_rule_id', 'baseline_key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('anomaly_baselines')
+    op.execute("DELETE FROM correlation_rules WHERE rule_type = 'ANOMALY_NETFLOW_VOLUME'")
+    op.drop_column('correlation_rules', 'anomaly_min_samples')
+    op.drop_column('correlation_rules', 'anomaly_alpha')
+    op.drop_column('correlation_rules', 'anomaly_sigma')
@@ -0,0 +1,127 @@
+"""partition_offences_by_month
+
+Revision ID: f4a9c3e7b182
+Revises: e8b4c1d6f203
+Create Date: 2026-10-19 18:20:54.117390
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a9c3e7b182'
+down_revision: Union[str, None] = 'e8b4c1d6f203'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Генеровані колонки не вставляються явно, тож копіювання йде за переліком звичайних колонок
+OFFENCE_COLUMNS = ("id, title, description, severity, status, correlation_rule_id, triggering_event_summary, "
+                   "matched_ioc_details, attributed_apt_group_ids, detected_at, notes, assigned_to_user_id, "
+                   "created_at, updated_at")
+PARTITION_MONTHS_AHEAD = 3
+
+OFFENCE_IOC_DAILY_COUNTS_SQL = """
+    CREATE MATERIALIZED VIEW offence_ioc_daily_counts AS
+    SELECT (detected_at AT TIME ZONE 'UTC')::date AS day,
+           matched_ioc_value AS ioc_value,
+           matched_ioc_type AS ioc_type,
+           count(*)::integer AS trigger_count
+    FROM offences
+    WHERE matched_ioc_value IS NOT NULL
+      AND matched_ioc_type IS NOT NULL
+      AND detected_at < date_trunc('day', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+    GROUP BY 1, 2, 3
+"""
+
+
+def _add_months(month_start: date, months: int) -> date:
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _drop_offence_ioc_daily_counts() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS offence_ioc_daily_counts")
+
+
+def _create_offence_ioc_daily_counts() -> None:
+    op.execute(OFFENCE_IOC_DAILY_COUNTS_SQL)
+    op.create_index('ux_offence_ioc_daily_counts', 'offence_ioc_daily_counts', ['day', 'ioc_value', 'ioc_type'],
+                    unique=True)
+
+
+def _detach_old_offences_table() -> None:
+    """Перейменовує поточну offences і звільняє імена її індексів та послідовність id."""
+    op.execute("ALTER TABLE offences RENAME TO offences_old")
+    op.execute("ALTER TABLE offences_old DROP CONSTRAINT offences_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_offences_id")
+    op.execute("DROP INDEX IF EXISTS ix_offences_detected_at_id")
+    op.execute("DROP INDEX IF EXISTS ix_offences_detected_at_matched_ioc")
+    op.execute("DROP INDEX IF EXISTS ix_offences_status_detected_at")
+    op.execute("DROP INDEX IF EXISTS ix_offences_severity_detected_at")
+    op.execute("DROP INDEX IF EXISTS ix_offences_rule_id_detected_at")
+    op.execute("ALTER SEQUENCE offences_id_seq OWNED BY NONE")
+
+
+def _copy_and_drop_old_offences_table() -> None:
+    op.execute(f"INSERT INTO offences ({OFFENCE_COLUMNS}) SELECT {OFFENCE_COLUMNS} FROM offences_old")
+    op.execute("ALTER SEQUENCE offences_id_seq OWNED BY offences.id")
+    op.execute("DROP TABLE offences_old")
+
+
+def _create_offence_indexes() -> None:
+    op.create_index('ix_offences_detected_at_id', 'offences', ['detected_at', 'id'], unique=False)
+    op.create_index('ix_offences_detected_at_matched_ioc', 'offences',
+                    ['detected_at', 'matched_ioc_value', 'matched_ioc_type'], unique=False,
+                    postgresql_where=sa.text('matched_ioc_value IS NOT NULL'))
+    op.create_index('ix_offences_status_detected_at', 'offences', ['status', 'detected_at'], unique=False)
+    op.create_index('ix_offences_severity_detected_at', 'offences', ['severity', 'detected_at'], unique=False)
+    op.create_index('ix_offences_rule_id_detected_at', 'offences', ['correlation_rule_id', 'detected_at'],
+                    unique=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _drop_offence_ioc_daily_counts()
+    _detach_old_offences_table()
+
+    op.execute("CREATE TABLE offences (LIKE offences_old INCLUDING DEFAULTS INCLUDING GENERATED) "
+               "PARTITION BY RANGE (detected_at)")
+    op.execute("ALTER TABLE offences ADD CONSTRAINT offences_pkey PRIMARY KEY (id, detected_at)")
+
+    # Місячні секції від найстарішого офенса до поточного місяця + запас наперед; решта — у секцію за замовчуванням
+    today = datetime.now(timezone.utc).date()
+    current_month = date(today.year, today.month, 1)
+    oldest = op.get_bind().execute(sa.text("SELECT min(detected_at) FROM offences_old")).scalar()
+    oldest = oldest.astimezone(timezone.utc) if oldest else None
+    month_start = date(oldest.year, oldest.month, 1) if oldest else current_month
+    while month_start <= _add_months(current_month, PARTITION_MONTHS_AHEAD):
+        month_end = _add_months(month_start, 1)
+        op.execute(f"CREATE TABLE offences_p{month_start:%Y%m} PARTITION OF offences "
+                   f"FOR VALUES FROM ('{month_start:%Y-%m-%d} 00:00:00+00') TO ('{month_end:%Y-%m-%d} 00:00:00+00')")
+        month_start = month_end
+    op.execute("CREATE TABLE offences_default PARTITION OF offences DEFAULT")
+
+    _copy_and_drop_old_offences_table()
+    _create_offence_indexes()
+    _create_offence_ioc_daily_counts()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _drop_offence_ioc_daily_counts()
+    _detach_old_offences_table()
+
+    op.execute("CREATE TABLE offences (LIKE offences_old INCLUDING DEFAULTS INCLUDING GENERATED)")
+    op.execute("ALTER TABLE offences ADD CONSTRAINT offences_pkey PRIMARY KEY (id)")
+    op.create_index(op.f('ix_offences_id'), 'offences', ['id'], unique=False)
+
+    # DROP секціонованої таблиці видаляє й усі її секції
+    _copy_and_drop_old_offences_table()
+    op.create_index('ix_offences_detected_at_id', 'offences', ['detected_at', 'id'], unique=False)
+    op.create_index('ix_offences_detected_at_matched_ioc', 'offences',
+                    ['detected_at', 'matched_ioc_value', 'matched_ioc_type'], unique=False,
+                    postgresql_where=sa.text('matched_ioc_value IS NOT NULL'))
+    _create_offence_ioc_daily_counts()
@@ -0,0 +1,56 @@
+# app/core/cache.py
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.core import cache_versions
+
+
+class TTLCache:
+    """
+    Невеликий кеш у пам'яті процесу з часом життя записів. Ключ доповнюється версіями просторів імен
+    cache_versions, тож зміна даних у цьому процесі інвалідовує записи одразу, а зміни з інших
+    процесів стають видимими не пізніше ніж через ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], namespaces: Tuple[str, ...] = (),
+                    ttl_seconds: Optional[float] = None) -> Any:
+        full_key = (key, tuple(cache_versions.current(namespace) for namespace in namespaces))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Завантаження поза блокуванням: паралельні промахи можуть порахувати значення двічі, але не блокують одне одного
+        value = loader()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[full_key] = (now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds), value)
+        return value
+
+    def _evict(self, now: float):
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            # Немає прострочених — видаляємо запис, що спливає найраніше
+            del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,26 @@
+# app/core/cache_versions.py
+import threading
+from typing import Dict
+
+# Простори імен, зміни в яких інвалідовують кеші в пам'яті процесу
+CORRELATION_RULES = "correlation_rules"
+IOCS = "iocs"
+APT_GROUPS = "apt_groups"
+OFFENCES = "offences"
+DEVICES = "devices"
+IOC_SOURCES = "ioc_sources"
+RESPONSE = "response"
+
+_versions: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def bump(namespace: str) -> int:
+    """Позначає дані простору імен зміненими; кеші порівнюють версію при наступному зверненні."""
+    with _lock:
+        _versions[namespace] = _versions.get(namespace, 0) + 1
+        return _versions[namespace]
+
+
+def current(namespace: str) -> int:
+    return _versions.get(namespace, 0)
@@ -23,6 +23,16 @@ class Settings:
     ELASTICSEARCH_HOST: str = os.getenv("ELASTICSEARCH_HOST", "localhost")  # Для запуску Python поза Docker
     ELASTICSEARCH_PORT_API: int = int(os.getenv("ELASTICSEARCH_PORT_API", "9200"))  # Для запуску Python поза Docker
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
+    # Інтервал автоматичного циклу кореляції; 0 — лише ручний запуск через API
+    CORRELATION_INTERVAL_SECONDS: int = int(os.getenv("CORRELATION_INTERVAL_SECONDS", "0"))
+    # Як часто планувальник перевіряє, які джерела IoC пора отримати (інтервали — в самих джерелах); 0 — вимкнено
+    IOC_FETCH_TICK_SECONDS: int = int(os.getenv("IOC_FETCH_TICK_SECONDS", "0"))
+    # IoC, не помічені в жодному фіді довше за стільки днів (за last_seen), деактивуються; 0 — без прострочення
+    IOC_TTL_DAYS: int = int(os.getenv("IOC_TTL_DAYS", "90"))
+    # Читати IoC і зі старих щоденних індексів siem-iocs-YYYY.MM.DD (лише доки не виконано migrate_ioc_indices)
+    IOC_READ_LEGACY_INDICES: bool = os.getenv("IOC_READ_LEGACY_INDICES", "false").lower() in ("1", "true", "yes")
+    # Місячні секції offences, старші за стільки повних місяців, видаляються; 0 — зберігати всі офенси
+    OFFENCE_RETENTION_MONTHS: int = int(os.getenv("OFFENCE_RETENTION_MONTHS", "0"))
 
 settings = Settings()
 
@@ -0,0 +1,64 @@
+# app/core/export.py
+import csv
+import enum
+import io
+import json
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Dict, Any
+
+from fastapi.responses import StreamingResponse
+
+# Скільки рядків CSV/NDJSON збирати в один шматок відповіді (менше дрібних записів у сокет)
+EXPORT_CHUNK_ROWS = 500
+
+
+class ExportFormatEnum(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormatEnum.NDJSON: "application/x-ndjson",
+    ExportFormatEnum.CSV: "text/csv; charset=utf-8",
+}
+
+
+def iter_ndjson(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buffer: List[str] = []
+    for record in records:
+        buffer.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        if len(buffer) >= EXPORT_CHUNK_ROWS:
+            yield "".join(buffer)
+            buffer.clear()
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_csv(records: Iterable[Dict[str, Any]], fieldnames: List[str]) -> Iterator[str]:
+    """Списки й словники записуються в комірку як JSON, None — як порожня комірка."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    rows = 0
+    for record in records:
+        writer.writerow({key: json.dumps(value, ensure_ascii=False, default=str)
+                         if isinstance(value, (list, dict)) else value for key, value in record.items()})
+        rows += 1
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+    if output.tell():
+        yield output.getvalue()
+
+
+def export_response(records: Iterable[Dict[str, Any]], export_format: ExportFormatEnum, fieldnames: List[str],
+                    filename_prefix: str) -> StreamingResponse:
+    """
+    Потокова відповідь експорту: записи (словники, готові до JSON) тягнуться з генератора по мірі
+    відправлення, тож пам'ять не залежить від розміру вибірки.
+    """
+    body = iter_csv(records, fieldnames) if export_format == ExportFormatEnum.CSV else iter_ndjson(records)
+    filename = f"{filename_prefix}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{export_format.value}"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,32 @@
+# app/core/pagination.py
+import base64
+import json
+from typing import Dict, Any
+
+# Заголовок відповіді з курсором наступної сторінки (тіло відповіді лишається списком, як і раніше)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class ExpiredCursorError(ValueError):
+    pass
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Непрозорий для клієнта курсор: base64url від компактного JSON зі станом пагінації."""
+    raw = json.dumps(state, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"Invalid pagination cursor: {e}")
+    if not isinstance(state, dict):
+        raise InvalidCursorError("Invalid pagination cursor.")
+    return state
@@ -0,0 +1,60 @@
+# app/core/response_cache.py
+import hashlib
+import time
+import uuid
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, Response
+
+from app.core import cache_versions
+
+ETAG_HEADER = "ETag"
+DEFAULT_ETAG_TTL_SECONDS = 60
+# "no-cache" — браузер може зберігати відповідь, але перед повторним використанням перевіряє її через If-None-Match
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+# ETag залежить від версій cache_versions, які живуть у пам'яті процесу; ідентифікатор запуску не дає
+# тегу, виданому до рестарту чи іншою реплікою, випадково збігтися з поточним
+_BOOT_ID = uuid.uuid4().hex
+
+
+def _request_etag(request: Request, namespaces: tuple, ttl_seconds: int) -> str:
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    versions = ",".join(f"{namespace}:{cache_versions.current(namespace)}" for namespace in namespaces)
+    ttl_window = int(time.time() // ttl_seconds)
+    digest = hashlib.sha1(f"{request.url.path}?{query}|{versions}|{ttl_window}|{_BOOT_ID}".encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабке порівняння (RFC 9110): префікс W/ ігнорується, заголовок може містити кілька тегів або '*'."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque_tag:
+            return True
+    return False
+
+
+def etag_cache(*namespaces: str, ttl_seconds: int = DEFAULT_ETAG_TTL_SECONDS):
+    """
+    Залежність для GET-маршрутів: dependencies=[etag_cache(cache_versions.IOCS)]. Слабкий ETag будується
+    з шляху й параметрів запиту, версій просторів імен і номера TTL-вікна, а не з тіла відповіді, тому
+    при збігу з If-None-Match відповідь 304 повертається до відкриття сесії БД і виконання запитів.
+    Зміни через сервіси цього процесу (cache_versions.bump) змінюють тег одразу, решта — з новим TTL-вікном.
+    """
+
+    def dependency(request: Request, response: Response):
+        etag = _request_etag(request, namespaces, ttl_seconds)
+        headers = {ETAG_HEADER: etag, "Cache-Control": ETAG_CACHE_CONTROL}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return Depends(dependency)
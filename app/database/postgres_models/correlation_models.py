@@ -1,7 +1,8 @@
 # app/database/postgres_models/correlation_models.py
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ARRAY, Enum as SAEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, ARRAY, ForeignKey, Index, Computed, \
+    Date, Enum as SAEnum, column, table, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 # from datetime import datetime, timezone # Вже імпортовано вище, якщо є
@@ -11,6 +12,8 @@ from app.modules.correlation.schemas import (  # Імпортуємо всі п
     EventFieldToMatchTypeEnum,
     IoCTypeToMatchEnum,
     CorrelationRuleTypeEnum,  # <--- НОВИЙ
+    ThresholdMetricEnum,
+    RuleEvaluationModeEnum,
     OffenceStatusEnum,
     OffenceSeverityEnum
 )
@@ -48,6 +51,22 @@ class CorrelationRule(Base):
     # `name` для Enum в ARRAY має бути унікальним, якщо він створює тип в БД.
     # Якщо `native_enum=False`, то це буде `ARRAY(VARCHAR)`.
 
+    # Узагальнені порогові правила: метрика, поле метрики та довільний фільтр подій
+    threshold_metric = Column(SAEnum(ThresholdMetricEnum, name="threshold_metric_enum_db", native_enum=False),
+                              nullable=True)
+    threshold_metric_field = Column(
+        SAEnum(EventFieldToMatchTypeEnum, name="threshold_metric_field_enum_db", native_enum=False), nullable=True)
+    event_filter = Column(JSONB, nullable=True)
+    evaluation_mode = Column(SAEnum(RuleEvaluationModeEnum, name="rule_evaluation_mode_enum_db", native_enum=False),
+                             default=RuleEvaluationModeEnum.BATCH, server_default=RuleEvaluationModeEnum.BATCH.name,
+                             nullable=False)
+    # Стадії SEQUENCE_OF_EVENTS (список SequenceStage)
+    sequence_stages = Column(JSONB, nullable=True)
+    # Параметри ANOMALY_NETFLOW_VOLUME
+    anomaly_sigma = Column(Float, nullable=True)
+    anomaly_alpha = Column(Float, nullable=True)
+    anomaly_min_samples = Column(Integer, nullable=True)
+
     generated_offence_title_template = Column(String, nullable=False)
     generated_offence_severity = Column(
         SAEnum(OffenceSeverityEnum, name="offence_severity_enum_db", native_enum=False),
@@ -62,11 +81,51 @@ class CorrelationRule(Base):
         return f"<CorrelationRule(id={self.id}, name='{self.name}', type='{self.rule_type.value}')>"
 
 
+# --- Базові лінії ANOMALY_NETFLOW_VOLUME (чекпоінти, щоб перезапуск не скидав навчання) ---
+class AnomalyBaseline(Base):
+    __tablename__ = "anomaly_baselines"
+
+    correlation_rule_id = Column(Integer, ForeignKey("correlation_rules.id", ondelete="CASCADE"), primary_key=True)
+    baseline_key = Column(String(512), primary_key=True)  # Значення aggregation_fields через '|'
+    mean = Column(Float, nullable=False, default=0.0)
+    variance = Column(Float, nullable=False, default=0.0)
+    samples = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<AnomalyBaseline(rule_id={self.correlation_rule_id}, key='{self.baseline_key}', samples={self.samples})>"
+
+
+# --- Членство екземплярів рушія кореляції (оренда з heartbeat для шардування правил) ---
+class CorrelationEngineMember(Base):
+    __tablename__ = "correlation_engine_members"
+
+    instance_id = Column(String(128), primary_key=True)
+    hostname = Column(String(255), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<CorrelationEngineMember(instance_id='{self.instance_id}', heartbeat_at='{self.heartbeat_at}')>"
+
+
 # --- Модель Offence (без змін у структурі, але переконайся, що імпорти Enum коректні) ---
 class Offence(Base):
     # ... (код моделі Offence залишається таким же, як у попередній відповіді)
     __tablename__ = "offences";
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # Таблиця секціонована по місяцях за detected_at (engine/partitions.py), тож detected_at входить у PK.
+    # Keyset-пагінація списку офенсів іде по (detected_at, id); топ IoC дашборду — index-only scan
+    # по (detected_at, matched_ioc_value, matched_ioc_type); фільтри UI — статус, severity, правило
+    __table_args__ = (
+        Index("ix_offences_detected_at_id", "detected_at", "id"),
+        Index("ix_offences_detected_at_matched_ioc", "detected_at", "matched_ioc_value", "matched_ioc_type",
+              postgresql_where=text("matched_ioc_value IS NOT NULL")),
+        Index("ix_offences_status_detected_at", "status", "detected_at"),
+        Index("ix_offences_severity_detected_at", "severity", "detected_at"),
+        Index("ix_offences_rule_id_detected_at", "correlation_rule_id", "detected_at"),
+        {"postgresql_partition_by": "RANGE (detected_at)"},
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String, nullable=False);
     description = Column(Text, nullable=True)
     severity = Column(SAEnum(OffenceSeverityEnum, name="offence_severity_enum_db", native_enum=False), nullable=False)
@@ -75,8 +134,12 @@ class Offence(Base):
     correlation_rule_id = Column(Integer, nullable=False)
     triggering_event_summary = Column(JSONB, nullable=True);
     matched_ioc_details = Column(JSONB, nullable=True)
+    # Значення й тип IoC зі знімка matched_ioc_details — для агрегацій у SQL без розбору JSONB
+    matched_ioc_value = Column(String, Computed("matched_ioc_details->>'value'", persisted=True), nullable=True)
+    matched_ioc_type = Column(String, Computed("matched_ioc_details->>'type'", persisted=True), nullable=True)
     attributed_apt_group_ids = Column(ARRAY(Integer), nullable=True)
-    detected_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    detected_at = Column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc),
+                         nullable=False)
     notes = Column(Text, nullable=True);
     assigned_to_user_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -84,3 +147,31 @@ class Offence(Base):
 
     def __repr__(
             self): return f"<Offence(id={self.id}, title='{self.title}', status='{self.status.value if self.status else None}')>"
+
+
+class OffenceRollup(Base):
+    """
+    Лічильники офенсів за годину/добу UTC у розрізі виміру (severity, правило, APT, тип IoC).
+    Інкрементуються в тій самій транзакції, що й вставка офенсів (app/modules/correlation/rollups.py).
+    """
+    __tablename__ = "offence_rollups"
+
+    dimension = Column(String(16), primary_key=True)
+    granularity = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    dimension_value = Column(String(255), primary_key=True)
+    offence_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<OffenceRollup({self.dimension}={self.dimension_value}, {self.granularity} {self.bucket_start}: {self.offence_count})>"
+
+# Матеріалізоване представлення (міграція e8b4c1d6f203): кількість спрацювань на IoC за кожну повну
+# добу UTC. Не таблиця ORM — оновлюється REFRESH MATERIALIZED VIEW, тож описане лише для запитів.
+offence_ioc_daily_counts = table(
+    "offence_ioc_daily_counts",
+    column("day", Date),
+    column("ioc_value", String),
+    column("ioc_type", String),
+    column("trigger_count", Integer),
+)
+
@@ -1,5 +1,5 @@
 # app/database/postgres_models/ioc_source_models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum as SAEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum as SAEnum
 from sqlalchemy.sql import func
 from datetime import datetime, timezone  # Додано timezone
 
@@ -22,9 +22,35 @@ class IoCSource(Base):
 
     last_fetched = Column(DateTime(timezone=True), nullable=True)
 
+    # Автоматичне отримання планувальником; NULL — лише вручну через API
+    fetch_interval_minutes = Column(Integer, nullable=True)
+    # Валідатори умовних запитів (If-None-Match / If-Modified-Since) з останньої успішної відповіді
+    http_etag = Column(String(512), nullable=True)
+    http_last_modified = Column(String(128), nullable=True)
+    # Статистика останнього отримання
+    last_fetch_status = Column(String(32), nullable=True)  # success / partial / not_modified / error
+    last_fetch_duration_ms = Column(Integer, nullable=True)
+    last_fetch_added = Column(Integer, nullable=True)
+    last_fetch_updated = Column(Integer, nullable=True)
+    last_fetch_failed = Column(Integer, nullable=True)
+    last_fetch_removed = Column(Integer, nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     # Для onupdate використовуємо default=func.now() та onupdate=func.now() для сумісності
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
 
     def __repr__(self):
         return f"<IoCSource(id={self.id}, name='{self.name}', type='{self.type.value}')>"
+
+
+# --- Знімок фіду джерела: що саме містило останнє повне отримання (для обчислення дельти) ---
+class IoCSourceSnapshotEntry(Base):
+    __tablename__ = "ioc_source_snapshot_entries"
+
+    source_id = Column(Integer, ForeignKey("ioc_sources.id", ondelete="CASCADE"), primary_key=True)
+    doc_id = Column(String(40), primary_key=True, index=True)  # ID документа IoC (sha1 від "тип:значення")
+    content_hash = Column(String(40), nullable=False)  # sha1 змістовних полів запису фіду
+    es_last_seen = Column(DateTime(timezone=True), nullable=False)  # seen_in_feed_at, востаннє записаний в ES
+
+    def __repr__(self):
+        return f"<IoCSourceSnapshotEntry(source_id={self.source_id}, doc_id='{self.doc_id}')>"
@@ -1,18 +1,23 @@
 # app/modules/apt_groups/api.py
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body, Response
 from sqlalchemy.orm import Session
 
+from app.core import cache_versions
+from app.core.response_cache import etag_cache
 from app.core.database import get_db
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter, es_exceptions
 from app.modules.indicators import schemas as indicator_schemas  # <--- ДОДАНО для response_model
 from app.modules.indicators.services import IndicatorService  # <--- ДОДАНО
 # Для взаємодії з іншими сервісами
 from . import schemas
-from .services import APTGroupService
+from .services import APTGroupService, APTUnlinkStartError
 from ...core.dependencies import get_es_writer
 
+# Заголовок відповіді DELETE з ID фонової задачі відв'язування IoC (тіло відповіді 204 порожнє, як і раніше)
+APT_UNLINK_TASK_HEADER = "X-Unlink-Task-Id"
+
 router = APIRouter(
     prefix="/apt-groups",
     tags=["APT Groups"]
@@ -32,7 +37,8 @@ def create_apt_group_api(  # Перейменовано для уникненн
         raise HTTPException(status_code=500, detail=f"Failed to create APT group: {str(e)}")
 
 
-@router.get("/", response_model=List[schemas.APTGroupResponse], operation_id="get_all_apt_groups")
+@router.get("/", response_model=List[schemas.APTGroupResponse], operation_id="get_all_apt_groups",
+            dependencies=[etag_cache(cache_versions.APT_GROUPS)])
 def read_apt_groups_api(  # Перейменовано
         skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=200),
         db: Session = Depends(get_db), service: APTGroupService = Depends(APTGroupService)
@@ -40,7 +46,8 @@ def read_apt_groups_api(  # Перейменовано
     return service.get_all_apt_groups(db=db, skip=skip, limit=limit)
 
 
-@router.get("/{group_id}", response_model=schemas.APTGroupResponse, operation_id="get_apt_group")
+@router.get("/{group_id}", response_model=schemas.APTGroupResponse, operation_id="get_apt_group",
+            dependencies=[etag_cache(cache_versions.APT_GROUPS)])
 def read_apt_group_api(  # Перейменовано
         group_id: int = Path(..., ge=1), db: Session = Depends(get_db),
         service: APTGroupService = Depends(APTGroupService)
@@ -67,19 +74,37 @@ def delete_apt_group_api(
         apt_service: APTGroupService = Depends(APTGroupService),
         indicator_service: IndicatorService = Depends(IndicatorService)
 ):
+    """
+    Видаляє APT-групу одразу; відв'язування її ID від IoC триває фоновою задачею ES. Її ID повертається
+    в заголовку X-Unlink-Task-Id, прогрес доступний за GET /apt-groups/unlink-tasks/{task_id}.
+    """
     try:
-        success = apt_service.delete_apt_group(
+        result = apt_service.delete_apt_group(
             db=db, es_writer=es_writer, apt_group_id=group_id,
             indicator_service=indicator_service  # <--- Передача
         )
-        if not success:
-            raise HTTPException(status_code=404, detail="APT Group not found or failed to update linked IoCs.")
     # ... (обробка помилок)
+    except APTUnlinkStartError as unlink_exc:
+        raise HTTPException(status_code=503, detail=str(unlink_exc))
     except es_exceptions.ElasticsearchWarning as es_exc:
         raise HTTPException(status_code=503, detail=f"ES error: {str(es_exc)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete APT group: {str(e)}")
-    return None
+    if result is None:
+        raise HTTPException(status_code=404, detail="APT Group not found")
+    headers = {APT_UNLINK_TASK_HEADER: result.unlink_task_id} if result.unlink_task_id else None
+    return Response(status_code=204, headers=headers)
+
+
+@router.get("/unlink-tasks/{task_id}", response_model=schemas.APTUnlinkTaskStatus,
+            operation_id="get_apt_unlink_task_status")
+def get_apt_unlink_task_status_api(
+        task_id: str = Path(..., min_length=1), es_writer: ElasticsearchWriter = Depends(get_es_writer),
+        indicator_service: IndicatorService = Depends(IndicatorService)
+):
+    status = indicator_service.get_apt_unlink_task_status(es_writer, task_id)
+    if status is None: raise HTTPException(status_code=404, detail="Unlink task not found")
+    return status
 
 
 @router.get("/{group_id}/iocs", response_model=List[indicator_schemas.IoCResponse],
@@ -0,0 +1,77 @@
+# app/modules/apt_groups/cache.py
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core import cache_versions
+from app.database.postgres_models.threat_actor_models import APTGroup
+
+# APT-групи можуть змінюватися й іншими процесами (версія в пам'яті цього не бачить), тому кеш
+# перезавантажується не рідше ніж через цей інтервал
+APT_CACHE_MAX_AGE_SECONDS = 300
+
+
+@dataclass(frozen=True)
+class APTGroupInfo:
+    id: int
+    name: str
+    aliases: List[str] = field(default_factory=list)
+
+
+class APTGroupCache:
+    """
+    id -> (назва, аліаси) усіх APT-груп. Таблиця невелика, тож кеш завантажується цілком одним
+    запитом і перезавантажується при зміні версії APT_GROUPS (CRUD у цьому процесі) або за віком.
+    ID, яких немає в кеші (створені іншим процесом), дочитуються одним IN-запитом.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, APTGroupInfo] = {}
+        self._version = -1
+        self._loaded_at = 0.0
+        self.reloads = 0
+
+    def _is_fresh(self) -> bool:
+        return self._version == cache_versions.current(cache_versions.APT_GROUPS) \
+            and time.monotonic() - self._loaded_at < APT_CACHE_MAX_AGE_SECONDS
+
+    def _reload(self, db: Session):
+        version = cache_versions.current(cache_versions.APT_GROUPS)
+        rows = db.query(APTGroup.id, APTGroup.name, APTGroup.aliases).all()
+        by_id = {row.id: APTGroupInfo(row.id, row.name, list(row.aliases or [])) for row in rows}
+        with self._lock:
+            self._by_id = by_id
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def get_many(self, db: Session, apt_group_ids: Iterable[int]) -> Dict[int, APTGroupInfo]:
+        ids = set(apt_group_ids)
+        if not ids: return {}
+        if not self._is_fresh():
+            self._reload(db)
+        with self._lock:
+            found = {apt_id: self._by_id[apt_id] for apt_id in ids if apt_id in self._by_id}
+        missing = ids - found.keys()
+        if missing:
+            rows = db.query(APTGroup.id, APTGroup.name, APTGroup.aliases).filter(APTGroup.id.in_(missing)).all()
+            with self._lock:
+                for row in rows:
+                    info = APTGroupInfo(row.id, row.name, list(row.aliases or []))
+                    self._by_id[row.id] = info
+                    found[row.id] = info
+        return found
+
+    def get(self, db: Session, apt_group_id: int) -> Optional[APTGroupInfo]:
+        return self.get_many(db, [apt_group_id]).get(apt_group_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached_groups": len(self._by_id), "reloads": self.reloads}
+
+
+apt_group_cache = APTGroupCache()
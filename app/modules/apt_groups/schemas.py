@@ -37,4 +37,20 @@ class APTGroupResponse(APTGroupBase):
     id: int
     created_at: datetime
     updated_at: datetime
-    class Config: from_attributes = True; use_enum_values = True
\ No newline at end of file
+    class Config: from_attributes = True; use_enum_values = True
+
+
+# --- Видалення APT: відв'язування від IoC іде фоновою задачею Elasticsearch ---
+class APTGroupDeleteResponse(BaseModel):
+    apt_group_id: int
+    unlink_task_id: Optional[str] = Field(None, description="ID задачі ES для GET /apt-groups/unlink-tasks/{task_id}")
+
+class APTUnlinkTaskStatus(BaseModel):
+    task_id: str
+    completed: bool
+    total: int = 0
+    updated: int = 0
+    noops: int = 0
+    version_conflicts: int = 0
+    failures: int = 0
+    error: Optional[str] = None
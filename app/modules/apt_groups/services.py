@@ -2,8 +2,10 @@
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any, TYPE_CHECKING  # Додано TYPE_CHECKING
 
+from app.core import cache_versions
 from app.database.postgres_models.threat_actor_models import APTGroup
 from . import schemas as apt_schemas
+from .cache import apt_group_cache
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter  # Потрібен для delete_apt_group
 from elasticsearch import Elasticsearch, exceptions as es_exceptions  # Потрібен для delete_apt_group
 from datetime import datetime, timezone  # Для painless скрипта в delete_apt_group
@@ -15,6 +17,10 @@ if TYPE_CHECKING:
     from app.modules.indicators import schemas as indicator_schemas
 
 
+class APTUnlinkStartError(RuntimeError):
+    """Не вдалося запустити відв'язування APT від IoC; група в такому разі не видаляється."""
+
+
 class APTGroupService:
     # ... (create_apt_group, get_apt_group_by_id, get_apt_group_by_name,
     #      get_all_apt_groups, update_apt_group - без змін, вони не викликають інші сервіси) ...
@@ -33,11 +39,16 @@ class APTGroupService:
         db.add(db_apt_group);
         db.commit();
         db.refresh(db_apt_group);
+        cache_versions.bump(cache_versions.APT_GROUPS)
         return db_apt_group
 
     def get_apt_group_by_id(self, db: Session, apt_group_id: int) -> Optional[APTGroup]:
         return db.query(APTGroup).filter(APTGroup.id == apt_group_id).first()
 
+    def get_apt_group_names_by_ids(self, db: Session, apt_group_ids: List[int]) -> Dict[int, str]:
+        """Назви APT для пакета ID з кешу (без запиту на кожен ID); відсутні в БД ID не повертаються."""
+        return {apt_id: info.name for apt_id, info in apt_group_cache.get_many(db, apt_group_ids).items()}
+
     def get_apt_group_by_name(self, db: Session, name: str) -> Optional[APTGroup]:
         return db.query(APTGroup).filter(APTGroup.name == name).first()
 
@@ -59,6 +70,7 @@ class APTGroupService:
         db.add(db_apt_group);
         db.commit();
         db.refresh(db_apt_group);
+        cache_versions.bump(cache_versions.APT_GROUPS)
         return db_apt_group
 
     def _ensure_apt_groups_exist_from_data(self, db: Session, apt_data_list: List[Dict[str, Any]]) -> Dict[str, int]:
@@ -100,30 +112,28 @@ class APTGroupService:
                          es_writer: ElasticsearchWriter,
                          apt_group_id: int,
                          indicator_service: 'IndicatorService'  # <--- ІН'ЄКЦІЯ СЕРВІСУ
-                         ) -> bool:
+                         ) -> Optional[apt_schemas.APTGroupDeleteResponse]:
         db_apt_group = self.get_apt_group_by_id(db, apt_group_id)
         if not db_apt_group:
             print(f"APT Group ID {apt_group_id} not found in PostgreSQL.")
-            return False
+            return None
 
-        # 1. Використовуємо IndicatorService для оновлення IoC в Elasticsearch
+        # 1. Запускаємо фонове відв'язування APT від IoC в Elasticsearch (не чекаємо на завершення).
+        # Без нього IoC назавжди посилалися б на видалену групу, тож без ES групу не видаляємо
+        if not es_writer or not es_writer.es_client:
+            raise APTUnlinkStartError("Elasticsearch is not available to unlink IoCs from the APT group.")
         try:
-            print(f"Attempting to remove APT ID {apt_group_id} from linked IoCs in Elasticsearch...")
-            # Викликаємо метод з IndicatorService
-            success_es_update = indicator_service.remove_apt_id_from_all_iocs(es_writer, apt_group_id)
-            if not success_es_update:
-                print(
-                    f"Warning: Failed to fully remove APT ID {apt_group_id} from all linked IoCs in Elasticsearch. Proceeding with PG delete.")
+            unlink_task_id = indicator_service.start_apt_unlink_task(es_writer, apt_group_id)
         except Exception as e:
-            print(f"Error updating IoCs in ES during APT group {apt_group_id} deletion: {e}")
-            # Вирішити, чи продовжувати видалення з PostgreSQL
-            # return False # Можна зупинити тут, якщо оновлення ES критичне
+            print(f"Error starting IoC unlink task during APT group {apt_group_id} deletion: {e}. Group is kept.")
+            raise APTUnlinkStartError(f"Failed to start unlinking IoCs from the APT group: {e}") from e
 
         # 2. Видалити саме APT-угруповання з PostgreSQL
         db.delete(db_apt_group)
         db.commit()
+        cache_versions.bump(cache_versions.APT_GROUPS)
         print(f"APT Group '{db_apt_group.name}' (ID: {apt_group_id}) deleted from PostgreSQL.")
-        return True
+        return apt_schemas.APTGroupDeleteResponse(apt_group_id=apt_group_id, unlink_task_id=unlink_task_id)
 
     def get_iocs_for_apt_group(self,
                                es_writer: ElasticsearchWriter,
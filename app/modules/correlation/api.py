@@ -1,13 +1,20 @@
 # app/modules/correlation/api.py
-from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Any
 
+from app.core import cache_versions
+from app.core.response_cache import etag_cache
 from app.core.database import get_db
+from app.core.export import ExportFormatEnum, export_response
+from app.core.pagination import NEXT_CURSOR_HEADER, InvalidCursorError
 from . import schemas
 from .schemas import OffenceResponse
 from .services import CorrelationService
+from .engine.circuit_breaker import rule_circuit_breakers
+from .engine.rule_cache import compiled_rule_cache
+from .engine.stream import streaming_correlation_engine
 # Для запуску циклу кореляції може знадобитися доступ до інших сервісів
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
 from app.modules.indicators.services import IndicatorService
@@ -35,7 +42,8 @@ def create_correlation_rule_api(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/rules/", response_model=List[schemas.CorrelationRuleResponse])
+@router.get("/rules/", response_model=List[schemas.CorrelationRuleResponse],
+            dependencies=[etag_cache(cache_versions.CORRELATION_RULES)])
 def read_all_correlation_rules_api(
         skip: int = Query(0, ge=0), limit: int = Query(100, ge=1), only_enabled: bool = Query(False),
         db: Session = Depends(get_db), service: CorrelationService = Depends(CorrelationService)
@@ -43,7 +51,8 @@ def read_all_correlation_rules_api(
     return service.get_all_correlation_rules(db=db, skip=skip, limit=limit, only_enabled=only_enabled)
 
 
-@router.get("/rules/{rule_id}", response_model=schemas.CorrelationRuleResponse)
+@router.get("/rules/{rule_id}", response_model=schemas.CorrelationRuleResponse,
+            dependencies=[etag_cache(cache_versions.CORRELATION_RULES)])
 def read_correlation_rule_api(
         rule_id: int = Path(..., ge=1), db: Session = Depends(get_db),
         service: CorrelationService = Depends(CorrelationService)
@@ -63,6 +72,27 @@ def update_correlation_rule_api(
     return rule
 
 
+@router.post("/rules/{rule_id}/backtest", response_model=schemas.RuleBacktestResponse,
+             summary="Replay a rule over a historical time range without creating offences or running responses")
+def backtest_correlation_rule_api(
+        rule_id: int = Path(..., ge=1), backtest_request: schemas.RuleBacktestRequest = Body(...),
+        db: Session = Depends(get_db),
+        es_writer: ElasticsearchWriter = Depends(get_es_writer),
+        service: CorrelationService = Depends(CorrelationService)
+):
+    rule = service.get_correlation_rule_by_id(db=db, rule_id=rule_id)
+    if not rule: raise HTTPException(status_code=404, detail="Correlation rule not found")
+    try:
+        return service.backtest_correlation_rule(
+            es_client=es_writer.es_client, rule=rule,
+            time_from=backtest_request.time_from, time_to=backtest_request.time_to,
+            max_offences=backtest_request.max_offences, slices=backtest_request.slices)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during backtest: {str(e)}")
+
+
 @router.delete("/rules/{rule_id}", status_code=204)
 def delete_correlation_rule_api(
         rule_id: int = Path(..., ge=1), db: Session = Depends(get_db),
@@ -76,10 +106,36 @@ def delete_correlation_rule_api(
 # --- CRUD для Offence ---
 @router.get("/offences/", response_model=List[schemas.OffenceResponse])
 def read_all_offences_api(
+        response: Response,
         skip: int = Query(0, ge=0), limit: int = Query(100, ge=1),
+        cursor: Optional[str] = Query(None, description=f"Opaque cursor from the {NEXT_CURSOR_HEADER} header of the previous page"),
+        severity: Optional[schemas.OffenceSeverityEnum] = Query(None),
+        status: Optional[schemas.OffenceStatusEnum] = Query(None),
         db: Session = Depends(get_db), service: CorrelationService = Depends(CorrelationService)
 ):
-    return service.get_all_offences(db=db, skip=skip, limit=limit)
+    """Без skip сторінки віддаються за курсором (keyset); курсор наступної сторінки — в заголовку X-Next-Cursor."""
+    if skip and not cursor:
+        return service.get_all_offences(db=db, skip=skip, limit=limit, severity=severity, status=status)
+    try:
+        offences, next_cursor = service.get_offences_page(db=db, limit=limit, cursor=cursor, severity=severity,
+                                                          status=status)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor: response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return offences
+
+
+@router.get("/offences/export")
+def export_offences_api(
+        format: ExportFormatEnum = Query(ExportFormatEnum.NDJSON),
+        severity: Optional[schemas.OffenceSeverityEnum] = Query(None),
+        status: Optional[schemas.OffenceStatusEnum] = Query(None),
+        service: CorrelationService = Depends(CorrelationService)
+):
+    """Потоковий експорт офенсів під фільтром (NDJSON або CSV) через серверний курсор Postgres."""
+    offences = service.iter_offences_for_export(severity=severity, status=status)
+    return export_response((offence.model_dump(mode="json") for offence in offences), format,
+                           list(schemas.OffenceResponse.model_fields), "offences")
 
 
 @router.get("/offences/{offence_id}", response_model=schemas.OffenceResponse)
@@ -125,6 +181,7 @@ def update_offence_status_api(  # Назва ендпоінту може бут
 # --- Ендпоінт для запуску циклу кореляції (для тестування) ---
 @router.post("/run-cycle/",
              summary="Manually trigger a correlation cycle",
+             response_model=schemas.CorrelationCycleReport,
              operation_id="correlation_trigger_run_cycle")  # Змінено operation_id для унікальності
 def run_correlation_cycle_api(
         db: Session = Depends(get_db),
@@ -135,14 +192,13 @@ def run_correlation_cycle_api(
         response_service: ResponseService = Depends(ResponseService)  # <--- ІН'ЄКЦІЯ ResponseService
 ):
     try:
-        correlation_service.run_correlation_cycle(
+        return correlation_service.run_correlation_cycle(
             db=db,
             es_writer=es_writer,
             indicator_service=indicator_service,
             device_service=device_service,  # <--- Передаємо device_service
             response_service=response_service  # <--- Передаємо response_service
         )
-        return {"message": "Correlation cycle triggered successfully and ran."}  # Змінено повідомлення
     except Exception as e:
         # TODO: Log error
         # import traceback # Для детального логування під час розробки
@@ -150,10 +206,31 @@ def run_correlation_cycle_api(
         raise HTTPException(status_code=500, detail=f"Error during correlation cycle: {str(e)}")
 
 
+@router.get("/stream/stats",
+            summary="Streaming correlation state: rule counts, state sizes and eviction counters",
+            response_model=Dict[str, Any])
+def get_streaming_correlation_stats_api():
+    return streaming_correlation_engine.stats()
+
+
+@router.get("/rule-cache/stats",
+            summary="Compiled rule cache: cached rules and how often rules/IoC sets were recompiled",
+            response_model=Dict[str, Any])
+def get_rule_cache_stats_api():
+    return compiled_rule_cache.stats()
+
+
+@router.get("/circuit-breakers",
+            summary="Rules and IoC rule groups with recent consecutive failures",
+            response_model=Dict[str, Any])
+def get_circuit_breakers_api():
+    return rule_circuit_breakers.snapshot()
+
+
 @router.get("/dashboard/offences/summary_by_severity",
             response_model=Dict[str, int],  # Повертаємо словник {"low": X, "medium": Y ...}
             summary="Get offence counts grouped by severity for a given period",
-            operation_id="dashboard_get_offence_summary_severity")
+            operation_id="dashboard_get_offence_summary_severity", dependencies=[etag_cache(cache_versions.OFFENCES)])
 def get_offence_summary_by_severity_api(
         days_back: int = Query(7, ge=1, le=365, description="Number of past days to include (e.g., 7 for last week)"),
         db: Session = Depends(get_db),
@@ -164,10 +241,23 @@ def get_offence_summary_by_severity_api(
     return raw_summary
 
 
+@router.get("/dashboard/offences/breakdown",
+            response_model=Dict[str, int],
+            summary="Get offence counts for a period grouped by severity, rule, APT or IoC type",
+            operation_id="dashboard_get_offence_breakdown", dependencies=[etag_cache(cache_versions.OFFENCES)])
+def get_offence_breakdown_api(
+        dimension: schemas.OffenceRollupDimensionEnum = Query(...),
+        days_back: int = Query(7, ge=1, le=365),
+        db: Session = Depends(get_db),
+        service: CorrelationService = Depends(CorrelationService)
+):
+    return service.get_offence_breakdown(db=db, dimension=dimension, days_back=days_back)
+
+
 @router.get("/dashboard/offences/recent",
             response_model=List[OffenceResponse],  # Використовуємо існуючу схему
             summary="Get a list of recent offences",
-            operation_id="dashboard_get_recent_offences")
+            operation_id="dashboard_get_recent_offences", dependencies=[etag_cache(cache_versions.OFFENCES)])
 def get_recent_offences_api(
         limit: int = Query(10, ge=1, le=50, description="Number of recent offences to return"),
         db: Session = Depends(get_db),
@@ -185,7 +275,7 @@ class TopIoCTrigger(BaseModel):
 @router.get("/dashboard/offences/top_triggered_iocs",
             response_model=List[TopIoCTrigger],
             summary="Get top IoCs that triggered correlation rules",
-            operation_id="dashboard_get_top_triggered_iocs")
+            operation_id="dashboard_get_top_triggered_iocs", dependencies=[etag_cache(cache_versions.OFFENCES)])
 def get_top_triggered_iocs_api(
         limit: int = Query(10, ge=1, le=50),
         days_back: int = Query(7, ge=1, le=365),
@@ -204,7 +294,8 @@ class AptOffenceSummary(BaseModel):
 @router.get("/dashboard/offences/by_apt",
             response_model=List[AptOffenceSummary],
             summary="Get offence counts grouped by attributed APT",
-            operation_id="dashboard_get_offences_by_apt")
+            operation_id="dashboard_get_offences_by_apt",
+            dependencies=[etag_cache(cache_versions.OFFENCES, cache_versions.APT_GROUPS)])
 def get_offences_by_apt_api(
         days_back: int = Query(7, ge=1, le=365),
         db: Session = Depends(get_db),
@@ -0,0 +1,243 @@
+# app/modules/correlation/engine/anomaly_baseline.py
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, Hashable
+
+from app.database.postgres_models.correlation_models import CorrelationRule
+from app.modules.correlation.schemas import EventFieldToMatchTypeEnum
+
+DEFAULT_ANOMALY_SIGMA = 3.0
+DEFAULT_ANOMALY_ALPHA = 0.1
+DEFAULT_ANOMALY_MIN_SAMPLES = 12
+DEFAULT_ANOMALY_KEY_FIELDS = [EventFieldToMatchTypeEnum.SOURCE_IP.value, EventFieldToMatchTypeEnum.DESTINATION_AS.value]
+BASELINE_KEY_SEPARATOR = "|"
+# Нижня межа σ відносно середнього: для «пласкої» історії будь-який зайвий байт інакше давав би нескінченний z
+MIN_RELATIVE_STDDEV = 0.05
+
+
+def _is_private_ip(value: Any) -> Optional[bool]:
+    try:
+        return ipaddress.ip_address(str(value)).is_private
+    except ValueError:
+        return None
+
+
+def is_outbound_flow(event: Dict[str, Any]) -> bool:
+    """Вихідний потік: приватна адреса джерела → публічна адреса призначення."""
+    return _is_private_ip(event.get("source_ip")) is True and _is_private_ip(event.get("destination_ip")) is False
+
+
+@dataclass
+class EwmaBaseline:
+    """Експоненційно зважені середнє та дисперсія (інкрементальна форма Welford/West)."""
+    mean: float = 0.0
+    variance: float = 0.0
+    samples: int = 0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def update(self, value: float, alpha: float):
+        if self.samples == 0:
+            self.mean = value
+            self.variance = 0.0
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self.samples += 1
+
+    def z_score(self, value: float) -> float:
+        effective_stddev = max(self.stddev, abs(self.mean) * MIN_RELATIVE_STDDEV, 1.0)
+        return (value - self.mean) / effective_stddev
+
+
+@dataclass
+class KeyAccumulator:
+    slot_epoch: int
+    total_bytes: float = 0.0
+    flows: int = 0
+
+
+@dataclass
+class AnomalyMatch:
+    rule: CorrelationRule
+    key: Dict[str, Any]
+    observed_bytes: float
+    flows: int
+    baseline_mean: float
+    baseline_stddev: float
+    z_score: float
+
+
+@dataclass
+class CompiledAnomalyRule:
+    rule: CorrelationRule
+    key_fields: List[str]
+    slot_seconds: int
+    sigma: float
+    alpha: float
+    min_samples: int
+
+    @classmethod
+    def from_rule(cls, rule: CorrelationRule) -> "CompiledAnomalyRule":
+        if not rule.threshold_time_window_minutes:
+            raise ValueError(f"Rule '{rule.name}': ANOMALY_NETFLOW_VOLUME requires 'threshold_time_window_minutes'.")
+        key_fields = [f.value for f in rule.aggregation_fields] if rule.aggregation_fields \
+            else list(DEFAULT_ANOMALY_KEY_FIELDS)
+        return cls(rule=rule, key_fields=key_fields, slot_seconds=rule.threshold_time_window_minutes * 60,
+                   sigma=rule.anomaly_sigma or DEFAULT_ANOMALY_SIGMA,
+                   alpha=rule.anomaly_alpha or DEFAULT_ANOMALY_ALPHA,
+                   min_samples=rule.anomaly_min_samples or DEFAULT_ANOMALY_MIN_SAMPLES)
+
+    @property
+    def state_params(self) -> Tuple[Tuple[str, ...], int]:
+        """Параметри, від яких залежить зміст базових ліній: поля ключа і довжина інтервалу."""
+        return tuple(self.key_fields), self.slot_seconds
+
+    def event_key(self, event: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+        values = tuple(event.get(f) for f in self.key_fields)
+        return None if any(v is None for v in values) else values
+
+
+def baseline_key_str(key_values: Tuple[Any, ...]) -> str:
+    return BASELINE_KEY_SEPARATOR.join(str(v) for v in key_values)
+
+
+class AnomalyDetector:
+    """
+    Для кожного (правило, ключ) сумує вихідні байти за інтервал правила; коли інтервал закривається,
+    порівнює суму з EWMA-базовою лінією ключа і оновлює її. Аномальні інтервали базову лінію не змінюють,
+    щоб тривала ексфільтрація не «навчила» модель вважати себе нормою.
+    Інтервали без трафіку не враховуються: базова лінія описує активні інтервали хоста.
+    Час — настінний (time.time()), бо базові лінії переживають перезапуск.
+    """
+
+    def __init__(self, max_keys: int = 200_000):
+        self.max_keys = max_keys
+        self.rules: Dict[int, CompiledAnomalyRule] = {}
+        self.baselines: "OrderedDict[Hashable, EwmaBaseline]" = OrderedDict()
+        self.accumulators: Dict[Hashable, KeyAccumulator] = {}
+        self.dirty_keys: set = set()
+        self.evicted_capacity = 0
+
+    def set_rules(self, rules: List[CorrelationRule]) -> Tuple[List[int], List[int]]:
+        """
+        Оновлює набір правил. Повертає ID нових правил, для яких треба завантажити чекпоінти, і ID правил,
+        у яких змінилися поля ключа чи довжина інтервалу: їхній стан скинуто, чекпоінти треба видалити.
+        """
+        compiled: Dict[int, CompiledAnomalyRule] = {}
+        for rule in rules:
+            try:
+                compiled[rule.id] = CompiledAnomalyRule.from_rule(rule)
+            except ValueError as ve:
+                print(f"AnomalyDetector: {ve}")
+        removed_rule_ids = set(self.rules) - set(compiled)
+        reset_rule_ids = [rule_id for rule_id, new in compiled.items()
+                          if rule_id in self.rules and new.state_params != self.rules[rule_id].state_params]
+        dropped_rule_ids = removed_rule_ids | set(reset_rule_ids)
+        if dropped_rule_ids:
+            for store in (self.baselines, self.accumulators):
+                for k in [k for k in store if k[0] in dropped_rule_ids]:
+                    del store[k]
+            self.dirty_keys = {k for k in self.dirty_keys if k[0] not in dropped_rule_ids}
+        new_rule_ids = [rule_id for rule_id in compiled if rule_id not in self.rules]
+        self.rules = compiled
+        return new_rule_ids, reset_rule_ids
+
+    def load_baselines(self, rows: List[Tuple[int, str, float, float, int]]):
+        for rule_id, key_str, mean, variance, samples in rows:
+            key = (rule_id, tuple(key_str.split(BASELINE_KEY_SEPARATOR)))
+            if key not in self.baselines:
+                self.baselines[key] = EwmaBaseline(mean=mean, variance=variance, samples=samples)
+        self._enforce_capacity()
+
+    def process_event(self, event: Dict[str, Any], now: Optional[float] = None) -> List[AnomalyMatch]:
+        if not self.rules or event.get("network_bytes_total") is None or not is_outbound_flow(event):
+            return []
+        now = time.time() if now is None else now
+        try:
+            flow_bytes = float(event["network_bytes_total"])
+        except (TypeError, ValueError):
+            return []
+        matches: List[AnomalyMatch] = []
+        for rule_id, compiled in self.rules.items():
+            key_values = compiled.event_key(event)
+            if key_values is None:
+                continue
+            # Ключі нормалізуються до рядків, щоб збігатися з ключами, відновленими з чекпоінту
+            key = (rule_id, tuple(str(v) for v in key_values))
+            epoch = int(now // compiled.slot_seconds)
+            accumulator = self.accumulators.get(key)
+            if accumulator is not None and accumulator.slot_epoch != epoch:
+                match = self._close_slot(compiled, key, accumulator)
+                if match:
+                    matches.append(match)
+                accumulator = None
+            if accumulator is None:
+                accumulator = self.accumulators[key] = KeyAccumulator(slot_epoch=epoch)
+            accumulator.total_bytes += flow_bytes
+            accumulator.flows += 1
+        return matches
+
+    def close_elapsed_slots(self, now: Optional[float] = None) -> List[AnomalyMatch]:
+        """Закриває інтервали, що вже минули, навіть якщо нових потоків для ключа не надходило."""
+        now = time.time() if now is None else now
+        matches: List[AnomalyMatch] = []
+        for key, accumulator in list(self.accumulators.items()):
+            compiled = self.rules.get(key[0])
+            if compiled is None:
+                del self.accumulators[key]
+                continue
+            if accumulator.slot_epoch < int(now // compiled.slot_seconds):
+                del self.accumulators[key]
+                match = self._close_slot(compiled, key, accumulator)
+                if match:
+                    matches.append(match)
+        return matches
+
+    def _close_slot(self, compiled: CompiledAnomalyRule, key: Hashable,
+                    accumulator: KeyAccumulator) -> Optional[AnomalyMatch]:
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            baseline = self.baselines[key] = EwmaBaseline()
+            self._enforce_capacity()
+        else:
+            self.baselines.move_to_end(key)
+        observed = accumulator.total_bytes
+        match = None
+        if baseline.samples >= compiled.min_samples:
+            z_score = baseline.z_score(observed)
+            if z_score >= compiled.sigma:
+                match = AnomalyMatch(rule=compiled.rule, key=dict(zip(compiled.key_fields, key[1])),
+                                     observed_bytes=observed, flows=accumulator.flows,
+                                     baseline_mean=baseline.mean, baseline_stddev=baseline.stddev,
+                                     z_score=z_score)
+        if match is None:
+            baseline.update(observed, compiled.alpha)
+            self.dirty_keys.add(key)
+        return match
+
+    def _enforce_capacity(self):
+        while len(self.baselines) > self.max_keys:
+            evicted_key, _ = self.baselines.popitem(last=False)
+            self.dirty_keys.discard(evicted_key)
+            self.evicted_capacity += 1
+
+    def pop_dirty_baselines(self) -> List[Tuple[int, str, float, float, int]]:
+        rows = []
+        for key in self.dirty_keys:
+            baseline = self.baselines.get(key)
+            if baseline is not None:
+                rows.append((key[0], baseline_key_str(key[1]), baseline.mean, baseline.variance, baseline.samples))
+        self.dirty_keys = set()
+        return rows
+
+    def stats(self) -> Dict[str, int]:
+        return {"baselines": len(self.baselines), "open_slots": len(self.accumulators),
+                "dirty": len(self.dirty_keys), "evicted_capacity": self.evicted_capacity}
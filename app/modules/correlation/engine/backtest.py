@@ -0,0 +1,113 @@
+# app/modules/correlation/engine/backtest.py
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+from elasticsearch import Elasticsearch
+
+BACKTEST_PAGE_SIZE = 1000
+BACKTEST_MAX_EVENTS = 500_000
+BACKTEST_MAX_WINDOWS = 5000
+PIT_KEEP_ALIVE = "2m"
+
+
+def event_epoch_seconds(event: Dict[str, Any]) -> float:
+    timestamp = event.get("timestamp")
+    if not timestamp:
+        return 0.0
+    try:
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def time_range_filter(time_from: datetime, time_to: datetime) -> Dict[str, Any]:
+    return {"range": {"timestamp": {"gte": time_from.isoformat(), "lt": time_to.isoformat()}}}
+
+
+def iter_time_windows(time_from: datetime, time_to: datetime,
+                      window_minutes: int) -> Iterator[Tuple[datetime, datetime]]:
+    """Розбиває діапазон на послідовні (tumbling) вікна правила; останнє вікно може бути коротшим."""
+    step = timedelta(minutes=window_minutes)
+    if (time_to - time_from) / step > BACKTEST_MAX_WINDOWS:
+        raise ValueError(f"Backtest range spans more than {BACKTEST_MAX_WINDOWS} rule windows; narrow the range.")
+    window_start = time_from
+    while window_start < time_to:
+        window_end = min(window_start + step, time_to)
+        yield window_start, window_end
+        window_start = window_end
+
+
+def _iter_slice(es_client: Elasticsearch, executor: ThreadPoolExecutor, pit_id: str, query: Dict[str, Any],
+                slice_id: int, slices: int) -> Iterator[Dict[str, Any]]:
+    """
+    Події одного слайсу PIT за часом, сторінками через search_after. Наступна сторінка запитується у пулі,
+    поки віддається поточна, тож слайси читаються паралельно, а в пам'яті — не більше двох сторінок на слайс.
+    """
+    body: Dict[str, Any] = {
+        "size": BACKTEST_PAGE_SIZE,
+        "query": query,
+        "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+        "sort": [{"timestamp": "asc"}, {"_shard_doc": "asc"}],
+        "track_total_hits": False,
+    }
+    if slices > 1:
+        body["slice"] = {"id": slice_id, "max": slices}
+    pending = executor.submit(es_client.search, body=dict(body))
+    while pending is not None:
+        hits = pending.result().get('hits', {}).get('hits', [])
+        pending = None
+        if len(hits) == BACKTEST_PAGE_SIZE:
+            pending = executor.submit(es_client.search, body={**body, "search_after": hits[-1]["sort"]})
+        for hit in hits:
+            yield hit.get('_source', {})
+
+
+class TimeOrderedEventScan:
+    """
+    Сканує історичні події через PIT, паралельно по слайсах, і ліниво зливає слайси в єдиний потік за часом,
+    щоб автомати (послідовності, ковзні вікна, базові лінії) бачили події в тому ж порядку, що й наживо.
+    Ліміт max_events застосовується до злитого потоку: обрізане сканування покриває всі слайси до одного
+    моменту часу (події з тією ж міткою, що й остання, ще віддаються, але не більше сторінки понад ліміт),
+    а не рівні частки кожного слайсу.
+    Після ітерації events_scanned і truncated описують результат.
+    """
+
+    def __init__(self, es_client: Elasticsearch, indices: Tuple[str, ...], query: Dict[str, Any],
+                 slices: int = 4, max_events: int = BACKTEST_MAX_EVENTS):
+        self.es_client = es_client
+        self.indices = indices
+        self.query = query
+        self.slices = max(1, slices)
+        self.max_events = max_events
+        self.events_scanned = 0
+        self.truncated = False
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        pit_id = self.es_client.open_point_in_time(index=list(self.indices), keep_alive=PIT_KEEP_ALIVE)["id"]
+        try:
+            with ThreadPoolExecutor(max_workers=self.slices) as executor:
+                merged = heapq.merge(*(_iter_slice(self.es_client, executor, pit_id, self.query, slice_id,
+                                                   self.slices) for slice_id in range(self.slices)),
+                                     key=event_epoch_seconds)
+                last_epoch: Optional[float] = None
+                for event in merged:
+                    epoch = event_epoch_seconds(event)
+                    if self.events_scanned >= self.max_events and (
+                            epoch != last_epoch or self.events_scanned >= self.max_events + BACKTEST_PAGE_SIZE):
+                        self.truncated = True
+                        return
+                    self.events_scanned += 1
+                    last_epoch = epoch
+                    yield event
+        finally:
+            try:
+                self.es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(f"Backtest: Failed to close point in time: {e}")
+
+
+def build_event_query(time_from: datetime, time_to: datetime,
+                      extra_filters: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return {"bool": {"filter": [time_range_filter(time_from, time_to)] + (extra_filters or [])}}
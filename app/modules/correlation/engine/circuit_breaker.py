@@ -0,0 +1,56 @@
+# app/modules/correlation/engine/circuit_breaker.py
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any
+
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT_SECONDS = 300.0
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Після failure_threshold помилок поспіль правило пропускається reset_timeout секунд,
+    потім виконується одна пробна спроба (half-open): успіх закриває ланцюг, помилка — знову відкриває.
+    """
+    failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD
+    reset_timeout: float = CIRCUIT_RESET_TIMEOUT_SECONDS
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.consecutive_failures < self.failure_threshold:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class CircuitBreakerRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[Any, CircuitBreaker] = {}
+
+    def get(self, key: Any) -> CircuitBreaker:
+        with self._lock:
+            return self._breakers.setdefault(key, CircuitBreaker())
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {str(k): {"state": b.state, "consecutive_failures": b.consecutive_failures}
+                    for k, b in self._breakers.items() if b.consecutive_failures}
+
+
+rule_circuit_breakers = CircuitBreakerRegistry()
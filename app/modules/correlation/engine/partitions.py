@@ -0,0 +1,111 @@
+# app/modules/correlation/engine/partitions.py
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import cache_versions
+from app.core.database import SessionLocal
+from app.modules.correlation.rollups import delete_rollups_before
+from .sharding import advisory_task_lock
+
+# Таблиця offences розбита на місячні секції за detected_at (міграція f4a9c3e7b182). Секції створюються
+# наперед на стільки місяців; запис поза наявними секціями потрапляє в offences_default
+OFFENCE_PARTITION_MONTHS_AHEAD = 3
+OFFENCE_PARTITION_MAINTENANCE_INTERVAL_SECONDS = 3600
+_PARTITION_NAME_RE = re.compile(r"^offences_p(\d{4})(\d{2})$")
+
+
+def _add_months(month_start: date, months: int) -> date:
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def offence_partition_name(month_start: date) -> str:
+    return f"offences_p{month_start:%Y%m}"
+
+
+def _utc_bound(month_start: date) -> str:
+    # detected_at — timestamptz: межа без зсуву трактувалася б у TimeZone сесії, а не в UTC
+    return f"{month_start:%Y-%m-%d} 00:00:00+00"
+
+
+def ensure_offence_partitions(db: Session, months_ahead: int = OFFENCE_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Створює секції поточного й наступних months_ahead місяців, яких ще немає. Повертає створені."""
+    today = datetime.now(timezone.utc).date()
+    current_month = date(today.year, today.month, 1)
+    existing = set(_list_offence_partitions(db))
+    created: List[str] = []
+    for offset in range(months_ahead + 1):
+        month_start = _add_months(current_month, offset)
+        name = offence_partition_name(month_start)
+        if name in existing:
+            continue
+        try:
+            db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF offences "
+                f"FOR VALUES FROM ('{_utc_bound(month_start)}') TO ('{_utc_bound(_add_months(month_start, 1))}')"))
+            db.commit()
+            created.append(name)
+        except Exception as e:
+            # Найчастіше — у offences_default уже є рядки цього місяця; їх треба перенести вручну
+            db.rollback()
+            print(f"OffencePartitions: Failed to create partition {name}: {e}")
+    return created
+
+
+def drop_expired_offence_partitions(db: Session, retention_months: int) -> List[str]:
+    """
+    Від'єднує й видаляє секції, що цілком старші за retention_months повних місяців (0 — зберігати все).
+    Видалення секції — це DROP TABLE, а не DELETE рядків: без роздування таблиці й VACUUM. Лічильники
+    offence_rollups до тієї ж межі видаляються теж, інакше дашборди рахували б уже видалені офенси.
+    """
+    if retention_months <= 0:
+        return []
+    today = datetime.now(timezone.utc).date()
+    cutoff_month = _add_months(date(today.year, today.month, 1), -retention_months)
+    dropped: List[str] = []
+    for name, month_start in _list_offence_partitions(db).items():
+        if _add_months(month_start, 1) > cutoff_month:
+            continue
+        db.execute(text(f"ALTER TABLE offences DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        dropped.append(name)
+    cutoff = datetime(cutoff_month.year, cutoff_month.month, 1, tzinfo=timezone.utc)
+    deleted_rollups = delete_rollups_before(db, cutoff)
+    db.commit()
+    if dropped or deleted_rollups:
+        cache_versions.bump(cache_versions.OFFENCES)
+    return dropped
+
+
+def _list_offence_partitions(db: Session) -> Dict[str, date]:
+    rows = db.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'offences'")).all()
+    partitions: Dict[str, date] = {}
+    for row in rows:
+        match = _PARTITION_NAME_RE.match(row.relname)
+        if match:
+            partitions[row.relname] = date(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+def maintain_offence_partitions(retention_months: int):
+    """Секції наперед і прибирання прострочених; advisory lock не дає реплікам робити це одночасно."""
+    with advisory_task_lock("offence_partition_maintenance") as acquired:
+        if not acquired:
+            return
+        db = SessionLocal()
+        try:
+            created = ensure_offence_partitions(db)
+            dropped = drop_expired_offence_partitions(db, retention_months)
+            if created or dropped:
+                print(f"OffencePartitions: Created {created}, dropped {dropped}.")
+        finally:
+            db.close()
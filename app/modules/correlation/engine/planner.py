@@ -0,0 +1,137 @@
+# app/modules/correlation/engine/planner.py
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+from app.database.postgres_models.correlation_models import CorrelationRule
+from app.modules.correlation.schemas import CorrelationRuleTypeEnum
+
+# Мапінг event_source_type правила на шаблони індексів подій
+EVENT_SOURCE_INDEX_MAP: Dict[str, str] = {
+    "netflow": "siem-netflow-events-*",
+    "flow": "siem-netflow-events-*",
+    "syslog": "siem-syslog-events-*",
+    "syslog_firewall": "siem-syslog-events-*",
+    "syslog_auth": "siem-syslog-events-*",
+    "syslog_auth_failure": "siem-syslog-events-*",
+}
+DEFAULT_EVENT_INDICES: Tuple[str, ...] = ("siem-netflow-events-*", "siem-syslog-events-*")
+
+# Події індексуються з динамічним мапінгом, тому рядкові поля мають підполе .keyword,
+# а числові можна агрегувати напряму.
+EVENT_FIELD_ES_KEYWORD_MAP: Dict[str, str] = {
+    "source_ip": "source_ip.keyword",
+    "destination_ip": "destination_ip.keyword",
+    "reporter_ip": "reporter_ip.keyword",
+    "username": "username.keyword",
+    "hostname": "hostname.keyword",
+    "message": "message.keyword",
+    "event_category": "event_category.keyword",
+    "event_type": "event_type.keyword",
+    "event_action": "event_action.keyword",
+    "event_outcome": "event_outcome.keyword",
+    "network_protocol": "network_protocol.keyword",
+    "network_bytes_total": "network_bytes_total",
+    "source_as": "source_as",
+    "destination_as": "destination_as",
+    "destination_port": "destination_port",
+    "source_port": "source_port",
+}
+
+# Скільки останніх подій на одне правило підтягуємо за цикл (як і раніше при запиті на кожне правило)
+PER_RULE_EVENT_LIMIT = 10
+MAX_IOCS_PER_GROUP = 10000
+TRIGGER_EVENT_SUMMARY_FIELDS = ['timestamp', 'reporter_ip', 'hostname', 'message', 'source_ip', 'destination_ip',
+                                'event_category', 'event_type']
+
+
+def es_keyword_field(field_name: str) -> str:
+    return EVENT_FIELD_ES_KEYWORD_MAP.get(field_name, f"{field_name}.keyword")
+
+
+def resolve_event_indices(event_source_type: Optional[List[str]]) -> Tuple[str, ...]:
+    """Повертає відсортований кортеж шаблонів індексів для типів джерел подій правила."""
+    if not event_source_type:
+        return DEFAULT_EVENT_INDICES
+    indices = {EVENT_SOURCE_INDEX_MAP[est] for est in event_source_type if est in EVENT_SOURCE_INDEX_MAP}
+    return tuple(sorted(indices)) if indices else DEFAULT_EVENT_INDICES
+
+
+@dataclass(frozen=True)
+class IoCRuleGroupKey:
+    indices: Tuple[str, ...]
+    time_window_minutes: int
+    ioc_type: str
+
+
+@dataclass
+class IoCRuleGroup:
+    """Правила IOC_MATCH_IP з однаковими індексами подій, часовим вікном і типом IoC."""
+    key: IoCRuleGroupKey
+    rules: List[CorrelationRule] = field(default_factory=list)
+
+    def build_ioc_query(self) -> Dict[str, Any]:
+        """
+        Один запит IoC на всю групу: об'єднання тегів і мінімальна впевненість серед правил.
+        Точна фільтрація під кожне правило робиться вже в пам'яті (rule_accepts_ioc).
+        """
+        filters: List[Dict[str, Any]] = [{"term": {"is_active": True}}, {"term": {"type": self.key.ioc_type}}]
+        # Якщо хоч одне правило не обмежує теги, фільтр тегів на рівні ES не застосовуємо
+        if all(rule.ioc_tags_match for rule in self.rules):
+            all_tags = sorted({tag for rule in self.rules for tag in rule.ioc_tags_match})
+            filters.append({"terms": {"tags": all_tags}})
+        min_confidences = [rule.ioc_min_confidence for rule in self.rules]
+        if all(conf is not None for conf in min_confidences):
+            filters.append({"range": {"confidence": {"gte": min(min_confidences)}}})
+        return {"query": {"bool": {"filter": filters}}, "size": MAX_IOCS_PER_GROUP}
+
+    def build_event_query(self, values_by_field: Dict[str, List[str]]) -> Optional[Dict[str, Any]]:
+        """
+        Один агрегований запит подій на групу: для кожного поля, що перевіряється, terms-агрегація
+        по значеннях IoC з top_hits останніх подій. Повертає None, якщо перевіряти нічого.
+        """
+        values_by_field = {f: v for f, v in values_by_field.items() if v}
+        if not values_by_field:
+            return None
+        should_filters = [{"terms": {es_keyword_field(f): values}} for f, values in values_by_field.items()]
+        aggs = {}
+        for field_name, values in values_by_field.items():
+            aggs[f"by_{field_name}"] = {
+                "terms": {"field": es_keyword_field(field_name), "include": values, "size": len(values)},
+                "aggs": {"latest_events": {"top_hits": {
+                    "size": PER_RULE_EVENT_LIMIT,
+                    "sort": [{"timestamp": "desc"}]
+                }}}
+            }
+        return {
+            "size": 0,
+            "query": {"bool": {
+                "filter": [{"range": {"timestamp": {"gte": f"now-{self.key.time_window_minutes}m", "lte": "now"}}}],
+                "should": should_filters,
+                "minimum_should_match": 1
+            }},
+            "aggs": aggs
+        }
+
+
+def rule_accepts_ioc(rule: CorrelationRule, ioc_tags: Iterable[str], ioc_confidence: Optional[int]) -> bool:
+    if rule.ioc_tags_match and not set(rule.ioc_tags_match).intersection(ioc_tags or []):
+        return False
+    if rule.ioc_min_confidence is not None and (ioc_confidence is None or ioc_confidence < rule.ioc_min_confidence):
+        return False
+    return True
+
+
+def plan_ioc_rule_groups(rules: List[CorrelationRule]) -> List[IoCRuleGroup]:
+    """Групує правила IOC_MATCH_IP так, щоб навантаження на ES залежало від кількості груп, а не правил."""
+    groups: Dict[IoCRuleGroupKey, IoCRuleGroup] = {}
+    for rule in rules:
+        if rule.rule_type != CorrelationRuleTypeEnum.IOC_MATCH_IP:
+            continue
+        if not rule.event_field_to_match or not rule.ioc_type_to_match:
+            print(f"Rule '{rule.name}' IOC_MATCH_IP missing fields.")
+            continue
+        key = IoCRuleGroupKey(indices=resolve_event_indices(rule.event_source_type),
+                              time_window_minutes=rule.threshold_time_window_minutes or 60,
+                              ioc_type=rule.ioc_type_to_match.value)
+        groups.setdefault(key, IoCRuleGroup(key=key)).rules.append(rule)
+    return list(groups.values())
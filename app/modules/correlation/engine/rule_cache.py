@@ -0,0 +1,97 @@
+# app/modules/correlation/engine/rule_cache.py
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core import cache_versions
+from app.database.postgres_models.correlation_models import CorrelationRule
+from app.modules.indicators import schemas as indicator_schemas
+from .planner import IoCRuleGroup
+from .threshold_executor import ThresholdSpec
+
+# IoC можуть змінюватися й іншими процесами (версія в пам'яті цього не бачить), тому набір IoC
+# вважається застарілим не пізніше ніж через цей інтервал
+IOC_CACHE_MAX_AGE_SECONDS = 300
+
+# (кількість правил, max(updated_at)) — дешевий відбиток таблиці правил, що ловить зміни з інших процесів
+RulesFingerprint = Tuple[int, Optional[datetime]]
+
+
+@dataclass
+class CompiledIoCGroup:
+    group: IoCRuleGroup
+    iocs_by_rule: Dict[int, Dict[str, indicator_schemas.IoCResponse]]
+    event_query_body: Optional[Dict[str, Any]]
+
+
+@dataclass
+class CompiledThresholdRule:
+    rule: CorrelationRule
+    spec: ThresholdSpec
+    query_body: Dict[str, Any]
+
+
+@dataclass
+class CompiledRuleSet:
+    rules_version: int
+    rules_fingerprint: RulesFingerprint
+    active_rules: List[CorrelationRule]
+    ioc_groups: List[IoCRuleGroup] = field(default_factory=list)
+    threshold_rules: Dict[int, CompiledThresholdRule] = field(default_factory=dict)
+    # Частина, що залежить від IoC, інвалідовується окремо від правил
+    iocs_version: int = -1
+    iocs_compiled_at: float = 0.0
+    compiled_ioc_groups: List[CompiledIoCGroup] = field(default_factory=list)
+
+    def iocs_are_fresh(self) -> bool:
+        return self.iocs_version == cache_versions.current(cache_versions.IOCS) \
+            and time.monotonic() - self.iocs_compiled_at < IOC_CACHE_MAX_AGE_SECONDS
+
+
+class CompiledRuleCache:
+    """
+    Кеш скомпільованих правил між циклами кореляції. Правила перекомпільовуються лише при зміні версії
+    CORRELATION_RULES або відбитка таблиці; IoC-набори груп — при зміні версії IOCS або за віком.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compiled: Optional[CompiledRuleSet] = None
+        self.rule_compilations = 0
+        self.ioc_compilations = 0
+
+    def get_rules(self, fingerprint: RulesFingerprint) -> Optional[CompiledRuleSet]:
+        with self._lock:
+            compiled = self._compiled
+        if compiled is None or compiled.rules_version != cache_versions.current(cache_versions.CORRELATION_RULES) \
+                or compiled.rules_fingerprint != fingerprint:
+            return None
+        return compiled
+
+    def put_rules(self, compiled: CompiledRuleSet):
+        with self._lock:
+            self._compiled = compiled
+            self.rule_compilations += 1
+
+    def put_iocs(self, compiled: CompiledRuleSet, iocs_version: int, compiled_ioc_groups: List[CompiledIoCGroup]):
+        with self._lock:
+            compiled.iocs_version = iocs_version
+            compiled.iocs_compiled_at = time.monotonic()
+            compiled.compiled_ioc_groups = compiled_ioc_groups
+            self.ioc_compilations += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._compiled = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            compiled = self._compiled
+        return {"cached_rules": len(compiled.active_rules) if compiled else 0,
+                "rule_compilations": self.rule_compilations, "ioc_compilations": self.ioc_compilations,
+                "iocs_fresh": compiled.iocs_are_fresh() if compiled else False}
+
+
+compiled_rule_cache = CompiledRuleCache()
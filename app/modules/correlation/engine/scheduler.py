@@ -0,0 +1,105 @@
+# app/modules/correlation/engine/scheduler.py
+import threading
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.modules.correlation.rollups import prune_hourly_rollups
+from app.modules.correlation.services import CorrelationService
+from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
+from app.modules.device_interaction.services import DeviceService
+from app.modules.indicators.services import IndicatorService
+from app.modules.response.services import ResponseService
+from .partitions import OFFENCE_PARTITION_MAINTENANCE_INTERVAL_SECONDS, maintain_offence_partitions
+from .sharding import ShardCoordinator
+
+
+class CorrelationScheduler:
+    """
+    Періодичний цикл кореляції на кожному екземплярі API. Кожен екземпляр виконує лише свою частку
+    завдань (ShardCoordinator), тож додавання реплік розподіляє навантаження без дублювання офенсів.
+    """
+
+    def __init__(self, interval_seconds: int):
+        self.interval_seconds = interval_seconds
+        self.coordinator = ShardCoordinator()
+        self.correlation_service = CorrelationService()
+        self._es_writer: Optional[ElasticsearchWriter] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.coordinator.start()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="correlation-scheduler", daemon=True)
+        self._thread.start()
+        print(f"CorrelationScheduler started (every {self.interval_seconds}s).")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.coordinator.stop()
+        print("CorrelationScheduler stopped.")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            db = SessionLocal()
+            try:
+                if self._es_writer is None:
+                    self._es_writer = ElasticsearchWriter(
+                        es_hosts=[f"http://{settings.ELASTICSEARCH_HOST}:{settings.ELASTICSEARCH_PORT_API}"])
+                self.correlation_service.run_correlation_cycle(
+                    db=db, es_writer=self._es_writer, indicator_service=IndicatorService(),
+                    device_service=DeviceService(), response_service=ResponseService(), shard=self.coordinator)
+            except Exception as e:
+                print(f"CorrelationScheduler: Cycle failed: {e}")
+            try:
+                self.correlation_service.refresh_top_ioc_rollup_if_stale(db)
+            except Exception as e:
+                db.rollback()
+                print(f"CorrelationScheduler: Top IoC rollup refresh failed: {e}")
+            finally:
+                db.close()
+
+
+class OffenceMaintenanceScheduler:
+    """
+    Періодичне обслуговування сховища офенсів незалежно від циклу кореляції (його може бути вимкнено):
+    місячні секції offences наперед, видалення прострочених секцій і старих годинних лічильників offence_rollups.
+    """
+
+    def __init__(self, interval_seconds: int = OFFENCE_PARTITION_MAINTENANCE_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="offence-maintenance", daemon=True)
+        self._thread.start()
+        print(f"OffenceMaintenanceScheduler started (every {self.interval_seconds}s).")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        print("OffenceMaintenanceScheduler stopped.")
+
+    def run_once(self):
+        try:
+            maintain_offence_partitions(settings.OFFENCE_RETENTION_MONTHS)
+        except Exception as e:
+            print(f"OffenceMaintenanceScheduler: Offence partition maintenance failed: {e}")
+        db = SessionLocal()
+        try:
+            prune_hourly_rollups(db)
+        except Exception as e:
+            db.rollback()
+            print(f"OffenceMaintenanceScheduler: Hourly rollup pruning failed: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            self.run_once()
@@ -0,0 +1,217 @@
+# app/modules/correlation/engine/sequence_engine.py
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Callable, Hashable
+
+from app.database.postgres_models.correlation_models import CorrelationRule
+
+# Функція перевірки, чи є значення поля події активним IoC (підставляється ззовні)
+IoCLookup = Callable[[str], bool]
+
+
+def _value_matches(actual: Any, expected: Any) -> bool:
+    """
+    Умова фільтра стадії: скаляр — рівність, список — входження,
+    словник — діапазон ({"gte": 10, "lt": 100}).
+    """
+    if isinstance(expected, dict):
+        if actual is None:
+            return False
+        try:
+            actual_num = float(actual)
+        except (TypeError, ValueError):
+            return False
+        for op, bound in expected.items():
+            if op == "gte" and not actual_num >= bound: return False
+            if op == "gt" and not actual_num > bound: return False
+            if op == "lte" and not actual_num <= bound: return False
+            if op == "lt" and not actual_num < bound: return False
+        return True
+    if isinstance(expected, list):
+        return actual in expected or str(actual) in [str(v) for v in expected]
+    return actual == expected or str(actual) == str(expected)
+
+
+def event_matches_filter(event: Dict[str, Any], event_filter: Dict[str, Any]) -> bool:
+    return all(_value_matches(event.get(field_name), expected) for field_name, expected in event_filter.items())
+
+
+@dataclass
+class CompiledStage:
+    event_filter: Dict[str, Any]
+    min_count: int = 1
+    ioc_match_field: Optional[str] = None
+
+    def matches(self, event: Dict[str, Any], ioc_lookup: Optional[IoCLookup]) -> bool:
+        if not event_matches_filter(event, self.event_filter):
+            return False
+        if self.ioc_match_field:
+            value = event.get(self.ioc_match_field)
+            if value is None or ioc_lookup is None or not ioc_lookup(str(value)):
+                return False
+        return True
+
+
+@dataclass
+class SequenceState:
+    stage_index: int = 0
+    stage_hits: int = 0
+    started_at: float = 0.0
+    expires_at: float = 0.0
+    stage_times: List[float] = field(default_factory=list)
+
+    # Грубий, але стабільний облік пам'яті одного стану (об'єкт + список часових міток)
+    def approx_size(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.stage_times) + 8 * len(self.stage_times)
+
+
+class BoundedStateStore:
+    """
+    LRU-сховище станів автоматів з TTL-витісненням та обмеженням за кількістю записів і пам'яттю.
+    Не потокобезпечне — синхронізацію забезпечує власник (SequenceEngine).
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._states: "OrderedDict[Hashable, SequenceState]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self.bytes_used = 0
+        self.evicted_ttl = 0
+        self.evicted_capacity = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, key: Hashable, now: float) -> Optional[SequenceState]:
+        state = self._states.get(key)
+        if state is None:
+            return None
+        if state.expires_at <= now:
+            self._remove(key)
+            self.evicted_ttl += 1
+            return None
+        self._states.move_to_end(key)
+        return state
+
+    def put(self, key: Hashable, state: SequenceState):
+        if key in self._states:
+            self._remove(key)
+        size = sys.getsizeof(key) + state.approx_size()
+        self._states[key] = state
+        self._sizes[key] = size
+        self.bytes_used += size
+        while self._states and (len(self._states) > self.max_entries or self.bytes_used > self.max_bytes):
+            oldest_key = next(iter(self._states))
+            self._remove(oldest_key)
+            self.evicted_capacity += 1
+
+    def discard(self, key: Hashable):
+        if key in self._states:
+            self._remove(key)
+
+    def evict_expired(self, now: float) -> int:
+        expired_keys = [k for k, st in self._states.items() if st.expires_at <= now]
+        for k in expired_keys:
+            self._remove(k)
+        self.evicted_ttl += len(expired_keys)
+        return len(expired_keys)
+
+    def drop_rule(self, rule_id: int):
+        for k in [k for k in self._states if k[0] == rule_id]:
+            self._remove(k)
+
+    def _remove(self, key: Hashable):
+        self._states.pop(key, None)
+        self.bytes_used -= self._sizes.pop(key, 0)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._states), "bytes_used": self.bytes_used,
+                "evicted_ttl": self.evicted_ttl, "evicted_capacity": self.evicted_capacity}
+
+
+@dataclass
+class SequenceMatch:
+    rule: CorrelationRule
+    key: Dict[str, Any]
+    stage_times: List[float]
+    last_event: Dict[str, Any]
+
+
+@dataclass
+class CompiledSequenceRule:
+    rule: CorrelationRule
+    stages: List[CompiledStage]
+    key_fields: List[str]
+    window_seconds: float
+
+    @classmethod
+    def from_rule(cls, rule: CorrelationRule) -> "CompiledSequenceRule":
+        if not rule.sequence_stages or len(rule.sequence_stages) < 2:
+            raise ValueError(f"Rule '{rule.name}': SEQUENCE_OF_EVENTS requires at least two 'sequence_stages'.")
+        if not rule.aggregation_fields or not rule.threshold_time_window_minutes:
+            raise ValueError(
+                f"Rule '{rule.name}': SEQUENCE_OF_EVENTS requires 'aggregation_fields' and 'threshold_time_window_minutes'.")
+        stages = [CompiledStage(event_filter=st.get("event_filter") or {}, min_count=st.get("min_count") or 1,
+                                ioc_match_field=st.get("ioc_match_field")) for st in rule.sequence_stages]
+        return cls(rule=rule, stages=stages, key_fields=[f.value for f in rule.aggregation_fields],
+                   window_seconds=rule.threshold_time_window_minutes * 60)
+
+    def event_key(self, event: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+        values = tuple(event.get(f) for f in self.key_fields)
+        return None if any(v is None for v in values) else values
+
+
+class SequenceEngine:
+    """
+    Оцінює SEQUENCE_OF_EVENTS правила на живому потоці подій: окремий скінченний автомат на кожен
+    (правило, ключ), стан живе не довше за вікно правила. Час — момент обробки події (time.monotonic()).
+    """
+
+    def __init__(self, store: Optional[BoundedStateStore] = None, ioc_lookup: Optional[IoCLookup] = None):
+        self.store = store or BoundedStateStore()
+        self.ioc_lookup = ioc_lookup
+        self.rules: Dict[int, CompiledSequenceRule] = {}
+
+    def set_rules(self, rules: List[CorrelationRule]):
+        compiled: Dict[int, CompiledSequenceRule] = {}
+        for rule in rules:
+            try:
+                compiled[rule.id] = CompiledSequenceRule.from_rule(rule)
+            except ValueError as ve:
+                print(f"SequenceEngine: {ve}")
+        # Стан правил, які видалили або змінили, скидається
+        for rule_id, old in self.rules.items():
+            new = compiled.get(rule_id)
+            if new is None or new.rule.updated_at != old.rule.updated_at:
+                self.store.drop_rule(rule_id)
+        self.rules = compiled
+
+    def process_event(self, event: Dict[str, Any], now: Optional[float] = None) -> List[SequenceMatch]:
+        now = time.monotonic() if now is None else now
+        matches: List[SequenceMatch] = []
+        for rule_id, compiled in self.rules.items():
+            key_values = compiled.event_key(event)
+            if key_values is None:
+                continue
+            state_key = (rule_id, key_values)
+            state = self.store.get(state_key, now)
+            stage_index = state.stage_index if state else 0
+            if not compiled.stages[stage_index].matches(event, self.ioc_lookup):
+                continue
+            if state is None:
+                state = SequenceState(started_at=now, expires_at=now + compiled.window_seconds)
+            state.stage_hits += 1
+            if state.stage_hits >= compiled.stages[stage_index].min_count:
+                state.stage_times.append(now)
+                state.stage_index += 1
+                state.stage_hits = 0
+            if state.stage_index >= len(compiled.stages):
+                self.store.discard(state_key)
+                matches.append(SequenceMatch(rule=compiled.rule, key=dict(zip(compiled.key_fields, key_values)),
+                                             stage_times=state.stage_times, last_event=event))
+            else:
+                self.store.put(state_key, state)
+        return matches
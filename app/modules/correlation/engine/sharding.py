@@ -0,0 +1,142 @@
+# app/modules/correlation/engine/sharding.py
+import bisect
+import hashlib
+import os
+import socket
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional, Iterator
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.database import SessionLocal, engine
+from app.database.postgres_models.correlation_models import CorrelationEngineMember
+
+HEARTBEAT_INTERVAL_SECONDS = 10
+MEMBER_TTL_SECONDS = 30
+RING_VIRTUAL_NODES = 64
+# Перший ключ двоключового advisory lock — простір імен завдань кореляції
+ADVISORY_LOCK_NAMESPACE = 0x5EC0
+
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class ConsistentHashRing:
+    """Кільце з віртуальними вузлами: при зміні складу переїжджає лише ~1/N ключів."""
+
+    def __init__(self, members: List[str], virtual_nodes: int = RING_VIRTUAL_NODES):
+        self.members = sorted(members)
+        points = sorted((_hash(f"{m}#{i}"), m) for m in self.members for i in range(virtual_nodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[idx]
+
+
+@contextmanager
+def advisory_task_lock(shard_key: str) -> Iterator[bool]:
+    """
+    Неблокуючий сесійний advisory lock на окремому з'єднанні на час виконання завдання:
+    навіть під час перебалансування одне завдання не виконується двома екземплярами одночасно.
+    """
+    lock_id = zlib.crc32(shard_key.encode()) & 0x7FFFFFFF
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:ns, :id)"),
+                                {"ns": ADVISORY_LOCK_NAMESPACE, "id": lock_id}).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:ns, :id)"), {"ns": ADVISORY_LOCK_NAMESPACE, "id": lock_id})
+            conn.commit()
+
+
+class ShardCoordinator:
+    """
+    Членство екземплярів через таблицю-оренду correlation_engine_members: кожен екземпляр оновлює свій
+    heartbeat, записи без heartbeat довше MEMBER_TTL_SECONDS видаляються. З живих членів будується
+    кільце консистентного хешування, і екземпляр виконує лише завдання, ключі яких належать йому.
+    """
+
+    def __init__(self, instance_id: str = INSTANCE_ID):
+        self.instance_id = instance_id
+        self._lock = threading.Lock()
+        self._ring = ConsistentHashRing([instance_id])
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def members(self) -> List[str]:
+        with self._lock:
+            return list(self._ring.members)
+
+    def owns(self, shard_key: str) -> bool:
+        with self._lock:
+            return self._ring.owner(shard_key) == self.instance_id
+
+    def heartbeat(self):
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            stmt = pg_insert(CorrelationEngineMember).values(
+                instance_id=self.instance_id, hostname=socket.gethostname(), started_at=now, heartbeat_at=now)
+            db.execute(stmt.on_conflict_do_update(index_elements=[CorrelationEngineMember.instance_id],
+                                                  set_={"heartbeat_at": now}))
+            db.query(CorrelationEngineMember).filter(
+                CorrelationEngineMember.heartbeat_at < now - timedelta(seconds=MEMBER_TTL_SECONDS)
+            ).delete(synchronize_session=False)
+            db.commit()
+            members = [row[0] for row in db.query(CorrelationEngineMember.instance_id).all()]
+        except Exception as e:
+            db.rollback()
+            print(f"ShardCoordinator: Heartbeat failed: {e}")
+            return
+        finally:
+            db.close()
+        if self.instance_id not in members:
+            members.append(self.instance_id)
+        with self._lock:
+            if sorted(members) != self._ring.members:
+                print(f"ShardCoordinator: Membership changed, rebalancing across {len(members)} instances: {sorted(members)}")
+                self._ring = ConsistentHashRing(members)
+
+    def leave(self):
+        db = SessionLocal()
+        try:
+            db.query(CorrelationEngineMember).filter(
+                CorrelationEngineMember.instance_id == self.instance_id).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"ShardCoordinator: Failed to leave membership: {e}")
+        finally:
+            db.close()
+
+    def start(self):
+        self._stop_event.clear()
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name="correlation-shard-heartbeat", daemon=True)
+        self._thread.start()
+        print(f"ShardCoordinator: Instance '{self.instance_id}' joined.")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.leave()
+
+    def _run(self):
+        while not self._stop_event.wait(HEARTBEAT_INTERVAL_SECONDS):
+            self.heartbeat()
@@ -0,0 +1,187 @@
+# app/modules/correlation/engine/sliding_window.py
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Hashable
+
+from app.database.postgres_models.correlation_models import CorrelationRule
+from app.modules.correlation.schemas import ThresholdMetricEnum
+from .sequence_engine import event_matches_filter
+from .threshold_executor import ThresholdBucket, ThresholdSpec
+
+DEFAULT_SLOT_SECONDS = 60
+MAX_SLOTS_PER_WINDOW = 60
+
+
+@dataclass
+class SlidingWindowCounter:
+    """
+    Кільцевий буфер під-вікон: slot_count комірок по slot_seconds кожна.
+    Комірка належить «епосі» int(now // slot_seconds) і обнуляється, коли буфер по колу повертається до неї.
+    """
+    slot_seconds: float
+    slot_count: int
+    values: List[float] = field(default_factory=list)
+    counts: List[int] = field(default_factory=list)
+    epochs: List[int] = field(default_factory=list)
+    muted_until: float = 0.0
+    last_seen: float = 0.0
+
+    def __post_init__(self):
+        self.reset()
+
+    def add(self, value: float, now: float) -> float:
+        epoch = int(now // self.slot_seconds)
+        idx = epoch % self.slot_count
+        if self.epochs[idx] != epoch:
+            self.epochs[idx] = epoch
+            self.values[idx] = 0.0
+            self.counts[idx] = 0
+        self.values[idx] += value
+        self.counts[idx] += 1
+        self.last_seen = now
+        return self.total(now)
+
+    def _live_slots(self, now: float) -> List[int]:
+        oldest_epoch = int(now // self.slot_seconds) - self.slot_count
+        return [i for i, e in enumerate(self.epochs) if e > oldest_epoch]
+
+    def total(self, now: float) -> float:
+        return sum(self.values[i] for i in self._live_slots(now))
+
+    def doc_count(self, now: float) -> int:
+        return sum(self.counts[i] for i in self._live_slots(now))
+
+    def reset(self):
+        self.values = [0.0] * self.slot_count
+        self.counts = [0] * self.slot_count
+        self.epochs = [-1] * self.slot_count
+
+
+class SlidingWindowStore:
+    """LRU-сховище лічильників з обмеженням кількості ключів; витіснення рахуються в evicted_capacity."""
+
+    def __init__(self, max_keys: int = 200_000):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[Hashable, SlidingWindowCounter]" = OrderedDict()
+        self.evicted_capacity = 0
+        self.evicted_idle = 0
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def get_or_create(self, key: Hashable, slot_seconds: float, slot_count: int) -> SlidingWindowCounter:
+        counter = self._counters.get(key)
+        if counter is not None:
+            self._counters.move_to_end(key)
+            return counter
+        counter = SlidingWindowCounter(slot_seconds=slot_seconds, slot_count=slot_count)
+        self._counters[key] = counter
+        while len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+            self.evicted_capacity += 1
+        return counter
+
+    def evict_idle(self, now: float) -> int:
+        """Видаляє лічильники, що не оновлювались довше за своє вікно (їх сума вже нульова)."""
+        idle_keys = [k for k, c in self._counters.items()
+                     if now - c.last_seen > c.slot_seconds * c.slot_count and c.muted_until <= now]
+        for k in idle_keys:
+            del self._counters[k]
+        self.evicted_idle += len(idle_keys)
+        return len(idle_keys)
+
+    def drop_rule(self, rule_id: int):
+        for k in [k for k in self._counters if k[0] == rule_id]:
+            del self._counters[k]
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self._counters), "max_keys": self.max_keys,
+                "evicted_capacity": self.evicted_capacity, "evicted_idle": self.evicted_idle}
+
+
+@dataclass
+class ThresholdMatch:
+    rule: CorrelationRule
+    spec: ThresholdSpec
+    bucket: ThresholdBucket
+
+
+@dataclass
+class CompiledStreamThresholdRule:
+    rule: CorrelationRule
+    spec: ThresholdSpec
+    slot_seconds: float
+    slot_count: int
+
+    @classmethod
+    def from_rule(cls, rule: CorrelationRule) -> "CompiledStreamThresholdRule":
+        spec = ThresholdSpec.from_rule(rule)
+        if spec.metric == ThresholdMetricEnum.CARDINALITY:
+            raise ValueError(f"Rule '{rule.name}': metric 'cardinality' is not supported in stream mode.")
+        if not spec.aggregation_fields or not spec.threshold or not spec.time_window_minutes:
+            raise ValueError(f"Rule '{rule.name}': stream threshold rules require aggregation fields, count and window.")
+        window_seconds = spec.time_window_minutes * 60
+        slot_seconds = max(DEFAULT_SLOT_SECONDS, window_seconds / MAX_SLOTS_PER_WINDOW)
+        slot_count = max(1, int(round(window_seconds / slot_seconds)))
+        return cls(rule=rule, spec=spec, slot_seconds=slot_seconds, slot_count=slot_count)
+
+    def event_key(self, event: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+        values = tuple(event.get(f) for f in self.spec.aggregation_fields)
+        return None if any(v is None for v in values) else values
+
+    def event_value(self, event: Dict[str, Any]) -> Optional[float]:
+        if self.spec.metric == ThresholdMetricEnum.COUNT:
+            return 1.0
+        try:
+            return float(event.get(self.spec.metric_field))
+        except (TypeError, ValueError):
+            return None
+
+
+class SlidingWindowThresholdEvaluator:
+    """
+    Потокова оцінка порогових правил (evaluation_mode=stream): спрацьовує на тій події, якою ключ перетнув
+    threshold_count. Після спрацювання лічильник ключа скидається, а ключ «мовчить» до кінця вікна.
+    """
+
+    def __init__(self, store: Optional[SlidingWindowStore] = None):
+        self.store = store or SlidingWindowStore()
+        self.rules: Dict[int, CompiledStreamThresholdRule] = {}
+
+    def set_rules(self, rules: List[CorrelationRule]):
+        compiled: Dict[int, CompiledStreamThresholdRule] = {}
+        for rule in rules:
+            try:
+                compiled[rule.id] = CompiledStreamThresholdRule.from_rule(rule)
+            except ValueError as ve:
+                print(f"SlidingWindowThresholdEvaluator: {ve}")
+        for rule_id, old in self.rules.items():
+            new = compiled.get(rule_id)
+            if new is None or new.rule.updated_at != old.rule.updated_at:
+                self.store.drop_rule(rule_id)
+        self.rules = compiled
+
+    def process_event(self, event: Dict[str, Any], now: Optional[float] = None) -> List[ThresholdMatch]:
+        now = time.monotonic() if now is None else now
+        matches: List[ThresholdMatch] = []
+        for rule_id, compiled in self.rules.items():
+            if compiled.spec.event_filter and not event_matches_filter(event, compiled.spec.event_filter):
+                continue
+            key_values = compiled.event_key(event)
+            if key_values is None:
+                continue
+            value = compiled.event_value(event)
+            if value is None:
+                continue
+            counter = self.store.get_or_create((rule_id, key_values), compiled.slot_seconds, compiled.slot_count)
+            if counter.muted_until > now:
+                continue
+            total = counter.add(value, now)
+            if total >= compiled.spec.threshold:
+                bucket = ThresholdBucket(key=dict(zip(compiled.spec.aggregation_fields, key_values)), value=total,
+                                         doc_count=counter.doc_count(now))
+                matches.append(ThresholdMatch(rule=compiled.rule, spec=compiled.spec, bucket=bucket))
+                counter.reset()
+                counter.muted_until = now + compiled.slot_seconds * compiled.slot_count
+        return matches
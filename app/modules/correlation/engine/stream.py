@@ -0,0 +1,199 @@
+# app/modules/correlation/engine/stream.py
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from elasticsearch import exceptions as es_exceptions
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.database.postgres_models.correlation_models import CorrelationRule
+from app.modules.correlation import schemas as correlation_schemas
+from app.modules.correlation.schemas import CorrelationRuleTypeEnum, RuleEvaluationModeEnum
+from app.modules.correlation.services import CorrelationService
+from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
+from app.modules.device_interaction.services import DeviceService
+from app.modules.response.services import ResponseService
+from .anomaly_baseline import AnomalyDetector
+from .sequence_engine import SequenceEngine
+from .sliding_window import SlidingWindowThresholdEvaluator
+from .threshold_executor import THRESHOLD_RULE_DEFAULTS
+
+
+class StreamingCorrelationEngine:
+    """
+    Потокова кореляція: отримує нормалізовані події напряму від DataIngestionService,
+    оцінює правила-послідовності, аномалії NetFlow-обсягу та порогові правила з evaluation_mode=stream
+    і пакетно зберігає офенси у фоновому потоці (одна вставка на правило за інтервал скидання).
+    """
+
+    def __init__(self, rules_refresh_seconds: float = 30.0, flush_interval_seconds: float = 2.0,
+                 checkpoint_interval_seconds: float = 60.0):
+        self.rules_refresh_seconds = rules_refresh_seconds
+        self.flush_interval_seconds = flush_interval_seconds
+        self.checkpoint_interval_seconds = checkpoint_interval_seconds
+
+        self.correlation_service = CorrelationService()
+        self.response_service = ResponseService()
+        self.device_service = DeviceService()
+
+        self.sequence_engine = SequenceEngine(ioc_lookup=self._is_active_ioc)
+        self.threshold_evaluator = SlidingWindowThresholdEvaluator()
+        self.anomaly_detector = AnomalyDetector()
+
+        self._lock = threading.Lock()
+        self._rules_by_id: Dict[int, CorrelationRule] = {}
+        self._pending_offences: Dict[int, List[correlation_schemas.OffenceCreate]] = {}
+        self._active_ioc_values: frozenset = frozenset()
+        self._es_writer: Optional[ElasticsearchWriter] = None
+        self._last_rules_refresh = 0.0
+        self._last_checkpoint = time.monotonic()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.events_processed = 0
+
+    # --- Життєвий цикл ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            print("StreamingCorrelationEngine is already running.")
+            return
+        self._stop_event.clear()
+        self.refresh_rules()
+        self._thread = threading.Thread(target=self._run, name="streaming-correlation", daemon=True)
+        self._thread.start()
+        print("StreamingCorrelationEngine started.")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.flush_pending_offences()
+        self.checkpoint_anomaly_baselines()
+        print("StreamingCorrelationEngine stopped.")
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval_seconds):
+            try:
+                if time.monotonic() - self._last_rules_refresh >= self.rules_refresh_seconds:
+                    self.refresh_rules()
+                with self._lock:
+                    now = time.monotonic()
+                    self.sequence_engine.store.evict_expired(now)
+                    self.threshold_evaluator.store.evict_idle(now)
+                    for match in self.anomaly_detector.close_elapsed_slots():
+                        self._add_pending(match.rule.id, self.correlation_service.build_anomaly_offence(match))
+                self.flush_pending_offences()
+                if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval_seconds:
+                    self.checkpoint_anomaly_baselines()
+            except Exception as e:
+                print(f"StreamingCorrelationEngine: Error in background loop: {e}")
+
+    # --- Вхід подій (викликається з потоків слухачів) ---
+    def on_event(self, event: Dict[str, Any]):
+        try:
+            with self._lock:
+                self.events_processed += 1
+                for match in self.sequence_engine.process_event(event):
+                    self._add_pending(match.rule.id, self.correlation_service.build_sequence_offence(match))
+                for match in self.threshold_evaluator.process_event(event):
+                    self._add_pending(match.rule.id, self.correlation_service.build_threshold_offence(
+                        match.rule, match.spec, match.bucket))
+                for match in self.anomaly_detector.process_event(event):
+                    self._add_pending(match.rule.id, self.correlation_service.build_anomaly_offence(match))
+        except Exception as e:
+            print(f"StreamingCorrelationEngine: Error processing event: {e}")
+
+    def _add_pending(self, rule_id: int, offence: correlation_schemas.OffenceCreate):
+        self._pending_offences.setdefault(rule_id, []).append(offence)
+
+    # --- Правила та IoC ---
+    def refresh_rules(self):
+        db = SessionLocal()
+        try:
+            rules = self.correlation_service.get_all_correlation_rules(db, only_enabled=True, limit=1000)
+            db.expunge_all()
+            anomaly_rules = [r for r in rules if r.rule_type == CorrelationRuleTypeEnum.ANOMALY_NETFLOW_VOLUME]
+            with self._lock:
+                new_anomaly_rule_ids, reset_anomaly_rule_ids = self.anomaly_detector.set_rules(anomaly_rules)
+            # Базові лінії, навчені з іншими полями ключа чи інтервалом, не годяться: чекпоінти видаляються
+            if reset_anomaly_rule_ids:
+                self.correlation_service.delete_anomaly_baselines(db, reset_anomaly_rule_ids)
+                db.commit()
+            # Базові лінії нових правил відновлюються з чекпоінту, навчання не починається з нуля
+            baseline_rows = self.correlation_service.load_anomaly_baselines(db, new_anomaly_rule_ids)
+            with self._lock:
+                self.anomaly_detector.load_baselines(baseline_rows)
+        except Exception as e:
+            print(f"StreamingCorrelationEngine: Failed to load rules: {e}")
+            return
+        finally:
+            db.close()
+        sequence_rules = [r for r in rules if r.rule_type == CorrelationRuleTypeEnum.SEQUENCE_OF_EVENTS]
+        stream_threshold_rules = [r for r in rules if r.rule_type in THRESHOLD_RULE_DEFAULTS
+                                  and r.evaluation_mode == RuleEvaluationModeEnum.STREAM]
+        if any(stage.get("ioc_match_field") for r in sequence_rules for stage in (r.sequence_stages or [])):
+            self._refresh_active_ioc_values()
+        with self._lock:
+            self._rules_by_id = {r.id: r for r in rules}
+            self.sequence_engine.set_rules(sequence_rules)
+            self.threshold_evaluator.set_rules(stream_threshold_rules)
+        self._last_rules_refresh = time.monotonic()
+
+    def _refresh_active_ioc_values(self):
+        try:
+            if self._es_writer is None:
+                self._es_writer = ElasticsearchWriter(
+                    es_hosts=[f"http://{settings.ELASTICSEARCH_HOST}:{settings.ELASTICSEARCH_PORT_API}"])
+            self._active_ioc_values = frozenset(
+                self.correlation_service.fetch_active_ioc_values(self._es_writer.es_client))
+        except (ConnectionError, es_exceptions.ElasticsearchWarning, es_exceptions.ApiError) as e:
+            print(f"StreamingCorrelationEngine: Failed to refresh active IoC values: {e}")
+
+    def _is_active_ioc(self, value: str) -> bool:
+        return value in self._active_ioc_values
+
+    # --- Збереження офенсів ---
+    def flush_pending_offences(self):
+        with self._lock:
+            pending, self._pending_offences = self._pending_offences, {}
+            rules_by_id = self._rules_by_id
+        if not pending:
+            return
+        db = SessionLocal()
+        try:
+            for rule_id, offences in pending.items():
+                rule = rules_by_id.get(rule_id)
+                if rule is None:
+                    continue
+                self.correlation_service.persist_rule_offences(db, rule, offences, self.response_service,
+                                                               self.device_service)
+        finally:
+            db.close()
+
+    def checkpoint_anomaly_baselines(self):
+        with self._lock:
+            rows = self.anomaly_detector.pop_dirty_baselines()
+        self._last_checkpoint = time.monotonic()
+        if not rows:
+            return
+        db = SessionLocal()
+        try:
+            self.correlation_service.save_anomaly_baselines(db, rows)
+        except Exception as e:
+            print(f"StreamingCorrelationEngine: Failed to checkpoint {len(rows)} anomaly baselines: {e}")
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"events_processed": self.events_processed,
+                    "sequence_rules": len(self.sequence_engine.rules),
+                    "sequence_state": self.sequence_engine.store.stats(),
+                    "stream_threshold_rules": len(self.threshold_evaluator.rules),
+                    "sliding_window_state": self.threshold_evaluator.store.stats(),
+                    "anomaly_rules": len(self.anomaly_detector.rules),
+                    "anomaly_state": self.anomaly_detector.stats()}
+
+
+# Єдиний екземпляр на процес: його запускає lifespan у main.py, а API читає статистику
+streaming_correlation_engine = StreamingCorrelationEngine()
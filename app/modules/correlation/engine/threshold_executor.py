@@ -0,0 +1,151 @@
+# app/modules/correlation/engine/threshold_executor.py
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+from elasticsearch import Elasticsearch
+
+from app.database.postgres_models.correlation_models import CorrelationRule
+from app.modules.correlation.schemas import (
+    CorrelationRuleTypeEnum,
+    EventFieldToMatchTypeEnum,
+    ThresholdMetricEnum
+)
+from .planner import es_keyword_field, resolve_event_indices
+
+COMPOSITE_PAGE_SIZE = 1000
+THRESHOLD_AGG_NAME = "threshold_buckets"
+
+# Значення за замовчуванням для старих типів порогових правил, якщо в правилі їх не задано
+THRESHOLD_RULE_DEFAULTS: Dict[CorrelationRuleTypeEnum, Dict[str, Any]] = {
+    CorrelationRuleTypeEnum.THRESHOLD_LOGIN_FAILURES: {
+        "metric": ThresholdMetricEnum.COUNT,
+        "metric_field": None,
+        "event_filter": {"event_category": "authentication", "event_outcome": "failure"},
+    },
+    CorrelationRuleTypeEnum.THRESHOLD_DATA_EXFILTRATION: {
+        "metric": ThresholdMetricEnum.SUM,
+        "metric_field": EventFieldToMatchTypeEnum.NETWORK_BYTES_TOTAL,
+        "event_filter": {},
+    },
+}
+
+
+def build_event_filter_clauses(event_filter: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Переводить event_filter правила ({поле: значення або список}) у term/terms-фільтри ES."""
+    clauses: List[Dict[str, Any]] = []
+    for field_name, expected in (event_filter or {}).items():
+        if isinstance(expected, list):
+            clauses.append({"terms": {es_keyword_field(field_name): expected}})
+        else:
+            clauses.append({"term": {es_keyword_field(field_name): expected}})
+    return clauses
+
+
+@dataclass
+class ThresholdBucket:
+    key: Dict[str, Any]
+    value: float
+    doc_count: int
+
+    @property
+    def key_str(self) -> str:
+        return ", ".join(f"{k}='{v}'" for k, v in self.key.items())
+
+
+@dataclass
+class ThresholdSpec:
+    """Нормалізований опис порогового правила, з якого будується запит до ES."""
+    metric: ThresholdMetricEnum
+    metric_field: Optional[str]
+    event_filter: Dict[str, Any]
+    aggregation_fields: List[str]
+    threshold: int
+    time_window_minutes: int
+    indices: Tuple[str, ...]
+
+    @classmethod
+    def from_rule(cls, rule: CorrelationRule) -> "ThresholdSpec":
+        defaults = THRESHOLD_RULE_DEFAULTS.get(rule.rule_type, {})
+        metric = rule.threshold_metric or defaults.get("metric", ThresholdMetricEnum.COUNT)
+        metric_field = rule.threshold_metric_field or defaults.get("metric_field")
+        if metric != ThresholdMetricEnum.COUNT and not metric_field:
+            raise ValueError(f"Rule '{rule.name}': metric '{metric.value}' requires 'threshold_metric_field'.")
+        event_filter = rule.event_filter if rule.event_filter is not None else defaults.get("event_filter", {})
+        return cls(
+            metric=metric,
+            metric_field=metric_field.value if metric_field else None,
+            event_filter=event_filter or {},
+            aggregation_fields=[f.value for f in (rule.aggregation_fields or [])],
+            threshold=rule.threshold_count,
+            time_window_minutes=rule.threshold_time_window_minutes,
+            indices=resolve_event_indices(rule.event_source_type),
+        )
+
+    def build_query(self, time_range: Optional[Tuple[datetime, datetime]] = None) -> Dict[str, Any]:
+        if time_range:
+            time_filter = {"range": {"timestamp": {"gte": time_range[0].isoformat(),
+                                                   "lt": time_range[1].isoformat()}}}
+        else:
+            time_filter = {"range": {"timestamp": {"gte": f"now-{self.time_window_minutes}m", "lte": "now"}}}
+        filters: List[Dict[str, Any]] = [time_filter] + build_event_filter_clauses(self.event_filter)
+
+        if self.metric == ThresholdMetricEnum.COUNT:
+            metric_aggs: Dict[str, Any] = {}
+            buckets_path = "_count"
+        else:
+            metric_agg_type = "sum" if self.metric == ThresholdMetricEnum.SUM else "cardinality"
+            metric_field = self.metric_field if self.metric == ThresholdMetricEnum.SUM else es_keyword_field(
+                self.metric_field)
+            metric_aggs = {"metric_value": {metric_agg_type: {"field": metric_field}}}
+            buckets_path = "metric_value"
+
+        # bucket_selector відсікає групи нижче порогу ще на боці ES
+        bucket_aggs = dict(metric_aggs)
+        bucket_aggs["threshold_filter"] = {"bucket_selector": {
+            "buckets_path": {"metric": buckets_path},
+            "script": {"source": "params.metric >= params.threshold", "params": {"threshold": self.threshold}}
+        }}
+        return {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {THRESHOLD_AGG_NAME: {
+                "composite": {
+                    "size": COMPOSITE_PAGE_SIZE,
+                    "sources": [{f: {"terms": {"field": es_keyword_field(f)}}} for f in self.aggregation_fields]
+                },
+                "aggs": bucket_aggs
+            }}
+        }
+
+
+def _with_after_key(query_body: Dict[str, Any], after_key: Dict[str, Any]) -> Dict[str, Any]:
+    """Копіює лише шлях до composite, щоб не змінювати заздалегідь побудований (кешований) запит."""
+    threshold_agg = query_body['aggs'][THRESHOLD_AGG_NAME]
+    composite = dict(threshold_agg['composite'], after=after_key)
+    return dict(query_body, aggs={THRESHOLD_AGG_NAME: dict(threshold_agg, composite=composite)})
+
+
+def iter_threshold_buckets(es_client: Elasticsearch, spec: ThresholdSpec,
+                           time_range: Optional[Tuple[datetime, datetime]] = None,
+                           query_body: Optional[Dict[str, Any]] = None) -> Iterator[ThresholdBucket]:
+    """
+    Проходить усі сторінки composite-агрегації й повертає лише групи, що перетнули поріг.
+    Сторінка після bucket_selector може бути порожньою, тому зупиняємось лише за відсутності after_key.
+    query_body — заздалегідь побудований запит (не змінюється); інакше будується зі spec.
+    """
+    if query_body is None:
+        query_body = spec.build_query(time_range)
+    while True:
+        response = es_client.search(index=list(spec.indices), body=query_body)
+        aggregation_results = response.get('aggregations', {}).get(THRESHOLD_AGG_NAME, {})
+        for bucket in aggregation_results.get('buckets', []):
+            if spec.metric == ThresholdMetricEnum.COUNT:
+                value = bucket.get('doc_count', 0)
+            else:
+                value = bucket.get('metric_value', {}).get('value') or 0
+            yield ThresholdBucket(key=bucket.get('key', {}), value=value, doc_count=bucket.get('doc_count', 0))
+        after_key = aggregation_results.get('after_key')
+        if not after_key:
+            break
+        query_body = _with_after_key(query_body, after_key)
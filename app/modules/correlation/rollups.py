@@ -0,0 +1,123 @@
+# app/modules/correlation/rollups.py
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.database.postgres_models.correlation_models import OffenceRollup
+
+ROLLUP_HOUR = "hour"
+ROLLUP_DAY = "day"
+
+DIMENSION_SEVERITY = "severity"
+DIMENSION_RULE = "rule"
+DIMENSION_APT = "apt"
+DIMENSION_IOC_TYPE = "ioc_type"
+
+# Годинні лічильники потрібні лише для неповних діб на краях вікна дашборду (до 365 днів назад)
+HOURLY_ROLLUP_RETENTION_DAYS = 400
+ROLLUP_WRITE_BATCH_SIZE = 1000
+
+def _floor_hour(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(moment: datetime) -> datetime:
+    return _floor_hour(moment).replace(hour=0)
+
+
+def offence_dimensions(offence: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Пари (вимір, значення), до лічильників яких належить офенс (словник полів OffenceCreate)."""
+    severity = offence.get("severity")
+    dimensions = [(DIMENSION_SEVERITY, str(getattr(severity, "value", severity))),
+                  (DIMENSION_RULE, str(offence.get("correlation_rule_id")))]
+    dimensions += [(DIMENSION_APT, str(apt_id)) for apt_id in set(offence.get("attributed_apt_group_ids") or [])]
+    ioc_details = offence.get("matched_ioc_details")
+    if isinstance(ioc_details, dict) and ioc_details.get("type"):
+        dimensions.append((DIMENSION_IOC_TYPE, str(ioc_details["type"])))
+    return dimensions
+
+
+def _add_deltas(deltas: Counter, detected_at: datetime, dimensions: Iterable[Tuple[str, str]], sign: int):
+    hour, day = _floor_hour(detected_at), _floor_day(detected_at)
+    for dimension, value in dimensions:
+        deltas[(dimension, ROLLUP_HOUR, hour, value)] += sign
+        deltas[(dimension, ROLLUP_DAY, day, value)] += sign
+
+
+def _apply_deltas(db: Session, deltas: Counter):
+    """
+    ON CONFLICT-інкремент; без commit — лічильники комітяться разом з офенсами. Рядки відсортовані,
+    щоб паралельні транзакції блокували лічильники в одному порядку й не впирались у взаємоблокування.
+    """
+    rows = [{"dimension": dimension, "granularity": granularity, "bucket_start": bucket_start,
+             "dimension_value": value, "offence_count": delta}
+            for (dimension, granularity, bucket_start, value), delta in sorted(deltas.items()) if delta]
+    for i in range(0, len(rows), ROLLUP_WRITE_BATCH_SIZE):
+        stmt = pg_insert(OffenceRollup).values(rows[i:i + ROLLUP_WRITE_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OffenceRollup.dimension, OffenceRollup.granularity, OffenceRollup.bucket_start,
+                            OffenceRollup.dimension_value],
+            set_={"offence_count": OffenceRollup.offence_count + stmt.excluded.offence_count})
+        db.execute(stmt)
+
+
+def record_offences(db: Session, offences: Iterable[Dict[str, Any]]):
+    """Додає нові офенси (словники з detected_at) до годинних і добових лічильників."""
+    deltas: Counter = Counter()
+    for offence in offences:
+        _add_deltas(deltas, offence["detected_at"], offence_dimensions(offence), 1)
+    _apply_deltas(db, deltas)
+
+
+def record_severity_change(db: Session, detected_at: datetime, old_severity: Any, new_severity: Any):
+    old_value = str(getattr(old_severity, "value", old_severity))
+    new_value = str(getattr(new_severity, "value", new_severity))
+    if old_value == new_value:
+        return
+    deltas: Counter = Counter()
+    _add_deltas(deltas, detected_at, [(DIMENSION_SEVERITY, old_value)], -1)
+    _add_deltas(deltas, detected_at, [(DIMENSION_SEVERITY, new_value)], 1)
+    _apply_deltas(db, deltas)
+
+
+def rollup_counts(db: Session, dimension: str, time_from: datetime,
+                  time_to: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Кількість офенсів за значеннями виміру у вікні [time_from, time_to). Повні доби беруться з добових
+    лічильників, неповні доби на краях — з годинних; початок вікна округлюється вниз до години.
+    """
+    time_to = time_to or datetime.now(timezone.utc)
+    start = _floor_hour(time_from)
+    first_full_day = _floor_day(start) if start == _floor_day(start) else _floor_day(start) + timedelta(days=1)
+    last_day = _floor_day(time_to)
+    if first_full_day < last_day:
+        bucket_filter = or_(
+            and_(OffenceRollup.granularity == ROLLUP_DAY, OffenceRollup.bucket_start >= first_full_day,
+                 OffenceRollup.bucket_start < last_day),
+            and_(OffenceRollup.granularity == ROLLUP_HOUR,
+                 or_(and_(OffenceRollup.bucket_start >= start, OffenceRollup.bucket_start < first_full_day),
+                     and_(OffenceRollup.bucket_start >= last_day, OffenceRollup.bucket_start < time_to))))
+    else:
+        bucket_filter = and_(OffenceRollup.granularity == ROLLUP_HOUR, OffenceRollup.bucket_start >= start,
+                             OffenceRollup.bucket_start < time_to)
+    rows = db.query(OffenceRollup.dimension_value, func.sum(OffenceRollup.offence_count)).filter(
+        OffenceRollup.dimension == dimension, bucket_filter).group_by(OffenceRollup.dimension_value).all()
+    return {value: int(count) for value, count in rows if count}
+
+
+def delete_rollups_before(db: Session, cutoff: datetime) -> int:
+    """Видаляє лічильники обох гранулярностей раніше cutoff (разом із видаленими секціями офенсів), без commit."""
+    result = db.execute(delete(OffenceRollup).where(OffenceRollup.bucket_start < cutoff))
+    return result.rowcount or 0
+
+
+def prune_hourly_rollups(db: Session, retention_days: int = HOURLY_ROLLUP_RETENTION_DAYS) -> int:
+    cutoff = _floor_day(datetime.now(timezone.utc)) - timedelta(days=retention_days)
+    result = db.execute(delete(OffenceRollup).where(OffenceRollup.granularity == ROLLUP_HOUR,
+                                                    OffenceRollup.bucket_start < cutoff))
+    db.commit()
+    return result.rowcount or 0
@@ -1,5 +1,5 @@
 # app/modules/correlation/schemas.py
-from pydantic import BaseModel, Field, Json
+from pydantic import BaseModel, Field, Json, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone  # Переконайся, що datetime імпортовано
 import enum
@@ -16,6 +16,10 @@ class EventFieldToMatchTypeEnum(str, enum.Enum):
     HOSTNAME = "hostname"  # Для логінів/системних подій
     EVENT_MESSAGE = "message"  # Для пошуку ключових слів у повідомленні
     NETWORK_BYTES_TOTAL = "network_bytes_total"  # Для NetFlow
+    REPORTER_IP = "reporter_ip"  # Пристрій, що надіслав подію
+    DESTINATION_PORT = "destination_port"
+    SOURCE_AS = "source_as"
+    DESTINATION_AS = "destination_as"
 
 
 class IoCTypeToMatchEnum(str, enum.Enum):  # Залишається для IoC-правил
@@ -23,6 +27,17 @@ class IoCTypeToMatchEnum(str, enum.Enum):  # Залишається для IoC-
     IPV6_ADDR = "ipv6-addr"
 
 
+class ThresholdMetricEnum(str, enum.Enum):  # Що саме рахуємо в межах групи для порогових правил
+    COUNT = "count"  # Кількість подій
+    SUM = "sum"  # Сума значень поля (напр., network_bytes_total)
+    CARDINALITY = "cardinality"  # Кількість унікальних значень поля
+
+
+class RuleEvaluationModeEnum(str, enum.Enum):  # Де оцінюється порогове правило
+    BATCH = "batch"  # Періодичною агрегацією в ES під час циклу кореляції
+    STREAM = "stream"  # На потоці подій ковзними лічильниками в пам'яті
+
+
 class OffenceSeverityEnum(str, enum.Enum):
     LOW = "low"
     MEDIUM = "medium"
@@ -46,7 +61,18 @@ class CorrelationRuleTypeEnum(str, enum.Enum):
     # IOC_MATCH_HASH = "ioc_match_hash"
     THRESHOLD_LOGIN_FAILURES = "threshold_login_failures"  # Порогове для невдалих логінів
     THRESHOLD_DATA_EXFILTRATION = "threshold_data_exfiltration"  # Порогове для ексфільтрації даних
-    # SEQUENCE_OF_EVENTS = "sequence_of_events" # Для майбутніх послідовностей
+    SEQUENCE_OF_EVENTS = "sequence_of_events"  # Послідовність стадій подій для одного ключа в межах вікна
+    ANOMALY_NETFLOW_VOLUME = "anomaly_netflow_volume"  # Відхилення вихідного NetFlow-обсягу від EWMA-базової лінії
+
+
+class SequenceStage(BaseModel):  # Одна стадія правила SEQUENCE_OF_EVENTS
+    event_filter: Dict[str, Any] = Field(default_factory=dict,
+                                         description="Умови на поля події: значення, список значень або діапазон {'gte': N}")
+    min_count: int = Field(default=1, ge=1, description="Скільки подій має відповідати стадії, щоб перейти до наступної")
+    ioc_match_field: Optional[EventFieldToMatchTypeEnum] = Field(None,
+                                                                 description="Поле події, значення якого має бути активним IoC")
+
+    class Config: use_enum_values = True
 
 
 class CorrelationRuleBase(BaseModel):
@@ -75,6 +101,23 @@ class CorrelationRuleBase(BaseModel):
     # Для ексфільтрації: ['source_ip', 'destination_ip']
     aggregation_fields: Optional[List[EventFieldToMatchTypeEnum]] = Field(default_factory=list,
                                                                           description="Поля для групування перед підрахунком/сумуванням")
+    threshold_metric: Optional[ThresholdMetricEnum] = Field(None,
+                                                           description="Метрика порогового правила (за замовчуванням визначається типом правила)")
+    threshold_metric_field: Optional[EventFieldToMatchTypeEnum] = Field(None,
+                                                                        description="Поле для метрик sum/cardinality")
+    event_filter: Optional[Dict[str, Any]] = Field(None,
+                                                   description="Фільтр подій: {поле: значення або список значень}")
+    evaluation_mode: RuleEvaluationModeEnum = Field(default=RuleEvaluationModeEnum.BATCH,
+                                                    description="Режим оцінки порогового правила: batch (ES) або stream")
+
+    # Для SEQUENCE_OF_EVENTS: ключ — aggregation_fields, вікно — threshold_time_window_minutes
+    sequence_stages: Optional[List[SequenceStage]] = Field(None, description="Стадії послідовності (мінімум дві)")
+
+    # Для ANOMALY_NETFLOW_VOLUME: ключ — aggregation_fields, інтервал підсумовування — threshold_time_window_minutes
+    anomaly_sigma: Optional[float] = Field(None, gt=0, description="Поріг відхилення від середнього у сигмах (k)")
+    anomaly_alpha: Optional[float] = Field(None, gt=0, le=1, description="Коефіцієнт згладжування EWMA")
+    anomaly_min_samples: Optional[int] = Field(None, ge=1,
+                                               description="Скільки інтервалів вчитися, перш ніж генерувати офенси")
 
     # Специфічні для THRESHOLD_LOGIN_FAILURES:
     # event_type_for_login_failure: Optional[str] = Field(None, description="Значення event_type або ключове слово в message, що вказує на невдалий логін")
@@ -111,9 +154,26 @@ class CorrelationRuleUpdate(BaseModel):  # Для часткового онов
     threshold_count: Optional[int] = Field(None, gt=0)
     threshold_time_window_minutes: Optional[int] = Field(None, gt=0)
     aggregation_fields: Optional[List[EventFieldToMatchTypeEnum]] = None
+    threshold_metric: Optional[ThresholdMetricEnum] = None
+    threshold_metric_field: Optional[EventFieldToMatchTypeEnum] = None
+    event_filter: Optional[Dict[str, Any]] = None
+    evaluation_mode: Optional[RuleEvaluationModeEnum] = None
+    sequence_stages: Optional[List[SequenceStage]] = None
+    anomaly_sigma: Optional[float] = Field(None, gt=0)
+    anomaly_alpha: Optional[float] = Field(None, gt=0, le=1)
+    anomaly_min_samples: Optional[int] = Field(None, ge=1)
     generated_offence_title_template: Optional[str] = None
     generated_offence_severity: Optional[OffenceSeverityEnum] = None
 
+    @field_validator("name", "is_enabled", "rule_type", "evaluation_mode", "generated_offence_title_template",
+                     "generated_offence_severity")
+    @classmethod
+    def not_null(cls, value):
+        # Поле можна не передавати, але явний null потрапив би в NOT NULL колонку
+        if value is None:
+            raise ValueError("Field cannot be null; omit it to keep the current value.")
+        return value
+
 
 class CorrelationRuleResponse(CorrelationRuleBase):
     id: int
@@ -181,6 +241,13 @@ class OffenceResponse(OffenceBase):
         from_attributes = True
         use_enum_values = True
 
+class OffenceRollupDimensionEnum(str, enum.Enum):
+    # Значення збігаються з вимірами лічильників offence_rollups (app/modules/correlation/rollups.py)
+    SEVERITY = "severity"
+    RULE = "rule"
+    APT = "apt"
+    IOC_TYPE = "ioc_type"
+
 class OffenceSummaryResponse(BaseModel): # Pydantic схема для відповіді
     # Ключі будуть значеннями OffenceSeverityEnum (low, medium, high, critical)
     # Наприклад: {"low": 10, "medium": 5, "high": 2, "critical": 0}
@@ -190,4 +257,54 @@ class OffenceSummaryResponse(BaseModel): # Pydantic схема для відпо
     # high: int = 0
     # critical: int = 0
     # Для гнучкості, поки що Dict[str, int]
-    summary: Dict[OffenceSeverityEnum, int] # Використовуємо Enum як ключ для документації
\ No newline at end of file
+    summary: Dict[OffenceSeverityEnum, int] # Використовуємо Enum як ключ для документації
+
+
+# --- Схеми для backtest (прогін правила по історичних подіях без запису офенсів) ---
+class RuleBacktestRequest(BaseModel):
+    time_from: datetime = Field(..., description="Початок історичного діапазону (UTC)")
+    time_to: datetime = Field(..., description="Кінець історичного діапазону (UTC, не включно)")
+    max_offences: int = Field(default=100, ge=0, le=1000, description="Скільки потенційних офенсів повернути у звіті")
+    slices: int = Field(default=4, ge=1, le=16, description="Кількість паралельних слайсів PIT-сканування")
+
+
+class RuleBacktestResponse(BaseModel):
+    rule_id: int
+    rule_type: CorrelationRuleTypeEnum
+    time_from: datetime
+    time_to: datetime
+    events_scanned: int = Field(..., description="Скільки подій прочитано з ES (0 для агрегаційних правил)")
+    hit_count: int = Field(..., description="Скільки подій відповіли умовам правила")
+    would_be_offence_count: int
+    would_be_offences: List[OffenceCreate] = Field(default_factory=list)
+    truncated: bool = Field(default=False, description="Чи обрізано сканування лімітом подій")
+    runtime_ms: int
+
+
+# --- Звіт циклу кореляції ---
+class RuleExecutionStatusEnum(str, enum.Enum):
+    OK = "ok"
+    ERROR = "error"
+    TIMEOUT = "timeout"
+    CIRCUIT_OPEN = "circuit_open"
+    LOCKED = "locked"  # Завдання вже виконує інший екземпляр
+
+
+class RuleExecutionReport(BaseModel):
+    rule_id: int
+    rule_name: str
+    status: RuleExecutionStatusEnum
+    duration_ms: int
+    hits: int = Field(default=0, description="Події, що спричинили офенси (для порогових — doc_count груп)")
+    offences_created: int = 0
+    error: Optional[str] = None
+
+
+class CorrelationCycleReport(BaseModel):
+    message: str
+    started_at: datetime
+    duration_ms: int
+    rules_total: int
+    rules_failed: int
+    offences_created: int
+    rules: List[RuleExecutionReport] = Field(default_factory=list)
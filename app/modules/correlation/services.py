@@ -1,29 +1,115 @@
 # app/modules/correlation/services.py
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Iterator
 
 from elasticsearch import Elasticsearch, exceptions as es_exceptions
 from pydantic import ValidationError
-from sqlalchemy import func
+from sqlalchemy import delete, func, insert, or_, select, text, tuple_, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from app.database.postgres_models.correlation_models import CorrelationRule, Offence
+from app.core import cache_versions
+from app.core.cache import TTLCache
+from app.core.database import SessionLocal
+from app.core.pagination import encode_cursor, decode_cursor, InvalidCursorError
+from app.database.postgres_models.correlation_models import CorrelationRule, Offence, AnomalyBaseline, \
+    offence_ioc_daily_counts
 from app.modules.correlation.schemas import (
     CorrelationRuleTypeEnum,
     EventFieldToMatchTypeEnum,
     IoCTypeToMatchEnum,
-    OffenceSeverityEnum
+    OffenceSeverityEnum,
+    RuleEvaluationModeEnum,
+    RuleExecutionStatusEnum,
+    ThresholdMetricEnum
 )
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
 from app.modules.device_interaction.services import DeviceService
 from app.modules.indicators import schemas as indicator_schemas
-from app.modules.indicators.services import IndicatorService
+from app.modules.indicators.ioc_store import ioc_store
+from app.modules.indicators.services import IndicatorService, ioc_read_index
 # --- ДОДАНО: Імпорти для сервісів реагування та взаємодії з пристроями ---
 from app.modules.response.services import ResponseService
-from . import schemas as correlation_schemas
+from . import rollups, schemas as correlation_schemas
+from .engine.anomaly_baseline import AnomalyDetector, AnomalyMatch
+from .engine.backtest import TimeOrderedEventScan, build_event_query, event_epoch_seconds, iter_time_windows
+from .engine.circuit_breaker import rule_circuit_breakers
+from .engine.planner import (
+    IoCRuleGroup,
+    MAX_IOCS_PER_GROUP,
+    PER_RULE_EVENT_LIMIT,
+    TRIGGER_EVENT_SUMMARY_FIELDS,
+    es_keyword_field,
+    plan_ioc_rule_groups,
+    resolve_event_indices,
+    rule_accepts_ioc
+)
+from .engine.rule_cache import (
+    CompiledIoCGroup,
+    CompiledRuleSet,
+    CompiledThresholdRule,
+    compiled_rule_cache
+)
+from .engine.sequence_engine import SequenceEngine, SequenceMatch, event_matches_filter
+from .engine.sharding import ShardCoordinator, advisory_task_lock
+from .engine.sliding_window import SlidingWindowThresholdEvaluator
+from .engine.threshold_executor import (
+    THRESHOLD_RULE_DEFAULTS,
+    ThresholdBucket,
+    ThresholdSpec,
+    build_event_filter_clauses,
+    iter_threshold_buckets
+)
+from ..apt_groups.cache import apt_group_cache
 from ..apt_groups.services import APTGroupService
 
+# Паралельне виконання циклу кореляції
+CORRELATION_MAX_WORKERS = 8
+RULE_REQUEST_TIMEOUT_SECONDS = 30
+CORRELATION_CYCLE_TIMEOUT_SECONDS = 300
+# Рядків офенсів на одну порцію серверного курсора при експорті
+OFFENCE_EXPORT_BATCH_SIZE = 1000
+# Від скількох днів топ IoC дашборду бере повні доби з матеріалізованого знімка offence_ioc_daily_counts
+TOP_IOC_ROLLUP_MIN_DAYS = 7
+# Віджети дашборду офенсів: зміни в цьому процесі інвалідовують одразу (версія OFFENCES), з інших реплік — за TTL
+DASHBOARD_CACHE_TTL_SECONDS = 30
+dashboard_cache = TTLCache(DASHBOARD_CACHE_TTL_SECONDS)
+# Сторінка PIT-сканування значень активних IoC, поки знімок ioc_store не завантажено
+ACTIVE_IOC_VALUES_PAGE_SIZE = 5000
+# Типи, що оцінюються на потоці подій (StreamingCorrelationEngine), а не в циклі
+STREAM_RULE_TYPES = [CorrelationRuleTypeEnum.SEQUENCE_OF_EVENTS, CorrelationRuleTypeEnum.ANOMALY_NETFLOW_VOLUME]
+
+
+class CycleTaskCancellation:
+    """
+    Скасування завдання циклу після тайм-ауту. Потік не переривається, але перед збереженням офенсів
+    і запуском реагування завдання перевіряє подію cancelled. cancel() і begin_commit() атомарні між собою:
+    або цикл скасував завдання і воно нічого не зберігає, або завдання вже зберігає і цикл чекає його звіту.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._committing = False
+
+    def cancel(self) -> bool:
+        with self._lock:
+            if self._committing:
+                return False
+            self.cancelled.set()
+            return True
+
+    def begin_commit(self) -> bool:
+        with self._lock:
+            if self.cancelled.is_set():
+                return False
+            self._committing = True
+            return True
+
 
 class CorrelationService:
     # --- CRUD для CorrelationRule (без змін) ---
@@ -37,10 +123,25 @@ class CorrelationService:
             if not rule_create.threshold_count or not rule_create.threshold_time_window_minutes or not rule_create.aggregation_fields:
                 raise ValueError(
                     "For threshold rules, 'threshold_count', 'threshold_time_window_minutes', and 'aggregation_fields' are required.")
+            if rule_create.threshold_metric in [ThresholdMetricEnum.SUM, ThresholdMetricEnum.CARDINALITY] \
+                    and not rule_create.threshold_metric_field:
+                raise ValueError("For 'sum' and 'cardinality' threshold metrics, 'threshold_metric_field' is required.")
+            if rule_create.evaluation_mode == RuleEvaluationModeEnum.STREAM \
+                    and rule_create.threshold_metric == ThresholdMetricEnum.CARDINALITY:
+                raise ValueError("The 'cardinality' threshold metric is only supported in 'batch' evaluation mode.")
+        elif rule_create.rule_type == CorrelationRuleTypeEnum.SEQUENCE_OF_EVENTS:
+            if not rule_create.sequence_stages or len(rule_create.sequence_stages) < 2 \
+                    or not rule_create.aggregation_fields or not rule_create.threshold_time_window_minutes:
+                raise ValueError(
+                    "For SEQUENCE_OF_EVENTS rules, at least two 'sequence_stages', 'aggregation_fields' and 'threshold_time_window_minutes' are required.")
+        elif rule_create.rule_type == CorrelationRuleTypeEnum.ANOMALY_NETFLOW_VOLUME:
+            if not rule_create.threshold_time_window_minutes:
+                raise ValueError("For ANOMALY_NETFLOW_VOLUME rules, 'threshold_time_window_minutes' is required.")
         db_rule = CorrelationRule(**rule_create.model_dump());
         db.add(db_rule);
         db.commit();
         db.refresh(db_rule);
+        cache_versions.bump(cache_versions.CORRELATION_RULES)
         return db_rule
 
     def get_correlation_rule_by_id(self, db: Session, rule_id: int) -> Optional[CorrelationRule]:
@@ -56,33 +157,190 @@ class CorrelationService:
                                 rule_update: correlation_schemas.CorrelationRuleUpdate) -> Optional[CorrelationRule]:
         db_rule = self.get_correlation_rule_by_id(db, rule_id)
         if not db_rule: return None
+        anomaly_params_before = self._anomaly_state_params(db_rule)
         update_data = rule_update.model_dump(exclude_unset=True)
         for key, value in update_data.items(): setattr(db_rule, key, value)
+        # Інший інтервал чи поля ключа — базові лінії ANOMALY_NETFLOW_VOLUME навчаються заново
+        if anomaly_params_before != self._anomaly_state_params(db_rule):
+            self.delete_anomaly_baselines(db, [db_rule.id])
         db.add(db_rule);
         db.commit();
         db.refresh(db_rule);
+        cache_versions.bump(cache_versions.CORRELATION_RULES)
         return db_rule
 
     def delete_correlation_rule(self, db: Session, rule_id: int) -> bool:
         db_rule = self.get_correlation_rule_by_id(db, rule_id)
-        if db_rule: db.delete(db_rule); db.commit(); return True
+        if db_rule:
+            db.delete(db_rule); db.commit()
+            cache_versions.bump(cache_versions.CORRELATION_RULES)
+            return True
         return False
 
     # --- CRUD для Offence (без змін) ---
     def create_offence(self, db: Session, offence_create: correlation_schemas.OffenceCreate) -> Offence:
-        db_offence = Offence(**offence_create.model_dump());
+        offence_data = offence_create.model_dump()
+        db_offence = Offence(**offence_data);
         db.add(db_offence);
+        rollups.record_offences(db, [offence_data])
         db.commit();
         db.refresh(db_offence)
+        cache_versions.bump(cache_versions.OFFENCES)
         print(
             f"CREATED OFFENCE: ID={db_offence.id}, Title='{db_offence.title}', Severity='{db_offence.severity.value}'")
         return db_offence
 
+    def create_offences_bulk(self, db: Session, offences_create: List[correlation_schemas.OffenceCreate]) -> List[int]:
+        """
+        Зберігає пачку офенсів одним INSERT ... RETURNING в одній транзакції.
+        Повертає ID створених офенсів у тому ж порядку, що й вхідний список.
+        """
+        if not offences_create:
+            return []
+        rows = [offence_create.model_dump() for offence_create in offences_create]
+        try:
+            result = db.execute(insert(Offence).returning(Offence.id, sort_by_parameter_order=True), rows)
+            offence_ids = list(result.scalars().all())
+            rollups.record_offences(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        cache_versions.bump(cache_versions.OFFENCES)
+        print(f"CREATED OFFENCES: {len(offence_ids)} (IDs {offence_ids[0]}..{offence_ids[-1]})")
+        return offence_ids
+
+    # --- Чекпоінти базових ліній ANOMALY_NETFLOW_VOLUME ---
+    def load_anomaly_baselines(self, db: Session, rule_ids: List[int]) -> List[Tuple[int, str, float, float, int]]:
+        if not rule_ids:
+            return []
+        rows = db.query(AnomalyBaseline.correlation_rule_id, AnomalyBaseline.baseline_key, AnomalyBaseline.mean,
+                        AnomalyBaseline.variance, AnomalyBaseline.samples) \
+            .filter(AnomalyBaseline.correlation_rule_id.in_(rule_ids)).all()
+        return [tuple(row) for row in rows]
+
+    @staticmethod
+    def _anomaly_state_params(rule: CorrelationRule) -> Tuple[Any, ...]:
+        return rule.rule_type, rule.threshold_time_window_minutes, list(rule.aggregation_fields or [])
+
+    def delete_anomaly_baselines(self, db: Session, rule_ids: List[int]) -> int:
+        """Видаляє чекпоінти базових ліній правил (без commit — у транзакції того, хто викликає)."""
+        if not rule_ids:
+            return 0
+        result = db.execute(delete(AnomalyBaseline).where(AnomalyBaseline.correlation_rule_id.in_(rule_ids)))
+        return result.rowcount or 0
+
+    def save_anomaly_baselines(self, db: Session, rows: List[Tuple[int, str, float, float, int]]):
+        """Upsert змінених базових ліній одним запитом."""
+        if not rows:
+            return
+        values = [{"correlation_rule_id": r[0], "baseline_key": r[1], "mean": r[2], "variance": r[3], "samples": r[4]}
+                  for r in rows]
+        stmt = pg_insert(AnomalyBaseline).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnomalyBaseline.correlation_rule_id, AnomalyBaseline.baseline_key],
+            set_={"mean": stmt.excluded.mean, "variance": stmt.excluded.variance, "samples": stmt.excluded.samples,
+                  "updated_at": func.now()}
+        )
+        try:
+            db.execute(stmt)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def persist_rule_offences(self, db: Session, rule: CorrelationRule,
+                              offences_create: List[correlation_schemas.OffenceCreate],
+                              response_service: ResponseService, device_service: DeviceService,
+                              raise_on_error: bool = False) -> List[int]:
+        """
+        Зберігає офенси, зібрані за один прогін правила, і вже після коміту запускає реагування
+        для повернутих ID (реагування не тримає відкритою транзакцію вставки).
+        """
+        if not offences_create:
+            return []
+        try:
+            offence_ids = self.create_offences_bulk(db, offences_create)
+        except Exception as e_db:
+            print(f"CorrelationEngine: Failed to persist {len(offences_create)} offences for rule '{rule.name}': {e_db}")
+            if raise_on_error:
+                raise
+            return []
+        self._dispatch_responses(db, rule.id, offence_ids, response_service, device_service)
+        return offence_ids
+
+    def _dispatch_responses(self, db: Session, rule_id: int, offence_ids: List[int],
+                            response_service: ResponseService, device_service: DeviceService):
+        if not offence_ids or not response_service.has_enabled_pipeline_for_rule(db, rule_id):
+            return
+        offences = db.query(Offence).filter(Offence.id.in_(offence_ids)).order_by(Offence.id).all()
+        for db_offence in offences:
+            try:
+                response_service.execute_response_for_offence(db, db_offence, device_service)
+            except Exception as e_resp:
+                print(f"CorrelationEngine: Error during response execution for offence ID {db_offence.id}: {e_resp}")
+
     def get_offence_by_id(self, db: Session, offence_id: int) -> Optional[Offence]:
         return db.query(Offence).filter(Offence.id == offence_id).first()
 
-    def get_all_offences(self, db: Session, skip: int = 0, limit: int = 100) -> List[Offence]:
-        return db.query(Offence).order_by(Offence.detected_at.desc()).offset(skip).limit(limit).all()
+    @staticmethod
+    def _filtered_offences_query(db: Session, severity: Optional[OffenceSeverityEnum] = None,
+                                 status: Optional[correlation_schemas.OffenceStatusEnum] = None):
+        query = db.query(Offence)
+        if severity is not None: query = query.filter(Offence.severity == severity)
+        if status is not None: query = query.filter(Offence.status == status)
+        return query
+
+    def get_all_offences(self, db: Session, skip: int = 0, limit: int = 100,
+                         severity: Optional[OffenceSeverityEnum] = None,
+                         status: Optional[correlation_schemas.OffenceStatusEnum] = None) -> List[Offence]:
+        return self._filtered_offences_query(db, severity, status).order_by(
+            Offence.detected_at.desc(), Offence.id.desc()).offset(skip).limit(limit).all()
+
+    def get_offences_page(self, db: Session, limit: int = 100, cursor: Optional[str] = None,
+                          severity: Optional[OffenceSeverityEnum] = None,
+                          status: Optional[correlation_schemas.OffenceStatusEnum] = None
+                          ) -> Tuple[List[Offence], Optional[str]]:
+        """
+        Keyset-пагінація за (detected_at desc, id desc): наступна сторінка — рядки «після» останнього
+        рядка попередньої, тож запит іде по індексу ix_offences_detected_at_id без OFFSET. Курсор несе
+        позицію та фільтри першої сторінки. Повертає (офенси, курсор наступної сторінки або None).
+        """
+        if cursor:
+            state = decode_cursor(cursor)
+            try:
+                after_detected_at = datetime.fromisoformat(state["at"])
+                after_id = int(state["id"])
+                severity = OffenceSeverityEnum(state["sev"]) if state.get("sev") else None
+                status = correlation_schemas.OffenceStatusEnum(state["st"]) if state.get("st") else None
+            except (KeyError, TypeError, ValueError):
+                raise InvalidCursorError("Invalid offence pagination cursor.")
+        query = self._filtered_offences_query(db, severity, status)
+        if cursor:
+            query = query.filter(tuple_(Offence.detected_at, Offence.id) < (after_detected_at, after_id))
+        offences = query.order_by(Offence.detected_at.desc(), Offence.id.desc()).limit(limit).all()
+        if len(offences) < limit:
+            return offences, None
+        last = offences[-1]
+        return offences, encode_cursor({"at": last.detected_at.isoformat(), "id": last.id,
+                                        "sev": severity.value if severity else None,
+                                        "st": status.value if status else None})
+
+    def iter_offences_for_export(self, severity: Optional[OffenceSeverityEnum] = None,
+                                 status: Optional[correlation_schemas.OffenceStatusEnum] = None) -> Iterator[
+        correlation_schemas.OffenceResponse]:
+        """
+        Усі офенси під фільтром через серверний курсор (yield_per), тож у пам'яті лише одна порція рядків.
+        Сесія власна: генератор дочитується вже під час відправлення відповіді, коли сесія запиту закрита.
+        """
+        db = SessionLocal()
+        try:
+            query = self._filtered_offences_query(db, severity, status).order_by(
+                Offence.detected_at.desc(), Offence.id.desc())
+            for offence in query.yield_per(OFFENCE_EXPORT_BATCH_SIZE):
+                yield correlation_schemas.OffenceResponse.model_validate(offence)
+        finally:
+            db.close()
 
     def update_offence_status(self, db: Session, offence_id: int, status: correlation_schemas.OffenceStatusEnum,
                               notes: Optional[str] = None,
@@ -92,11 +350,14 @@ class CorrelationService:
         if not db_offence: return None
         db_offence.status = status
         if notes is not None: db_offence.notes = notes
-        if severity is not None: db_offence.severity = severity
+        if severity is not None:
+            rollups.record_severity_change(db, db_offence.detected_at, db_offence.severity, severity)
+            db_offence.severity = severity
         db_offence.updated_at = datetime.now(timezone.utc)
         db.add(db_offence);
         db.commit();
         db.refresh(db_offence);
+        cache_versions.bump(cache_versions.OFFENCES)
         return db_offence
 
     # --- Метод для завантаження дефолтних правил (якщо він тут) ---
@@ -145,26 +406,26 @@ class CorrelationService:
 
     def get_offences_summary_by_severity(self, db: Session, days_back: int) -> Dict[str, int]:
         """
-        Повертає кількість офенсів за вказаний період, згрупованих за серйозністю.
+        Повертає кількість офенсів за вказаний період, згрупованих за серйозністю (з лічильників offence_rollups).
         """
-        time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
+        def load() -> Dict[str, int]:
+            time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
+            counts = rollups.rollup_counts(db, rollups.DIMENSION_SEVERITY, time_from)
+            summary = {sev.value: 0 for sev in OffenceSeverityEnum}  # Ініціалізуємо всіма можливими серйозностями
+            summary.update({sev.value: counts.get(sev.value, 0) for sev in OffenceSeverityEnum})
+            return summary
 
-        # Використовуємо SQLAlchemy агрегацію
-        # Offence.severity - це SAEnum(OffenceSeverityEnum)
-        query_result = db.query(
-            Offence.severity,
-            func.count(Offence.id)
-        ).filter(
-            Offence.detected_at >= time_from
-        ).group_by(
-            Offence.severity
-        ).all()
-
-        summary = {sev.value: 0 for sev in OffenceSeverityEnum}  # Ініціалізуємо всіма можливими серйозностями
-        for severity_enum, count in query_result:
-            if severity_enum:  # Перевірка, що severity_enum не None
-                summary[severity_enum.value] = count
-        return summary
+        return dashboard_cache.get_or_load(("offences_by_severity", days_back), load, (cache_versions.OFFENCES,))
+
+    def get_offence_breakdown(self, db: Session, dimension: correlation_schemas.OffenceRollupDimensionEnum,
+                              days_back: int) -> Dict[str, int]:
+        """Кількість офенсів за період у розрізі виміру лічильників (severity, правило, APT, тип IoC)."""
+        def load() -> Dict[str, int]:
+            time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
+            return rollups.rollup_counts(db, dimension.value, time_from)
+
+        return dashboard_cache.get_or_load(("offence_breakdown", dimension.value, days_back), load,
+                                           (cache_versions.OFFENCES,))
 
     def get_recent_offences(self, db: Session, limit: int = 10) -> List[Offence]:
         """Повертає список останніх N офенсів."""
@@ -175,394 +436,611 @@ class CorrelationService:
         """
         Повертає топ-N IoC, на які найчастіше спрацьовували правила, на основі даних з офенсів.
         Повертає список словників: [{"ioc_value": "1.2.3.4", "ioc_type": "ipv4-addr", "trigger_count": 5}, ...]
-        """
-        time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
 
-        # Це складний запит, оскільки matched_ioc_details - це JSONB.
-        # Ми можемо або витягнути всі офенси і агрегувати в Python, або написати складний SQL.
-        # Для MVP, агрегація в Python може бути простішою.
-
-        offences_in_period = db.query(Offence.matched_ioc_details).filter(
-            Offence.detected_at >= time_from,
-            Offence.matched_ioc_details.isnot(None)  # Переконуємося, що поле не NULL
-        ).all()
-
-        ioc_counts: Dict[tuple, int] = {}  # (value, type) -> count
-        for offence_details_tuple in offences_in_period:
-            ioc_detail = offence_details_tuple[0]  # matched_ioc_details - це перший елемент кортежу
-            if isinstance(ioc_detail, dict):  # Перевірка, чи це словник
-                ioc_value = ioc_detail.get("value")
-                ioc_type = ioc_detail.get("type")  # Це вже буде рядок, бо Pydantic схема так зберігає
-                if ioc_value and ioc_type:
-                    key = (str(ioc_value), str(ioc_type))
-                    ioc_counts[key] = ioc_counts.get(key, 0) + 1
-
-        # Сортуємо та беремо топ-N
-        sorted_iocs = sorted(ioc_counts.items(), key=lambda item: item[1], reverse=True)
+        Рахується в SQL по згенерованих колонках matched_ioc_value/matched_ioc_type. Для довгих періодів
+        повні доби, що вже є в offence_ioc_daily_counts, беруться зі знімка, а з offences читаються лише
+        неповна перша доба та час після останнього оновлення знімка.
+        """
+        return dashboard_cache.get_or_load(("top_triggered_iocs", limit, days_back),
+                                           lambda: self._top_triggered_iocs(db, limit, days_back),
+                                           (cache_versions.OFFENCES,))
 
-        top_iocs = [{"ioc_value": val_type[0], "ioc_type": val_type[1], "trigger_count": count}
-                    for (val_type, count) in sorted_iocs[:limit]]
-        return top_iocs
+    def _top_triggered_iocs(self, db: Session, limit: int, days_back: int) -> List[Dict[str, Any]]:
+        time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
+        live_filter = [Offence.detected_at >= time_from, Offence.matched_ioc_value.isnot(None),
+                       Offence.matched_ioc_type.isnot(None)]
+        parts = []
+
+        if days_back >= TOP_IOC_ROLLUP_MIN_DAYS:
+            first_full_day = time_from.date() + timedelta(days=1)
+            last_rollup_day = db.query(func.max(offence_ioc_daily_counts.c.day)).scalar()
+            if last_rollup_day is not None and last_rollup_day >= first_full_day:
+                rollup_end_day = last_rollup_day + timedelta(days=1)
+                parts.append(select(offence_ioc_daily_counts.c.ioc_value, offence_ioc_daily_counts.c.ioc_type,
+                                    offence_ioc_daily_counts.c.trigger_count).where(
+                    offence_ioc_daily_counts.c.day >= first_full_day, offence_ioc_daily_counts.c.day < rollup_end_day))
+                live_filter.append(or_(
+                    Offence.detected_at < datetime.combine(first_full_day, datetime.min.time(), tzinfo=timezone.utc),
+                    Offence.detected_at >= datetime.combine(rollup_end_day, datetime.min.time(), tzinfo=timezone.utc)))
+
+        parts.append(select(Offence.matched_ioc_value.label("ioc_value"), Offence.matched_ioc_type.label("ioc_type"),
+                            func.count().label("trigger_count")).where(*live_filter).group_by(
+            Offence.matched_ioc_value, Offence.matched_ioc_type))
+        counts = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+
+        trigger_count = func.sum(counts.c.trigger_count).label("trigger_count")
+        rows = db.execute(select(counts.c.ioc_value, counts.c.ioc_type, trigger_count).group_by(
+            counts.c.ioc_value, counts.c.ioc_type).order_by(trigger_count.desc()).limit(limit)).all()
+        return [{"ioc_value": row.ioc_value, "ioc_type": row.ioc_type, "trigger_count": int(row.trigger_count)}
+                for row in rows]
+
+    def refresh_top_ioc_rollup_if_stale(self, db: Session) -> bool:
+        """
+        Оновлює offence_ioc_daily_counts, якщо в знімку ще немає вчорашньої доби. Знімок містить лише
+        повні доби, тож достатньо одного оновлення на добу; advisory lock не дає реплікам робити це разом.
+        """
+        yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+        last_rollup_day = db.query(func.max(offence_ioc_daily_counts.c.day)).scalar()
+        if last_rollup_day is not None and last_rollup_day >= yesterday:
+            return False
+        with advisory_task_lock("offence_ioc_rollup_refresh") as acquired:
+            if not acquired:
+                return False
+            db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY offence_ioc_daily_counts"))
+            db.commit()
+        print("CorrelationService: Refreshed offence_ioc_daily_counts rollup.")
+        return True
 
     def get_offences_by_apt_from_iocs(self, db: Session, apt_service: APTGroupService, days_back: int = 7) -> List[
         Dict[str, Any]]:
         """
-        Повертає кількість офенсів, згрупованих за APT.
-        Використовує attributed_apt_group_ids з matched_ioc_details в офенсах.
+        Повертає кількість офенсів, згрупованих за APT (attributed_apt_group_ids офенса).
+        Рахується з лічильників offence_rollups, назви APT — з кешу APT-груп.
         """
-        time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
-
-        offences_in_period = db.query(Offence.matched_ioc_details, Offence.attributed_apt_group_ids).filter(
-            Offence.detected_at >= time_from
-        ).all()  # Завантажуємо поле attributed_apt_group_ids з офенса
-
-        apt_offence_counts: Dict[int, Dict[str, Any]] = {}  # apt_id -> {"name": "APT Name", "count": X}
-
-        for offence_tuple in offences_in_period:
-            # attributed_apt_ids_in_offence - це список ID APT, напряму збережений в офенсі
-            attributed_apt_ids_in_offence = offence_tuple.attributed_apt_group_ids or []
-
-            # Якщо attributed_apt_group_ids не зберігається в офенсі, а тільки в matched_ioc_details:
-            # ioc_detail = offence_tuple.matched_ioc_details
-            # if isinstance(ioc_detail, dict):
-            #     apt_ids_from_ioc = ioc_detail.get("attributed_apt_group_ids", [])
-            #     if isinstance(apt_ids_from_ioc, list):
-            #         for apt_id in apt_ids_from_ioc:
-            #             # ... (логіка підрахунку)
-
-            for apt_id in attributed_apt_ids_in_offence:
-                if apt_id not in apt_offence_counts:
-                    apt_group_db = apt_service.get_apt_group_by_id(db, apt_id)
-                    apt_name = apt_group_db.name if apt_group_db else f"Unknown APT ID {apt_id}"
-                    apt_offence_counts[apt_id] = {"apt_id": apt_id, "apt_name": apt_name, "offence_count": 0}
-                apt_offence_counts[apt_id]["offence_count"] += 1
-
-        return list(apt_offence_counts.values())
+        def load() -> List[Dict[str, Any]]:
+            time_from = datetime.now(timezone.utc) - timedelta(days=days_back)
+            counts = {int(apt_id): count for apt_id, count in
+                      rollups.rollup_counts(db, rollups.DIMENSION_APT, time_from).items()}
+            apt_groups = apt_group_cache.get_many(db, counts)
+            return [{"apt_id": apt_id, "apt_name": apt_groups[apt_id].name if apt_id in apt_groups
+                     else f"Unknown APT ID {apt_id}", "offence_count": count}
+                    for apt_id, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)]
+
+        return dashboard_cache.get_or_load(("offences_by_apt", days_back), load,
+                                           (cache_versions.OFFENCES, cache_versions.APT_GROUPS))
 
     # --- Логіка Correlation Engine (оновлена з викликом ResponseService) ---
+    def _build_ioc_offence(self, rule: CorrelationRule, matched_ioc_obj: indicator_schemas.IoCResponse,
+                           event_doc: Dict[str, Any]) -> correlation_schemas.OffenceCreate:
+        event_time = event_doc.get('timestamp', 'N/A')
+        offence_title = rule.generated_offence_title_template.format(
+            ioc_value=matched_ioc_obj.value,
+            ioc_type=str(matched_ioc_obj.type),
+            event_source_ip=event_doc.get('source_ip', 'N/A'),
+            event_destination_ip=event_doc.get('destination_ip', 'N/A'),
+            event_hostname=event_doc.get('hostname', 'N/A'),
+            event=event_doc
+        )
+        trigger_event_summary_dict = {k: str(v)[:250] for k, v in event_doc.items() if
+                                      k in TRIGGER_EVENT_SUMMARY_FIELDS}
+        return correlation_schemas.OffenceCreate(
+            title=offence_title,
+            description=f"Rule '{rule.name}' matched IoC '{matched_ioc_obj.value}'. Event (reporter: {event_doc.get('reporter_ip')}, timestamp: {event_time})",
+            severity=rule.generated_offence_severity,
+            correlation_rule_id=rule.id,
+            triggering_event_summary=trigger_event_summary_dict,
+            matched_ioc_details=matched_ioc_obj.model_dump(mode='json'),
+            attributed_apt_group_ids=matched_ioc_obj.attributed_apt_group_ids or [])
+
+    def build_threshold_offence(self, rule: CorrelationRule, spec: ThresholdSpec,
+                                bucket: ThresholdBucket) -> correlation_schemas.OffenceCreate:
+        metric_value = int(bucket.value) if float(bucket.value).is_integer() else bucket.value
+        offence_title = rule.generated_offence_title_template.format(
+            aggregation_key_info=bucket.key_str,
+            actual_count=bucket.doc_count,
+            actual_sum_bytes=metric_value,
+            actual_value=metric_value,
+            time_window_minutes=spec.time_window_minutes
+        )
+        metric_name = spec.metric.value if not spec.metric_field else f"{spec.metric.value}({spec.metric_field})"
+        triggering_event_summary = {"aggregation_key": bucket.key, "count": bucket.doc_count,
+                                    "metric": metric_name, "metric_value": metric_value}
+        if spec.metric == ThresholdMetricEnum.SUM and spec.metric_field == EventFieldToMatchTypeEnum.NETWORK_BYTES_TOTAL.value:
+            triggering_event_summary["sum_bytes"] = metric_value
+        return correlation_schemas.OffenceCreate(
+            title=offence_title,
+            description=f"Rule '{rule.name}' triggered. Details: {bucket.key_str}. {metric_name} = {metric_value} (threshold {spec.threshold}) in {spec.time_window_minutes} min.",
+            severity=rule.generated_offence_severity,
+            correlation_rule_id=rule.id,
+            triggering_event_summary=triggering_event_summary
+        )
+
+    def build_sequence_offence(self, match: SequenceMatch) -> correlation_schemas.OffenceCreate:
+        rule = match.rule
+        aggregation_key_str = ", ".join(f"{k}='{v}'" for k, v in match.key.items())
+        elapsed_seconds = round(match.stage_times[-1] - match.stage_times[0], 1) if match.stage_times else 0
+        offence_title = rule.generated_offence_title_template.format(
+            aggregation_key_info=aggregation_key_str,
+            stage_count=len(match.stage_times),
+            elapsed_seconds=elapsed_seconds,
+            time_window_minutes=rule.threshold_time_window_minutes,
+            event=match.last_event
+        )
+        trigger_event_summary = {k: str(v)[:250] for k, v in match.last_event.items() if
+                                 k in TRIGGER_EVENT_SUMMARY_FIELDS}
+        return correlation_schemas.OffenceCreate(
+            title=offence_title,
+            description=f"Rule '{rule.name}' sequence completed for {aggregation_key_str}: {len(match.stage_times)} stages in {elapsed_seconds}s (window {rule.threshold_time_window_minutes} min).",
+            severity=rule.generated_offence_severity,
+            correlation_rule_id=rule.id,
+            triggering_event_summary={"aggregation_key": match.key, "stages_completed": len(match.stage_times),
+                                      "elapsed_seconds": elapsed_seconds, "last_event": trigger_event_summary}
+        )
+
+    def build_anomaly_offence(self, match: AnomalyMatch) -> correlation_schemas.OffenceCreate:
+        rule = match.rule
+        aggregation_key_str = ", ".join(f"{k}='{v}'" for k, v in match.key.items())
+        z_score = round(match.z_score, 2)
+        offence_title = rule.generated_offence_title_template.format(
+            aggregation_key_info=aggregation_key_str,
+            actual_sum_bytes=int(match.observed_bytes),
+            baseline_mean_bytes=int(match.baseline_mean),
+            baseline_stddev_bytes=int(match.baseline_stddev),
+            z_score=z_score,
+            time_window_minutes=rule.threshold_time_window_minutes
+        )
+        return correlation_schemas.OffenceCreate(
+            title=offence_title,
+            description=f"Rule '{rule.name}' detected anomalous outbound volume for {aggregation_key_str}: {int(match.observed_bytes)} bytes in {rule.threshold_time_window_minutes} min vs. baseline {int(match.baseline_mean)} ± {int(match.baseline_stddev)} (z={z_score}).",
+            severity=rule.generated_offence_severity,
+            correlation_rule_id=rule.id,
+            triggering_event_summary={"aggregation_key": match.key, "sum_bytes": int(match.observed_bytes),
+                                      "flows": match.flows, "baseline_mean_bytes": match.baseline_mean,
+                                      "baseline_stddev_bytes": match.baseline_stddev, "z_score": z_score}
+        )
+
+    def _run_threshold_rule(self, es_client: Elasticsearch, rule: CorrelationRule,
+                            time_range: Optional[Tuple[datetime, datetime]] = None,
+                            compiled: Optional[CompiledThresholdRule] = None) -> List[
+        correlation_schemas.OffenceCreate]:
+        """Узагальнений виконавець порогових правил: фільтр подій, aggregation_fields, метрика та вікно правила."""
+        if compiled is not None:
+            spec, query_body = compiled.spec, compiled.query_body
+        else:
+            spec = self._compile_threshold_spec(rule)
+            if spec is None:
+                return []
+            query_body = None
+        offences: List[correlation_schemas.OffenceCreate] = []
+        try:
+            for bucket in iter_threshold_buckets(es_client, spec, time_range, query_body=query_body):
+                offences.append(self.build_threshold_offence(rule, spec, bucket))
+        except es_exceptions.ElasticsearchWarning as e_agg:
+            # Офенси з уже оброблених сторінок агрегації все одно повертаються
+            print(f"CorrelationEngine: Error during aggregation for rule '{rule.name}': {e_agg}")
+        return offences
+
+    def _compile_threshold_spec(self, rule: CorrelationRule) -> Optional[ThresholdSpec]:
+        if not rule.threshold_count or not rule.aggregation_fields or not rule.threshold_time_window_minutes:
+            print(f"Rule '{rule.name}' {rule.rule_type.value} missing required fields.")
+            return None
+        try:
+            return ThresholdSpec.from_rule(rule)
+        except ValueError as ve:
+            print(f"CorrelationEngine: {ve}")
+            return None
+
+    def _fetch_group_iocs(self, es_client: Elasticsearch, group: IoCRuleGroup) -> Optional[
+        Dict[int, Dict[str, indicator_schemas.IoCResponse]]]:
+        """
+        IoC групи зі знімка в пам'яті (ioc_store), а поки його не завантажено — одним запитом до ES.
+        Повертає IoC, що підходять кожному правилу: rule_id -> {value: IoCResponse}.
+        """
+        if ioc_store.loaded:
+            tags = None
+            if all(rule.ioc_tags_match for rule in group.rules):
+                tags = sorted({tag for rule in group.rules for tag in rule.ioc_tags_match})
+            min_confidences = [rule.ioc_min_confidence for rule in group.rules]
+            min_confidence = min(min_confidences) if all(c is not None for c in min_confidences) else None
+            candidate_iocs = ioc_store.select(ioc_type=group.key.ioc_type, tags=tags,
+                                              min_confidence=min_confidence)[:MAX_IOCS_PER_GROUP]
+        else:
+            try:
+                relevant_iocs_resp = es_client.search(index=ioc_read_index(es_client), body=group.build_ioc_query())
+            except es_exceptions.ElasticsearchWarning as e_ioc:
+                print(f"Error fetching IoCs for rule group {group.key}: {e_ioc}")
+                return None
+            candidate_iocs = []
+            for hit in relevant_iocs_resp.get('hits', {}).get('hits', []):
+                ioc_data = hit.get('_source', {})
+                ioc_data['ioc_id'] = hit.get('_id')
+                try:
+                    candidate_iocs.append(indicator_schemas.IoCResponse(**ioc_data))
+                except ValidationError as e:
+                    print(e)
+
+        iocs_by_rule: Dict[int, Dict[str, indicator_schemas.IoCResponse]] = {rule.id: {} for rule in group.rules}
+        for ioc_obj in candidate_iocs:
+            for rule in group.rules:
+                if rule_accepts_ioc(rule, ioc_obj.tags, ioc_obj.confidence):
+                    iocs_by_rule[rule.id][ioc_obj.value] = ioc_obj
+        return iocs_by_rule
+
+    def _compile_ioc_group(self, es_client: Elasticsearch, group: IoCRuleGroup) -> Optional[CompiledIoCGroup]:
+        """Запит IoC групи, розподіл IoC по правилах і готовий агрегований запит подій (None — помилка ES)."""
+        iocs_by_rule = self._fetch_group_iocs(es_client, group)
+        if iocs_by_rule is None:
+            return None
+        values_by_field: Dict[str, set] = {}
+        for rule in group.rules:
+            values_by_field.setdefault(rule.event_field_to_match.value, set()).update(iocs_by_rule[rule.id].keys())
+        event_query_body = group.build_event_query({f: sorted(v) for f, v in values_by_field.items()})
+        return CompiledIoCGroup(group=group, iocs_by_rule=iocs_by_rule, event_query_body=event_query_body)
+
+    def _run_ioc_rule_group(self, es_client: Elasticsearch, compiled_group: CompiledIoCGroup) -> Dict[
+        int, List[correlation_schemas.OffenceCreate]]:
+        """
+        Виконує групу IOC_MATCH_IP правил одним агрегованим запитом подій (IoC групи вже розподілені
+        по правилах під час компіляції), після чого результати розподіляються по правилах у пам'яті.
+        """
+        offences_by_rule: Dict[int, List[correlation_schemas.OffenceCreate]] = {}
+        group = compiled_group.group
+        iocs_by_rule = compiled_group.iocs_by_rule
+        if not compiled_group.event_query_body:
+            return offences_by_rule
+
+        try:
+            events_resp = es_client.search(index=list(group.key.indices), body=compiled_group.event_query_body)
+        except es_exceptions.ElasticsearchWarning as e_evt:
+            print(f"CorrelationEngine: Error fetching events for rule group {group.key}: {e_evt}")
+            return offences_by_rule
+
+        aggregations = events_resp.get('aggregations', {})
+        for rule in group.rules:
+            event_field_to_check = rule.event_field_to_match.value
+            rule_iocs = iocs_by_rule[rule.id]
+            matched_pairs = []
+            for bucket in aggregations.get(f"by_{event_field_to_check}", {}).get('buckets', []):
+                matched_ioc_obj = rule_iocs.get(str(bucket.get('key')))
+                if not matched_ioc_obj:
+                    continue
+                for event_hit in bucket.get('latest_events', {}).get('hits', {}).get('hits', []):
+                    matched_pairs.append((matched_ioc_obj, event_hit.get('_source', {})))
+            # Як і раніше, не більше PER_RULE_EVENT_LIMIT найсвіжіших подій на правило
+            matched_pairs.sort(key=lambda pair: str(pair[1].get('timestamp', '')), reverse=True)
+            offences_by_rule[rule.id] = [self._build_ioc_offence(rule, ioc_obj, event_doc)
+                                         for ioc_obj, event_doc in matched_pairs[:PER_RULE_EVENT_LIMIT]]
+        return offences_by_rule
+
+    def fetch_active_ioc_values(self, es_client: Elasticsearch) -> set:
+        """Значення всіх активних IoC — для перевірки ioc_match_field у стадіях послідовностей."""
+        if ioc_store.loaded:
+            return ioc_store.active_values()
+        # Усі значення, а не перші MAX_IOCS_PER_GROUP: PIT + search_after сторінками
+        pit_id = es_client.open_point_in_time(index=ioc_read_index(es_client), keep_alive="2m")["id"]
+        body: Dict[str, Any] = {"size": ACTIVE_IOC_VALUES_PAGE_SIZE, "query": {"term": {"is_active": True}},
+                                "_source": ["value"], "pit": {"id": pit_id, "keep_alive": "2m"},
+                                "sort": [{"_shard_doc": "asc"}], "track_total_hits": False}
+        values = set()
+        try:
+            while True:
+                hits = es_client.search(body=body).get('hits', {}).get('hits', [])
+                values.update(hit['_source'].get('value') for hit in hits if hit.get('_source'))
+                if len(hits) < ACTIVE_IOC_VALUES_PAGE_SIZE:
+                    return values
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            try:
+                es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(f"CorrelationEngine: Failed to close point in time: {e}")
+
+    # --- Backtest: прогін правила по історичному діапазону без запису офенсів і без реагування ---
+    def backtest_correlation_rule(self, es_client: Elasticsearch, rule: CorrelationRule, time_from: datetime,
+                                  time_to: datetime, max_offences: int = 100,
+                                  slices: int = 4) -> correlation_schemas.RuleBacktestResponse:
+        """
+        Агрегаційні (batch) порогові правила виконуються тим самим виконавцем, що й у циклі, послідовно
+        по вікнах правила. Решта типів отримують події через PIT-сканування (паралельні слайси, злиті за часом)
+        і проганяються через свіжі екземпляри потокових автоматів, з часом події замість поточного.
+        Базові лінії аномалій стартують «холодними», тож перші anomaly_min_samples інтервалів лише навчають модель.
+        """
+        if time_to <= time_from:
+            raise ValueError("'time_to' must be after 'time_from'.")
+        started = time.monotonic()
+        indices = resolve_event_indices(rule.event_source_type)
+        offences: List[correlation_schemas.OffenceCreate] = []
+        events_scanned = 0
+        hit_count = 0
+        truncated = False
+
+        if rule.rule_type in THRESHOLD_RULE_DEFAULTS and rule.evaluation_mode != RuleEvaluationModeEnum.STREAM:
+            spec = ThresholdSpec.from_rule(rule)
+            for window_start, window_end in iter_time_windows(time_from, time_to, spec.time_window_minutes):
+                for bucket in iter_threshold_buckets(es_client, spec, (window_start, window_end)):
+                    hit_count += bucket.doc_count
+                    offence = self.build_threshold_offence(rule, spec, bucket)
+                    offence.detected_at = window_end
+                    offences.append(offence)
+
+        elif rule.rule_type == CorrelationRuleTypeEnum.IOC_MATCH_IP:
+            groups = plan_ioc_rule_groups([rule])
+            rule_iocs = (self._fetch_group_iocs(es_client, groups[0]) or {}).get(rule.id, {}) if groups else {}
+            if rule_iocs:
+                event_field = rule.event_field_to_match.value
+                events = TimeOrderedEventScan(
+                    es_client, indices,
+                    build_event_query(time_from, time_to,
+                                      [{"terms": {es_keyword_field(event_field): sorted(rule_iocs.keys())}}]),
+                    slices=slices)
+                for event in events:
+                    matched_ioc_obj = rule_iocs.get(str(event.get(event_field)))
+                    if matched_ioc_obj:
+                        hit_count += 1
+                        offence = self._build_ioc_offence(rule, matched_ioc_obj, event)
+                        offence.detected_at = datetime.fromtimestamp(event_epoch_seconds(event), tz=timezone.utc)
+                        offences.append(offence)
+                events_scanned, truncated = events.events_scanned, events.truncated
+
+        else:
+            extra_filters: List[Dict[str, Any]] = []
+            if rule.rule_type == CorrelationRuleTypeEnum.SEQUENCE_OF_EVENTS:
+                needs_iocs = any(stage.get("ioc_match_field") for stage in (rule.sequence_stages or []))
+                active_ioc_values = self.fetch_active_ioc_values(es_client) if needs_iocs else set()
+                evaluator = SequenceEngine(ioc_lookup=active_ioc_values.__contains__)
+                stage_filters = [stage.get("event_filter") or {} for stage in (rule.sequence_stages or [])]
+                is_hit = lambda event: any(event_matches_filter(event, f) for f in stage_filters)
+                build_offence = self.build_sequence_offence
+            elif rule.rule_type == CorrelationRuleTypeEnum.ANOMALY_NETFLOW_VOLUME:
+                evaluator = AnomalyDetector()
+                extra_filters.append({"exists": {"field": "network_bytes_total"}})
+                is_hit = lambda event: True
+                build_offence = self.build_anomaly_offence
+            elif rule.rule_type in THRESHOLD_RULE_DEFAULTS:
+                evaluator = SlidingWindowThresholdEvaluator()
+                spec = ThresholdSpec.from_rule(rule)
+                extra_filters.extend(build_event_filter_clauses(spec.event_filter))
+                is_hit = lambda event: True
+                build_offence = lambda match: self.build_threshold_offence(match.rule, match.spec, match.bucket)
+            else:
+                raise ValueError(f"Backtest is not supported for rule type '{rule.rule_type.value}'.")
+
+            evaluator.set_rules([rule])
+            if not evaluator.rules:
+                raise ValueError(f"Rule '{rule.name}' is not valid for evaluation; check its parameters.")
+            events = TimeOrderedEventScan(es_client, indices, build_event_query(time_from, time_to, extra_filters),
+                                          slices=slices)
+            matches = []
+            for event in events:
+                if is_hit(event):
+                    hit_count += 1
+                event_time = event_epoch_seconds(event)
+                matches.extend((event_time, match) for match in evaluator.process_event(event, now=event_time))
+            events_scanned, truncated = events.events_scanned, events.truncated
+            if isinstance(evaluator, AnomalyDetector):
+                # Закриваємо останній інтервал кожного ключа так, ніби час дійшов до кінця діапазону
+                end_time = time_to.timestamp() + max(c.slot_seconds for c in evaluator.rules.values())
+                matches.extend((time_to.timestamp(), match) for match in evaluator.close_elapsed_slots(now=end_time))
+            for event_time, match in matches:
+                offence = build_offence(match)
+                offence.detected_at = datetime.fromtimestamp(event_time, tz=timezone.utc)
+                offences.append(offence)
+
+        return correlation_schemas.RuleBacktestResponse(
+            rule_id=rule.id,
+            rule_type=rule.rule_type,
+            time_from=time_from,
+            time_to=time_to,
+            events_scanned=events_scanned,
+            hit_count=hit_count,
+            would_be_offence_count=len(offences),
+            would_be_offences=offences[:max_offences],
+            truncated=truncated,
+            runtime_ms=int((time.monotonic() - started) * 1000)
+        )
+
+    # --- Кеш скомпільованих правил ---
+    def get_compiled_rule_set(self, db: Session, es_client: Elasticsearch) -> CompiledRuleSet:
+        """
+        Повертає скомпільовані правила з кешу; перекомпілює правила лише після їх зміни,
+        а IoC-набори груп — після зміни IoC або коли вони застаріли.
+        """
+        fingerprint = tuple(db.query(func.count(CorrelationRule.id), func.max(CorrelationRule.updated_at)).one())
+        compiled = compiled_rule_cache.get_rules(fingerprint)
+        if compiled is None:
+            rules_version = cache_versions.current(cache_versions.CORRELATION_RULES)
+            active_rules = self.get_all_correlation_rules(db, only_enabled=True, limit=1000)
+            # Від'єднуємо від сесії: коміти офенсів не мають «протухати» закешовані об'єкти правил
+            for rule in active_rules:
+                db.expunge(rule)
+            compiled = CompiledRuleSet(rules_version=rules_version, rules_fingerprint=fingerprint,
+                                       active_rules=active_rules, ioc_groups=plan_ioc_rule_groups(active_rules))
+            for rule in active_rules:
+                if rule.rule_type in THRESHOLD_RULE_DEFAULTS and rule.evaluation_mode != RuleEvaluationModeEnum.STREAM:
+                    spec = self._compile_threshold_spec(rule)
+                    if spec is not None:
+                        compiled.threshold_rules[rule.id] = CompiledThresholdRule(rule=rule, spec=spec,
+                                                                                  query_body=spec.build_query())
+            compiled_rule_cache.put_rules(compiled)
+            print(f"CorrelationEngine: Compiled {len(active_rules)} rules (version {rules_version}).")
+
+        if not compiled.iocs_are_fresh():
+            iocs_version = cache_versions.current(cache_versions.IOCS)
+            compiled_groups = [self._compile_ioc_group(es_client, group) for group in compiled.ioc_groups]
+            if all(g is not None for g in compiled_groups):
+                compiled_rule_cache.put_iocs(compiled, iocs_version, compiled_groups)
+            else:
+                # Невдалий запит IoC не кешуємо: цей цикл працює з тим, що вдалося, наступний повторить
+                compiled.compiled_ioc_groups = [g for g in compiled_groups if g is not None]
+        return compiled
+
+    def _execute_cycle_task(self, es_client: Elasticsearch, task_key: str, rules: List[CorrelationRule],
+                            run: Callable[[Elasticsearch], Dict[int, List[correlation_schemas.OffenceCreate]]],
+                            response_service: ResponseService, device_service: DeviceService,
+                            cancellation: CycleTaskCancellation) -> List[correlation_schemas.RuleExecutionReport]:
+        """
+        Одне завдання циклу (порогове правило або група IoC-правил) у власному потоці: власна сесія БД,
+        тайм-аут запитів до ES і автомат-запобіжник, що тимчасово вимикає правило після повторних помилок.
+        Advisory lock за ключем завдання не дає двом екземплярам виконувати його одночасно.
+        Завдання, скасоване після тайм-ауту циклу, не зберігає офенси і не запускає реагування.
+        """
+        with advisory_task_lock(task_key) as acquired:
+            if not acquired:
+                return [correlation_schemas.RuleExecutionReport(
+                    rule_id=rule.id, rule_name=rule.name, status=RuleExecutionStatusEnum.LOCKED, duration_ms=0,
+                    error="Task is being executed by another instance") for rule in rules]
+            return self._execute_locked_cycle_task(es_client, task_key, rules, run, response_service,
+                                                   device_service, cancellation)
+
+    def _execute_locked_cycle_task(self, es_client: Elasticsearch, task_key: str, rules: List[CorrelationRule],
+                                   run: Callable[[Elasticsearch], Dict[int, List[correlation_schemas.OffenceCreate]]],
+                                   response_service: ResponseService, device_service: DeviceService,
+                                   cancellation: CycleTaskCancellation) -> List[
+        correlation_schemas.RuleExecutionReport]:
+        started = time.monotonic()
+        cancelled_reports = lambda: [correlation_schemas.RuleExecutionReport(
+            rule_id=rule.id, rule_name=rule.name, status=RuleExecutionStatusEnum.TIMEOUT,
+            duration_ms=int((time.monotonic() - started) * 1000),
+            error="Cancelled after the cycle timeout; offences were not persisted") for rule in rules]
+        if cancellation.cancelled.is_set():
+            return cancelled_reports()
+        breaker = rule_circuit_breakers.get(task_key)
+        if not breaker.allow():
+            return [correlation_schemas.RuleExecutionReport(
+                rule_id=rule.id, rule_name=rule.name, status=RuleExecutionStatusEnum.CIRCUIT_OPEN, duration_ms=0,
+                error=f"Skipped after {breaker.consecutive_failures} consecutive failures") for rule in rules]
+
+        try:
+            offences_by_rule = run(es_client.options(request_timeout=RULE_REQUEST_TIMEOUT_SECONDS))
+        except Exception as e:
+            breaker.record_failure()
+            print(f"CorrelationEngine: Task {task_key} failed: {e}")
+            duration_ms = int((time.monotonic() - started) * 1000)
+            return [correlation_schemas.RuleExecutionReport(
+                rule_id=rule.id, rule_name=rule.name, status=RuleExecutionStatusEnum.ERROR, duration_ms=duration_ms,
+                error=f"{type(e).__name__}: {e}") for rule in rules]
+        breaker.record_success()
+        if not cancellation.begin_commit():
+            print(f"CorrelationEngine: Task {task_key} finished after the cycle timeout; results discarded.")
+            return cancelled_reports()
+
+        reports: List[correlation_schemas.RuleExecutionReport] = []
+        db = SessionLocal()
+        try:
+            for rule in rules:
+                offences = offences_by_rule.get(rule.id, [])
+                hits = sum((o.triggering_event_summary or {}).get("count", 1) for o in offences)
+                status, error, offence_ids = RuleExecutionStatusEnum.OK, None, []
+                try:
+                    offence_ids = self.persist_rule_offences(db, rule, offences, response_service, device_service,
+                                                             raise_on_error=True)
+                except Exception as e_db:
+                    status, error = RuleExecutionStatusEnum.ERROR, f"{type(e_db).__name__}: {e_db}"
+                reports.append(correlation_schemas.RuleExecutionReport(
+                    rule_id=rule.id, rule_name=rule.name, status=status,
+                    duration_ms=int((time.monotonic() - started) * 1000), hits=hits,
+                    offences_created=len(offence_ids), error=error))
+        finally:
+            db.close()
+        return reports
+
     def run_correlation_cycle(self,
                               db: Session,
                               es_writer: ElasticsearchWriter,
                               indicator_service: IndicatorService,
                               device_service: DeviceService,  # <--- Додано для ResponseService
-                              response_service: ResponseService  # <--- Додано екземпляр ResponseService
-                              ):
-        print(f"\n--- Running Correlation Cycle at {datetime.now(timezone.utc)} ---")
+                              response_service: ResponseService,  # <--- Додано екземпляр ResponseService
+                              shard: Optional[ShardCoordinator] = None
+                              ) -> correlation_schemas.CorrelationCycleReport:
+        """
+        shard — координатор шардування: якщо задано, виконуються лише завдання, що належать цьому екземпляру
+        (періодичний планувальник). Ручний запуск через API виконує всі завдання.
+        """
+        started_at = datetime.now(timezone.utc)
+        started = time.monotonic()
+        print(f"\n--- Running Correlation Cycle at {started_at} ---")
+
+        def build_report(message: str, rule_reports: List[correlation_schemas.RuleExecutionReport]):
+            return correlation_schemas.CorrelationCycleReport(
+                message=message, started_at=started_at, duration_ms=int((time.monotonic() - started) * 1000),
+                rules_total=len(rule_reports),
+                rules_failed=sum(1 for r in rule_reports if r.status != RuleExecutionStatusEnum.OK),
+                offences_created=sum(r.offences_created for r in rule_reports),
+                rules=sorted(rule_reports, key=lambda r: r.rule_id))
+
         if not es_writer or not es_writer.es_client:
             print("CorrelationEngine: Elasticsearch client not available. Skipping cycle.")
-            return
+            return build_report("Elasticsearch client not available. Cycle skipped.", [])
 
         es_client: Elasticsearch = es_writer.es_client  # type: ignore
-        active_rules = self.get_all_correlation_rules(db, only_enabled=True, limit=1000)
+        compiled = self.get_compiled_rule_set(db, es_client)
+        active_rules = compiled.active_rules
         if not active_rules:
             print("CorrelationEngine: No active correlation rules found. Skipping cycle.")
-            return
+            return build_report("No active correlation rules. Cycle skipped.", [])
         print(f"CorrelationEngine: Loaded {len(active_rules)} active rules.")
 
+        # Завдання циклу: (ключ запобіжника, правила, виконавець). IoC-правила виконуються групами,
+        # правила, що оцінюються на потоці подій (StreamingCorrelationEngine), тут пропускаються.
+        tasks: List[Tuple[str, List[CorrelationRule], Callable]] = []
+        for compiled_group in compiled.compiled_ioc_groups:
+            group_key = compiled_group.group.key
+            tasks.append((f"ioc_group:{','.join(group_key.indices)}:{group_key.time_window_minutes}:{group_key.ioc_type}",
+                          compiled_group.group.rules,
+                          lambda client, cg=compiled_group: self._run_ioc_rule_group(client, cg)))
         for rule in active_rules:
-            print(f"\nCorrelationEngine: Processing rule '{rule.name}' (ID: {rule.id}, Type: {rule.rule_type.value})")
-            time_window_minutes = rule.threshold_time_window_minutes or 60
-            time_from = datetime.now(timezone.utc) - timedelta(minutes=time_window_minutes)
-
-            # --- Обробка IOC_MATCH_IP ---
-            if rule.rule_type == CorrelationRuleTypeEnum.IOC_MATCH_IP:
-                if not rule.event_field_to_match or not rule.ioc_type_to_match: print(
-                    f"Rule '{rule.name}' IOC_MATCH_IP missing fields."); continue
-                ioc_query_filters = [{"term": {"is_active": True}}]  # is_active - boolean, term працює
-
-                # Для поля 'type', оскільки воно вже типу 'keyword', .keyword не потрібен
-                if rule.ioc_type_to_match:
-                    ioc_query_filters.append(
-                        {"term": {"type": rule.ioc_type_to_match.value}}
-                    )
-
-                # Для поля 'tags', оскільки воно теж 'keyword', .keyword не потрібен
-                if rule.ioc_tags_match:
-                    # 'terms' query ефективніший для пошуку по кількох значеннях, але 'term' для кожного тегу теж працює
-                    ioc_query_filters.append({"terms": {"tags": rule.ioc_tags_match}})
-
-                if rule.ioc_min_confidence is not None:
-                    ioc_query_filters.append(
-                        {"range": {"confidence": {"gte": rule.ioc_min_confidence}}}
-                    )
-                ioc_query_body = {"query": {"bool": {"filter": ioc_query_filters}}, "size": 10000}
-                try:
-                    relevant_iocs_resp = es_client.search(index="siem-iocs-*", body=ioc_query_body)
-                    active_iocs_for_rule_map: Dict[str, indicator_schemas.IoCResponse] = {}
-                    for hit in relevant_iocs_resp.get('hits', {}).get('hits', []):
-                        ioc_data = hit.get('_source', {})
-                        ioc_data['ioc_id'] = hit.get('_id')
-                        try:
-                            ioc_obj = indicator_schemas.IoCResponse(**ioc_data)
-                            active_iocs_for_rule_map[
-                                ioc_obj.value] = ioc_obj
-                        except ValidationError as e:
-                            print(e)
-                            pass
-                except es_exceptions.ElasticsearchWarning as e_ioc:
-                    print(f"Error fetching IoCs for rule '{rule.name}': {e_ioc}")
-                    continue
-                if not active_iocs_for_rule_map: continue
-                event_field_to_check = rule.event_field_to_match.value
-                ioc_values_list = list(active_iocs_for_rule_map.keys())
-
-                # --- Зміни в логіці формування запиту ---
-
-                # 1. Список фільтрів тепер значно простіший.
-                all_event_filters = [
-                    # 1.1. Жорсткий фільтр за часом по полю `timestamp` з використанням date math.
-                    {
-                        "range": {
-                            "timestamp": {
-                                "gte": "now-1h",
-                                "lte": "now"
-                            }
-                        }
-                    },
-                    # 1.2. Фільтр наявності поля, яке перевіряється.
-                    {"exists": {"field": event_field_to_check}},
-                    # 1.3. Фільтр, що перевіряє збіг значення поля з одним з IoC.
-                    {"terms": {event_field_to_check: ioc_values_list}}
-                ]
-
-                # 2. Блок фільтрації за event_category/event_type ПОВНІСТЮ ВИДАЛЕНО,
-                #    оскільки його немає у вашому бажаному запиті.
-
-                # 3. Фінальний запит до Elasticsearch згідно вашого зразка.
-                event_query_body = {
-                    "query": {
-                        "bool": {
-                            "filter": all_event_filters
-                        }
-                    },
-                    "size": 10,  # Змінено з 200 на 10
-                    "sort": [{"timestamp": "desc"}]  # Змінено з @timestamp на timestamp
-                }
-
-                # Відлагоджувальний вивід
-                # print(f"DEBUG: Executing event search query for rule '{rule.name}':")
-                # print(json.dumps(event_query_body, indent=2))
-
-                # --- КРОК 3: Виконання запиту та обробка результатів (з мінімальними змінами) ---
-                try:
-                    events_resp = es_client.search(
-                        index=["siem-syslog-events-*", "siem-netflow-events-*"],
-                        body=event_query_body
-                    )
-                    events_to_process = [hit['_source'] for hit in events_resp.get('hits', {}).get('hits', [])]
-
-                    if not events_to_process:
-                        print("CorrelationEngine: No matching events found for this cycle.")
-
-                    for event_doc in events_to_process:
-                        field_value_in_event = event_doc.get(event_field_to_check)
-                        if str(field_value_in_event) in active_iocs_for_rule_map:
-                            matched_ioc_obj = active_iocs_for_rule_map[str(field_value_in_event)]
-                            if matched_ioc_obj:
-                                # Спрощено отримання часу, оскільки ми шукаємо тільки по 'timestamp'
-                                event_time = event_doc.get('timestamp', 'N/A')
-
-                                offence_title = rule.generated_offence_title_template.format(
-                                    ioc_value=matched_ioc_obj.value,
-                                    ioc_type=str(matched_ioc_obj.type),
-                                    event_source_ip=event_doc.get('source_ip', 'N/A'),
-                                    event_destination_ip=event_doc.get('destination_ip', 'N/A'),
-                                    event_hostname=event_doc.get('hostname', 'N/A'),
-                                    event=event_doc
-                                )
-
-                                # Спрощено словник, оскільки @timestamp більше не релевантний для запиту
-                                trigger_event_summary_dict = {k: str(v)[:250] for k, v in event_doc.items() if
-                                                              k in ['timestamp', 'reporter_ip', 'hostname',
-                                                                    'message', 'source_ip', 'destination_ip',
-                                                                    'event_category', 'event_type']}
-
-                                matched_ioc_details_dict = matched_ioc_obj.model_dump(mode='json')
-
-                                offence_create_data = correlation_schemas.OffenceCreate(title=offence_title,
-                                                                                        description=f"Rule '{rule.name}' matched IoC '{matched_ioc_obj.value}'. Event (reporter: {event_doc.get('reporter_ip')}, timestamp: {event_time})",
-                                                                                        severity=rule.generated_offence_severity,
-                                                                                        correlation_rule_id=rule.id,
-                                                                                        triggering_event_summary=trigger_event_summary_dict,
-                                                                                        matched_ioc_details=matched_ioc_details_dict,
-                                                                                        attributed_apt_group_ids=matched_ioc_obj.attributed_apt_group_ids or [])
-                                db_offence = self.create_offence(db, offence_create_data)
-                                if db_offence:
-                                    try:
-                                        response_service.execute_response_for_offence(db, db_offence, device_service)
-                                    except Exception as e_resp:
-                                        print(
-                                            f"CorrelationEngine: Error during response execution for offence ID {db_offence.id}: {e_resp}")
-
-                except es_exceptions.ElasticsearchWarning as e_evt:
-                    print(f"CorrelationEngine: Error fetching events for rule '{rule.name}': {e_evt}")
-                    # continue
-
-            # --- Обробка THRESHOLD_LOGIN_FAILURES ---
-            elif rule.rule_type == CorrelationRuleTypeEnum.THRESHOLD_LOGIN_FAILURES:
-                if not all([rule.threshold_count, rule.aggregation_fields, rule.threshold_time_window_minutes]):
-                    print(f"Rule '{rule.name}' THRESHOLD_LOGIN_FAILURES missing required fields.")
-                    # continue
-
-                # --- 1. Формування тіла запиту (виправлено) ---
-
-                # Універсальний фільтр часу, що працює з полями @timestamp та timestamp
-                threshold_query_body = {
-                    "size": 0,
-                    "query": {
-                        "bool": {
-                            "filter": [
-                                {
-                                    "bool": {
-                                        "should": [
-                                            {"range": {"@timestamp": {"gte": "now-1h"}}},
-                                            {"range": {"timestamp": {"gte": "now-1h"}}}
-                                        ],
-                                        "minimum_should_match": 1
-                                    }
-                                },
-                                {
-                                    "term": {
-                                        "event_category": "authentication"
-                                    }
-                                },
-                                {
-                                    "term": {
-                                        "event_outcome.keyword": "failure"
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "aggs": {
-                        "failed_logins_by_combination": {
-                            "composite": {
-                                "size": 1000,
-                                "sources": [
-                                    {"target_host": {"terms": {"field": "hostname.keyword"}}},
-                                    {"reporter_device": {"terms": {"field": "reporter_ip"}}}
-                                ]
-                            }
-                        }
-                    }
-                }
-
-                # print("DEBUG: Executing aggregation query:", json.dumps(threshold_query_body, indent=2))
-
-                # --- 3. Виконання запиту та обробка результатів (обробка ключів виправлена) ---
-                try:
-                    current_response = es_client.search(index=["siem-syslog-events-*", "siem-netflow-events-*"],
-                                                        body=threshold_query_body)
-
-                    # Цикл для обробки всіх сторінок результатів агрегації (пагінація)
-                    while True:
-                        aggregation_results = current_response.get('aggregations', {}).get(
-                            'failed_logins_by_combination', {})
-                        buckets = aggregation_results.get('buckets', [])
-
-                        if not buckets:
-                            break
-
-                        for bucket in buckets:
-                            failed_count = bucket.get('doc_count', 0)
-
-                            if failed_count >= rule.threshold_count:
-                                aggregation_key_dict = bucket.get('key', {})
-
-                                # Формуємо рядок з ключів агрегації (виправлено)
-                                # Тепер він буде виглядати як "hostname='host-1', reporter_ip='1.2.3.4'"
-                                aggregation_key_str = ", ".join([f"{k}='{v}'" for k, v in aggregation_key_dict.items()])
-
-                                offence_title = rule.generated_offence_title_template.format(
-                                    aggregation_key_info=aggregation_key_str,
-                                    actual_count=failed_count,
-                                    time_window_minutes=rule.threshold_time_window_minutes
-                                )
-
-                                offence_create_data = correlation_schemas.OffenceCreate(
-                                    title=offence_title,
-                                    description=f"Rule '{rule.name}' triggered. Details: {aggregation_key_str}. Count: {failed_count} failures in {rule.threshold_time_window_minutes} min.",
-                                    severity=rule.generated_offence_severity,
-                                    correlation_rule_id=rule.id,
-                                    triggering_event_summary={
-                                        "aggregation_key": aggregation_key_dict,
-                                        "count": failed_count
-                                    }
-                                )
-
-                                db_offence = self.create_offence(db, offence_create_data)
-                                # ... (логіка реагування на offence)
-
-                        # Перевіряємо, чи є наступна сторінка результатів
-                        after_key = aggregation_results.get('after_key')
-                        if not after_key:
-                            break  # Немає наступної сторінки, виходимо з циклу
-
-                        # Готуємо запит для отримання наступної сторінки
-                        threshold_query_body['aggs']['failed_logins_by_combination']['composite']['after'] = after_key
-                        current_response = es_client.search(index=["siem-syslog-events-*", "siem-netflow-events-*"],
-                                                            body=threshold_query_body)
-
-                except es_exceptions.ElasticsearchWarning as e_agg_login:
-                    print(f"CorrelationEngine: Error during aggregation for rule '{rule.name}': {e_agg_login}")
-                    # continue
-
-            # --- Обробка THRESHOLD_DATA_EXFILTRATION ---
-            elif rule.rule_type == CorrelationRuleTypeEnum.THRESHOLD_DATA_EXFILTRATION:
-                # ... (код для THRESHOLD_DATA_EXFILTRATION з попередньої відповіді, включаючи створення offence_create_data)
-                if not rule.threshold_count or not rule.aggregation_fields or not rule.threshold_time_window_minutes: print(
-                    f"Rule '{rule.name}' THRESHOLD_DATA_EXFILTRATION missing fields."); continue
-                sources_for_composite = [{"term_agg_" + str(i): {"terms": {"field": f"{field.value}.keyword"}}} for
-                                         i, field in enumerate(rule.aggregation_fields)]
-                exfil_query_body = {
-                    "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": time_from.isoformat()}}}]}},
-                    "aggs": {"exfiltration_agg": {"composite": {"sources": sources_for_composite, "size": 100},
-                                                  "aggs": {"total_bytes_sum": {"sum": {
-                                                      "field": EventFieldToMatchTypeEnum.NETWORK_BYTES_TOTAL.value}}}}},
-                    "size": 0}
-                if rule.event_source_type and not any(
-                        est in ["netflow", "flow"] for est in rule.event_source_type): print(
-                    f"Rule '{rule.name}' exfil usually uses 'netflow', found {rule.event_source_type}.")
-                try:
-                    current_response = es_client.search(index="siem-netflow-events-*", body=exfil_query_body)
-                    while True:
-                        buckets = current_response.get('aggregations', {}).get('exfiltration_agg', {}).get('buckets',
-                                                                                                           [])
-                        if not buckets: break
-                        for bucket in buckets:
-                            aggregation_key_dict = bucket.get('key', {});
-                            total_bytes = bucket.get('total_bytes_sum', {}).get('value', 0)
-                            if total_bytes >= rule.threshold_count:
-                                aggregation_key_str = ", ".join(
-                                    [f"{k.replace('term_agg_', '').split('.')[0]}='{v}'" for k, v in
-                                     aggregation_key_dict.items()])
-                                offence_title = rule.generated_offence_title_template.format(
-                                    aggregation_key_info=aggregation_key_str, actual_sum_bytes=total_bytes,
-                                    time_window_minutes=rule.threshold_time_window_minutes)
-                                offence_create_data = correlation_schemas.OffenceCreate(title=offence_title,
-                                                                                        description=f"Rule '{rule.name}' triggered: {aggregation_key_str} with {total_bytes} bytes in {rule.threshold_time_window_minutes}m.",
-                                                                                        severity=rule.generated_offence_severity,
-                                                                                        correlation_rule_id=rule.id,
-                                                                                        triggering_event_summary={
-                                                                                            "aggregation_key": aggregation_key_dict,
-                                                                                            "sum_bytes": total_bytes})
-                                db_offence = self.create_offence(db, offence_create_data)
-                                if db_offence:
-                                    try:
-                                        response_service.execute_response_for_offence(db, db_offence, device_service)
-                                    except Exception as e_resp:
-                                        print(
-                                            f"CorrelationEngine: Error response for offence ID {db_offence.id}: {e_resp}")
-                        after_key = current_response.get('aggregations', {}).get('exfiltration_agg', {}).get(
-                            'after_key')
-                        if not after_key: break
-                        exfil_query_body['aggs']['exfiltration_agg']['composite']['after'] = after_key
-                        current_response = es_client.search(index="siem-netflow-events-*", body=exfil_query_body)
-                except es_exceptions.ElasticsearchWarning as e_agg_exfil:
-                    print(f"CorrelationEngine: Error aggregation for exfil rule '{rule.name}': {e_agg_exfil}");
-                    continue
-
-            else:
+            if rule.rule_type in THRESHOLD_RULE_DEFAULTS and rule.id in compiled.threshold_rules:
+                tasks.append((f"rule:{rule.id}", [rule], lambda client, r=rule: {r.id: self._run_threshold_rule(
+                    client, r, compiled=compiled.threshold_rules[r.id])}))
+            elif rule.rule_type not in THRESHOLD_RULE_DEFAULTS and rule.rule_type not in STREAM_RULE_TYPES \
+                    and rule.rule_type != CorrelationRuleTypeEnum.IOC_MATCH_IP:
                 print(f"CorrelationEngine: Rule type '{rule.rule_type.value}' not implemented for rule '{rule.name}'.")
-
-        print(f"--- Correlation Cycle Finished at {datetime.now(timezone.utc)} ---")
+        if shard is not None:
+            total_tasks = len(tasks)
+            tasks = [task for task in tasks if shard.owns(task[0])]
+            print(f"CorrelationEngine: Instance owns {len(tasks)} of {total_tasks} tasks "
+                  f"({len(shard.members)} instances).")
+        print(f"CorrelationEngine: Executing {len(tasks)} tasks on up to {CORRELATION_MAX_WORKERS} workers.")
+
+        rule_reports: List[correlation_schemas.RuleExecutionReport] = []
+        executor = ThreadPoolExecutor(max_workers=CORRELATION_MAX_WORKERS, thread_name_prefix="correlation-task")
+        futures = {}
+        cancellations: Dict[Any, CycleTaskCancellation] = {}
+        for task_key, task_rules, run in tasks:
+            cancellation = CycleTaskCancellation()
+            future = executor.submit(self._execute_cycle_task, es_client, task_key, task_rules, run,
+                                     response_service, device_service, cancellation)
+            futures[future] = task_rules
+            cancellations[future] = cancellation
+        done, not_done = wait(futures, timeout=CORRELATION_CYCLE_TIMEOUT_SECONDS)
+        # Завдання, що вже почали зберігати офенси, не скасовуються: їхній звіт чекаємо, щоб не звітувати
+        # TIMEOUT про правило, яке все ж створить офенси
+        committing = [future for future in not_done if not cancellations[future].cancel()]
+        if committing:
+            wait(committing)
+            done = set(done) | set(committing)
+            not_done = set(not_done) - set(committing)
+        for future in done:
+            try:
+                rule_reports.extend(future.result())
+            except Exception as e:
+                # Помилка поза захищеним запобіжником тілом (напр. БД в advisory_task_lock) — звіт ERROR
+                # для правил цього завдання, решта звітів циклу зберігається
+                print(f"CorrelationEngine: Task for rules {[rule.id for rule in futures[future]]} crashed: {e}")
+                rule_reports.extend(correlation_schemas.RuleExecutionReport(
+                    rule_id=rule.id, rule_name=rule.name, status=RuleExecutionStatusEnum.ERROR, duration_ms=0,
+                    error=f"{type(e).__name__}: {e}") for rule in futures[future])
+        for future in not_done:
+            # Потік не перериваємо (його обмежує тайм-аут запитів ES), але цикл далі не чекає; скасоване
+            # завдання само відкине результати перед збереженням (CycleTaskCancellation)
+            future.cancel()
+            rule_reports.extend(correlation_schemas.RuleExecutionReport(
+                rule_id=rule.id, rule_name=rule.name, status=RuleExecutionStatusEnum.TIMEOUT,
+                duration_ms=CORRELATION_CYCLE_TIMEOUT_SECONDS * 1000,
+                error="Did not finish within the cycle timeout") for rule in futures[future])
+        executor.shutdown(wait=False)
+
+        report = build_report("Correlation cycle triggered successfully and ran.", rule_reports)
+        print(f"--- Correlation Cycle Finished at {datetime.now(timezone.utc)}: {report.rules_total} rules, "
+              f"{report.rules_failed} failed, {report.offences_created} offences in {report.duration_ms} ms ---")
+        return report
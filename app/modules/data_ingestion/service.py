@@ -1,5 +1,5 @@
 # app/modules/data_ingestion/services.py
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime, timezone
 
 from .listeners.syslog_udp_listener import SyslogUDPListener
@@ -23,6 +23,9 @@ class DataIngestionService:
                  ):
         self.syslog_normalizer = SyslogNormalizer()
 
+        # Споживачі нормалізованих подій (потокова кореляція тощо); викликаються в потоці слухача
+        self.event_observers: List[Callable[[Dict[str, Any]], None]] = []
+
         # ---> Ініціалізація ElasticsearchWriter <---
         self.elasticsearch_writer: Optional[ElasticsearchWriter] = None
         try:
@@ -64,6 +67,19 @@ class DataIngestionService:
         else:
             print("WARNING: NetFlow processing is disabled (library not available).")
 
+    def add_event_observer(self, observer: Callable[[Dict[str, Any]], None]):
+        self.event_observers.append(observer)
+
+    def _notify_event_observers(self, normalized_event: CommonEventSchema):
+        if not self.event_observers:
+            return
+        event_dict = normalized_event.model_dump(mode='json', exclude_none=True)
+        for observer in self.event_observers:
+            try:
+                observer(event_dict)
+            except Exception as e:
+                print(f"Error in event observer {observer}: {e}")
+
     def _handle_raw_syslog_message(self, raw_message_bytes: bytes, client_address: tuple):
         try:
             raw_message_str = raw_message_bytes.decode('utf-8', errors='replace').strip()
@@ -85,6 +101,7 @@ class DataIngestionService:
                             print(f"Failed to write SYSLOG event from {client_address[0]} to Elasticsearch.")
                     else:
                         print("Elasticsearch writer not available. SYSLOG event not written.")
+                    self._notify_event_observers(normalized_event)
                 else:
                     print(f"Failed to normalize parsed syslog: {parsed_data.get('raw_log', raw_message_str)[:200]}")
                     self._write_to_dead_letter_queue(raw_message_str, client_address[0], "syslog_normalization_failed")
@@ -125,6 +142,7 @@ class DataIngestionService:
                                     f"Failed to write NETFLOW event from {exporter_ip} (flow {i + 1}) to Elasticsearch.")
                         else:
                             print("Elasticsearch writer not available. NETFLOW event not written.")
+                        self._notify_event_observers(normalized_event)
                     else:
                         print(
                             f"  Failed to normalize NetFlow data for flow. Raw flow data snippet: {str(flow_data)[:200]}")
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Path, Body
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 
+from app.core import cache_versions
+from app.core.response_cache import etag_cache
 from app.core.database import get_db  # Переконайся, що get_db імпортується звідси
 from . import schemas  # Імпортуємо оновлені схеми
 from .services import DeviceService
@@ -34,7 +36,8 @@ def create_device(
         raise HTTPException(status_code=500, detail="An unexpected error occurred while creating the device.")
 
 
-@router.get("/", response_model=List[schemas.DeviceResponse], operation_id="device_interaction_read_devices")
+@router.get("/", response_model=List[schemas.DeviceResponse], operation_id="device_interaction_read_devices",
+            dependencies=[etag_cache(cache_versions.DEVICES)])
 def read_devices(
         skip: int = 0,
         limit: int = 100,
@@ -45,7 +48,8 @@ def read_devices(
     return devices
 
 
-@router.get("/{device_id}", response_model=schemas.DeviceResponse, operation_id="device_interaction_read_device")
+@router.get("/{device_id}", response_model=schemas.DeviceResponse, operation_id="device_interaction_read_device",
+            dependencies=[etag_cache(cache_versions.DEVICES)])
 def read_device(
         device_id: int = Path(..., title="The ID of the device to get", ge=1),
         db: Session = Depends(get_db),
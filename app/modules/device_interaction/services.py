@@ -11,6 +11,7 @@ from .connectors.mikrotik_connector import MikrotikConnector
 
 from app.database.postgres_models.device_models import Device, DeviceStatusEnum, DeviceTypeEnum
 from . import schemas
+from app.core import cache_versions
 from app.core.security import encrypt_data, decrypt_data
 
 CONNECTOR_MAPPING: Dict[DeviceTypeEnum, Type[BaseConnector]] = {
@@ -42,6 +43,7 @@ class DeviceService:
             try:
                 db.commit();
                 db.refresh(device_db)
+                cache_versions.bump(cache_versions.DEVICES)
             except Exception as e:
                 db.rollback();
                 print(f"Error committing status update for {device_db.name}: {e}")
@@ -280,6 +282,7 @@ class DeviceService:
         db.add(db_device)
         db.commit()
         db.refresh(db_device)
+        cache_versions.bump(cache_versions.DEVICES)
         return db_device
 
     def get_all_devices(self, db: Session, skip: int = 0, limit: int = 100) -> List[schemas.DeviceResponse]:
@@ -303,11 +306,13 @@ class DeviceService:
         db.add(device_db)
         db.commit()
         db.refresh(device_db)
+        cache_versions.bump(cache_versions.DEVICES)
         return schemas.DeviceResponse.from_orm(device_db)
 
     def delete_device(self, db: Session, device_id: int) -> bool:
         device_db = db.query(Device).filter(Device.id == device_id).first()
         if device_db: db.delete(device_db)
         db.commit()
+        cache_versions.bump(cache_versions.DEVICES)
         return True
         return False
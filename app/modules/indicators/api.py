@@ -2,16 +2,24 @@
 from typing import List, Optional, Dict
 
 from elasticsearch import exceptions as es_exceptions
-from fastapi import APIRouter, Depends, HTTPException, Query, Path, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Body, Response
 from sqlalchemy.orm import Session  # Потрібен для передачі в сервіс для валідації APT ID
 
+from app.core import cache_versions
+from app.core.response_cache import etag_cache
 from app.core.database import get_db
+from app.core.export import ExportFormatEnum, export_response
+from app.core.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, ExpiredCursorError
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
 from . import schemas
-from .services import IndicatorService
+from .ioc_store import ioc_store
+from .services import IndicatorService, IoCIdentityChangeError
 from ..apt_groups.services import APTGroupService
 from ...core.dependencies import get_es_writer
 
+# from + size понад index.max_result_window (типово 10000) Elasticsearch відхиляє
+ES_MAX_RESULT_WINDOW = 10000
+
 router = APIRouter(
     prefix="/iocs",  # Окремий префікс для IoC
     tags=["Indicators (IoCs)"]
@@ -21,17 +29,38 @@ router = APIRouter(
 @router.get("/list-all/", response_model=List[schemas.IoCResponse], summary="Get all IoCs (paginated)",
             operation_id="get_all_iocs_list")
 def get_all_iocs_api(
-        skip: int = Query(0, ge=0, description="Number of IoCs to skip"),
+        response: Response,
+        skip: int = Query(0, ge=0, description="Number of IoCs to skip (legacy offset paging, limited to the first 10k)"),
         limit: int = Query(100, ge=1, le=1000, description="Maximum number of IoCs to return"),
+        cursor: Optional[str] = Query(None, description=f"Opaque cursor from the {NEXT_CURSOR_HEADER} header of the previous page"),
+        type: Optional[schemas.IoCTypeEnum] = Query(None, description="Filter by IoC type"),
+        tag: Optional[str] = Query(None, description="Filter by tag"),
+        is_active: Optional[bool] = Query(None, description="Filter by active flag"),
         es_writer: ElasticsearchWriter = Depends(get_es_writer),
         service: IndicatorService = Depends(IndicatorService)
 ):
     """
     Отримує список всіх індикаторів компрометації з Elasticsearch з пагінацією.
+    Без skip сторінки віддаються за курсором: курсор наступної сторінки повертається в заголовку
+    X-Next-Cursor (відсутній на останній сторінці), фільтри задаються лише для першої сторінки.
     """
     try:
-        iocs = service.get_all_iocs(es_writer=es_writer, skip=skip, limit=limit)
+        if skip and not cursor:
+            if skip + limit > ES_MAX_RESULT_WINDOW:
+                raise HTTPException(status_code=400,
+                                    detail=f"skip + limit must not exceed {ES_MAX_RESULT_WINDOW}; use cursor pagination.")
+            return service.get_all_iocs(es_writer=es_writer, skip=skip, limit=limit, ioc_type=type, tag=tag,
+                                        is_active=is_active)
+        iocs, next_cursor = service.get_iocs_page(es_writer=es_writer, limit=limit, cursor=cursor, ioc_type=type,
+                                                  tag=tag, is_active=is_active)
+        if next_cursor: response.headers[NEXT_CURSOR_HEADER] = next_cursor
         return iocs
+    except HTTPException:
+        raise
+    except ExpiredCursorError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except es_exceptions.ElasticsearchWarning as es_exc:
         # TODO: Log error es_exc
         raise HTTPException(status_code=503, detail=f"Elasticsearch error retrieving all IoCs: {str(es_exc)}")
@@ -63,6 +92,24 @@ def get_iocs_created_today_api(
         raise HTTPException(status_code=500, detail=f"Failed to retrieve today's IoCs: {str(e)}")
 
 
+@router.get("/export", summary="Export IoCs as NDJSON or CSV (streamed)", operation_id="indicator_export_iocs")
+def export_iocs_api(
+        format: ExportFormatEnum = Query(ExportFormatEnum.NDJSON, description="Export format"),
+        type: Optional[schemas.IoCTypeEnum] = Query(None, description="Filter by IoC type"),
+        tag: Optional[str] = Query(None, description="Filter by tag"),
+        is_active: Optional[bool] = Query(None, description="Filter by active flag"),
+        es_writer: ElasticsearchWriter = Depends(get_es_writer),
+        service: IndicatorService = Depends(IndicatorService)
+):
+    """
+    Потоковий експорт усіх IoC під фільтром: документи читаються з ES через PIT + search_after
+    по мірі відправлення відповіді, без завантаження всієї вибірки в пам'ять.
+    """
+    iocs = service.iter_iocs_for_export(es_writer=es_writer, ioc_type=type, tag=tag, is_active=is_active)
+    return export_response((ioc.model_dump(mode="json") for ioc in iocs), format,
+                           list(schemas.IoCResponse.model_fields), "iocs")
+
+
 @router.post("/", response_model=Optional[schemas.IoCResponse], status_code=201, operation_id="add_manual_ioc")
 def add_manual_ioc_api(
         ioc_create: schemas.IoCCreate,
@@ -114,6 +161,8 @@ def update_ioc_api(
             # Якщо сервіс повернув None, це може бути 404 або 500
             raise HTTPException(status_code=404,
                                 detail=f"IoC with ES ID '{ioc_elasticsearch_id}' not found or update failed.")
+    except IoCIdentityChangeError as ice:
+        raise HTTPException(status_code=422, detail=str(ice))
     except ValueError as ve:  # Наприклад, якщо APT ID не знайдено
         raise HTTPException(status_code=400, detail=str(ve))
     except es_exceptions.ElasticsearchWarning as es_exc:
@@ -162,6 +211,23 @@ def search_iocs_api(value: str = Query(..., description="Value of the IoC to sea
         raise HTTPException(status_code=500, detail=f"Failed to search IoCs: {str(e)}")
 
 
+@router.post("/lookup", response_model=schemas.IoCLookupResponse, operation_id="indicator_lookup_iocs",
+             summary="Bulk lookup of IoCs by value (mixed types)")
+def lookup_iocs_api(lookup: schemas.IoCLookupRequest,
+                    db: Session = Depends(get_db),
+                    es_writer: ElasticsearchWriter = Depends(get_es_writer),
+                    service: IndicatorService = Depends(IndicatorService),
+                    apt_service: APTGroupService = Depends(APTGroupService)):
+    try:
+        return service.lookup_iocs(db=db, es_writer=es_writer, lookup=lookup, apt_service=apt_service)
+    except es_exceptions.ApiError as es_exc:
+        raise HTTPException(status_code=503, detail=f"Elasticsearch lookup error: {str(es_exc)}")
+    except ConnectionError as ce:
+        raise HTTPException(status_code=503, detail=str(ce))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to look up IoCs: {str(e)}")
+
+
 @router.post("/{ioc_elasticsearch_id}/link-apt/{apt_group_id}", response_model=Optional[schemas.IoCResponse],
              operation_id="link_ioc_to_apt")
 def link_ioc_to_apt_api(
@@ -194,7 +260,7 @@ def link_ioc_to_apt_api(
 @router.get("/dashboard/summary_by_type",
             response_model=Dict[str, int],  # Повертає {"ipv4-addr": X, "domain-name": Y, ...}
             summary="Get active IoC counts grouped by type",
-            operation_id="dashboard_get_ioc_summary_type")
+            operation_id="dashboard_get_ioc_summary_type", dependencies=[etag_cache(cache_versions.IOCS)])
 def get_ioc_summary_by_type_api(
         es_writer: ElasticsearchWriter = Depends(get_es_writer),  # Використовуємо спільну залежність
         service: IndicatorService = Depends(IndicatorService)
@@ -207,7 +273,7 @@ def get_ioc_summary_by_type_api(
         raise HTTPException(status_code=500, detail=f"Failed to get IoC summary: {str(e)}")
 
 
-@router.get("/tags/unique", response_model=List[str])
+@router.get("/tags/unique", response_model=List[str], dependencies=[etag_cache(cache_versions.IOCS)])
 def get_unique_indicator_tags(
         es_writer: ElasticsearchWriter = Depends(get_es_writer),  # Отримуємо клієнт ES через залежність
         service: IndicatorService = Depends(IndicatorService)  # Отримуємо екземпляр сервісу
@@ -228,3 +294,8 @@ def get_unique_indicator_tags(
             status_code=500,
             detail=f"An internal error occurred while fetching tags: {e}"
         )
+
+
+@router.get("/store/stats", summary="In-memory IoC snapshot statistics", operation_id="indicator_ioc_store_stats")
+def get_ioc_store_stats():
+    return ioc_store.stats()
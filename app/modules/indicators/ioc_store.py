@@ -0,0 +1,257 @@
+# app/modules/indicators/ioc_store.py
+import bisect
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, Iterable
+
+from elasticsearch import Elasticsearch
+
+from . import schemas as indicator_schemas
+
+IOC_STORE_PAGE_SIZE = 5000
+IOC_STORE_REFRESH_SECONDS = 30
+# Інкрементальне оновлення не бачить видалень, зроблених іншими процесами, — їх підбирає повне перезавантаження
+IOC_STORE_FULL_RELOAD_SECONDS = 3600
+# Перекриття вікна інкрементального оновлення на випадок розбіжності годинників і затримки refresh в ES
+IOC_STORE_SYNC_OVERLAP = timedelta(seconds=30)
+PIT_KEEP_ALIVE = "2m"
+
+HitParser = Callable[[Dict[str, Any]], Optional[indicator_schemas.IoCResponse]]
+
+
+def _type_key(ioc_type: Any) -> str:
+    return ioc_type.value if hasattr(ioc_type, "value") else str(ioc_type)
+
+
+class IoCStore:
+    """
+    Знімок усіх IoC у пам'яті процесу: мапи значень за типом, інвертовані індекси тегів і APT,
+    масив, відсортований за впевненістю. Завантажується один раз через PIT + search_after і далі
+    оновлюється інкрементально за updated_at_siem. Доки знімок не завантажено, споживачі йдуть в ES.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id: Dict[str, indicator_schemas.IoCResponse] = {}
+        self._by_type: Dict[str, Dict[str, Set[str]]] = {}
+        self._by_tag: Dict[str, Set[str]] = {}
+        self._by_apt: Dict[int, Set[str]] = {}
+        # (-confidence, ioc_id): від найвищої впевненості до найнижчої; IoC без впевненості — в кінці
+        self._by_confidence: List[Tuple[int, str]] = []
+        # Лічильник активних IoC за типом, що ведеться при індексації (для дашборду без агрегацій ES)
+        self._active_by_type: Dict[str, int] = {}
+        self.loaded = False
+        self.last_sync: Optional[datetime] = None
+        self.last_full_load_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Індексація ---
+    @staticmethod
+    def _confidence_key(ioc: indicator_schemas.IoCResponse) -> Tuple[int, str]:
+        return (-(ioc.confidence if ioc.confidence is not None else -1), ioc.ioc_id)
+
+    def _index(self, ioc: indicator_schemas.IoCResponse, keep_sorted: bool = True):
+        self._by_id[ioc.ioc_id] = ioc
+        self._by_type.setdefault(_type_key(ioc.type), {}).setdefault(ioc.value, set()).add(ioc.ioc_id)
+        for tag in ioc.tags or []:
+            self._by_tag.setdefault(tag, set()).add(ioc.ioc_id)
+        for apt_id in ioc.attributed_apt_group_ids or []:
+            self._by_apt.setdefault(apt_id, set()).add(ioc.ioc_id)
+        if keep_sorted:
+            bisect.insort(self._by_confidence, self._confidence_key(ioc))
+        else:
+            self._by_confidence.append(self._confidence_key(ioc))
+        if ioc.is_active:
+            type_key = _type_key(ioc.type)
+            self._active_by_type[type_key] = self._active_by_type.get(type_key, 0) + 1
+
+    def _unindex(self, ioc_id: str):
+        ioc = self._by_id.pop(ioc_id, None)
+        if ioc is None:
+            return
+        values = self._by_type.get(_type_key(ioc.type), {})
+        ids = values.get(ioc.value)
+        if ids is not None:
+            ids.discard(ioc_id)
+            if not ids:
+                del values[ioc.value]
+        for index, keys in ((self._by_tag, ioc.tags or []), (self._by_apt, ioc.attributed_apt_group_ids or [])):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(ioc_id)
+                    if not ids:
+                        del index[key]
+        conf_key = self._confidence_key(ioc)
+        pos = bisect.bisect_left(self._by_confidence, conf_key)
+        if pos < len(self._by_confidence) and self._by_confidence[pos] == conf_key:
+            del self._by_confidence[pos]
+        if ioc.is_active:
+            type_key = _type_key(ioc.type)
+            remaining = self._active_by_type.get(type_key, 0) - 1
+            if remaining > 0:
+                self._active_by_type[type_key] = remaining
+            else:
+                self._active_by_type.pop(type_key, None)
+
+    def upsert(self, ioc: indicator_schemas.IoCResponse):
+        with self._lock:
+            self._unindex(ioc.ioc_id)
+            self._index(ioc)
+
+    def remove(self, ioc_id: str):
+        with self._lock:
+            self._unindex(ioc_id)
+
+    def remove_apt_id(self, apt_group_id: int):
+        """Дзеркалить update_by_query, що відв'язує APT-групу від усіх IoC."""
+        with self._lock:
+            for ioc_id in list(self._by_apt.get(apt_group_id, ())):
+                ioc = self._by_id[ioc_id]
+                remaining = [i for i in ioc.attributed_apt_group_ids if i != apt_group_id]
+                self.upsert(ioc.model_copy(update={"attributed_apt_group_ids": remaining}))
+
+    # --- Завантаження з ES ---
+    def _scan(self, es_client: Elasticsearch, index: str, query: Dict[str, Any], parse_hit: HitParser) -> List[
+        indicator_schemas.IoCResponse]:
+        pit_id = es_client.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE)["id"]
+        iocs: List[indicator_schemas.IoCResponse] = []
+        body: Dict[str, Any] = {"size": IOC_STORE_PAGE_SIZE, "query": query,
+                                "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                                "sort": [{"_shard_doc": "asc"}], "track_total_hits": False}
+        try:
+            while True:
+                hits = es_client.search(body=body).get('hits', {}).get('hits', [])
+                for hit in hits:
+                    ioc = parse_hit(hit)
+                    if ioc:
+                        iocs.append(ioc)
+                if len(hits) < IOC_STORE_PAGE_SIZE:
+                    return iocs
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            try:
+                es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(f"IoCStore: Failed to close point in time: {e}")
+
+    def load(self, es_client: Elasticsearch, index: str, parse_hit: HitParser):
+        sync_started = datetime.now(timezone.utc)
+        iocs = self._scan(es_client, index, {"match_all": {}}, parse_hit)
+        # Індекси будуються поза блокуванням (масив впевненості сортується один раз, а не insort на кожен IoC),
+        # а під блокуванням лише підміняються — читачі, зокрема рушій кореляції, не чекають на побудову
+        fresh = IoCStore()
+        # Дублікати ID між щоденними індексами — лишається останній
+        for ioc in {ioc.ioc_id: ioc for ioc in iocs}.values():
+            fresh._index(ioc, keep_sorted=False)
+        fresh._by_confidence.sort()
+        with self._lock:
+            self._by_id, self._by_type = fresh._by_id, fresh._by_type
+            self._by_tag, self._by_apt = fresh._by_tag, fresh._by_apt
+            self._by_confidence, self._active_by_type = fresh._by_confidence, fresh._active_by_type
+            self.last_sync = sync_started
+            self.last_full_load_at = time.monotonic()
+            self.loaded = True
+        print(f"IoCStore: Loaded {len(self._by_id)} IoCs into memory.")
+
+    def refresh(self, es_client: Elasticsearch, index: str, parse_hit: HitParser) -> int:
+        if not self.loaded or time.monotonic() - self.last_full_load_at >= IOC_STORE_FULL_RELOAD_SECONDS:
+            self.load(es_client, index, parse_hit)
+            return len(self._by_id)
+        sync_started = datetime.now(timezone.utc)
+        since = (self.last_sync - IOC_STORE_SYNC_OVERLAP).isoformat()
+        changed = self._scan(es_client, index, {"range": {"updated_at_siem": {"gt": since}}}, parse_hit)
+        for ioc in changed:
+            self.upsert(ioc)
+        self.last_sync = sync_started
+        return len(changed)
+
+    def start(self, es_client_factory: Callable[[], Elasticsearch], resolve_index: Callable[[Elasticsearch], str],
+              parse_hit: HitParser):
+        """Фонове завантаження та періодичне оновлення знімка; resolve_index дає індекс IoC для читання."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+
+        def run():
+            es_client = None
+            while True:
+                try:
+                    es_client = es_client or es_client_factory()
+                    self.refresh(es_client, resolve_index(es_client), parse_hit)
+                except Exception as e:
+                    print(f"IoCStore: Refresh failed: {e}")
+                if self._stop_event.wait(IOC_STORE_REFRESH_SECONDS):
+                    return
+
+        self._thread = threading.Thread(target=run, name="ioc-store-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    # --- Запити ---
+    def _resolve(self, ids: Iterable[str]) -> List[indicator_schemas.IoCResponse]:
+        return [self._by_id[i] for i in ids if i in self._by_id]
+
+    def find_by_value(self, value: str, ioc_type: Optional[Any] = None) -> List[indicator_schemas.IoCResponse]:
+        with self._lock:
+            type_keys = [_type_key(ioc_type)] if ioc_type else list(self._by_type)
+            return [ioc for t in type_keys for ioc in self._resolve(self._by_type.get(t, {}).get(value, ()))]
+
+    def find_by_apt(self, apt_group_id: int) -> List[indicator_schemas.IoCResponse]:
+        with self._lock:
+            return self._resolve(self._by_apt.get(apt_group_id, ()))
+
+    def find_by_tag(self, tag: str) -> List[indicator_schemas.IoCResponse]:
+        with self._lock:
+            return self._resolve(self._by_tag.get(tag, ()))
+
+    def select(self, ioc_type: Optional[Any] = None, tags: Optional[List[str]] = None,
+               min_confidence: Optional[int] = None, only_active: bool = True) -> List[
+        indicator_schemas.IoCResponse]:
+        """IoC за типом, будь-яким із тегів і мінімальною впевненістю (від найвищої впевненості)."""
+        with self._lock:
+            if min_confidence is not None:
+                cutoff = bisect.bisect_right(self._by_confidence, (-min_confidence, "￿"))
+                candidate_ids = [ioc_id for _, ioc_id in self._by_confidence[:cutoff]]
+            else:
+                candidate_ids = [ioc_id for _, ioc_id in self._by_confidence]
+            if tags:
+                tagged_ids = set().union(*(self._by_tag.get(tag, set()) for tag in tags))
+                candidate_ids = [i for i in candidate_ids if i in tagged_ids]
+            type_key = _type_key(ioc_type) if ioc_type else None
+            result = []
+            for ioc in self._resolve(candidate_ids):
+                if only_active and not ioc.is_active:
+                    continue
+                if type_key and _type_key(ioc.type) != type_key:
+                    continue
+                result.append(ioc)
+            return result
+
+    def active_values(self) -> Set[str]:
+        with self._lock:
+            return {ioc.value for ioc in self._by_id.values() if ioc.is_active}
+
+    def active_count_by_type(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._active_by_type)
+
+    def tags(self) -> List[str]:
+        with self._lock:
+            return sorted(self._by_tag)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"loaded": self.loaded, "iocs": len(self._by_id),
+                    "by_type": {t: len(values) for t, values in self._by_type.items()},
+                    "tags": len(self._by_tag), "apt_groups": len(self._by_apt),
+                    "last_sync": self.last_sync.isoformat() if self.last_sync else None}
+
+
+ioc_store = IoCStore()
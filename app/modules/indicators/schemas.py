@@ -64,6 +64,35 @@ class APTGroupBasicInfo(BaseModel):
 class AttributedIoCResponse(IoCResponse):
     attributed_apts: List[APTGroupBasicInfo] = Field(default_factory=list)
 
+# --- Масовий пошук IoC за значеннями (збагачення таблиць подій/потоків за один запит) ---
+MAX_LOOKUP_ITEMS = 10000
+
+class IoCLookupItem(BaseModel):
+    value: str
+    type: Optional[IoCTypeEnum] = Field(None, description="Тип IoC; без типу шукається значення будь-якого типу")
+
+class IoCLookupRequest(BaseModel):
+    items: List[IoCLookupItem] = Field(..., min_length=1, max_length=MAX_LOOKUP_ITEMS)
+    only_active: bool = Field(default=True, description="Повертати лише активні IoC")
+
+class IoCLookupMatch(BaseModel):
+    value: str
+    type: IoCTypeEnum
+    ioc_id: str
+    is_active: bool
+    confidence: Optional[int] = None
+    tags: List[str] = Field(default_factory=list)
+    source_name: Optional[str] = None
+    last_seen: Optional[datetime] = None
+    attributed_apts: List[APTGroupBasicInfo] = Field(default_factory=list)
+
+    class Config:
+        use_enum_values = True
+
+class IoCLookupResponse(BaseModel):
+    matches: List[IoCLookupMatch]
+    not_found: List[str] = Field(default_factory=list, description="Значення, для яких IoC не знайдено")
+
 # Схема для тіла запиту при зв'язуванні IoC з APT (якщо потрібен окремий ендпоінт)
 # Наразі не використовується, оскільки зв'язування відбувається через attributed_apt_group_ids в IoCCreate/IoCUpdate
 # class LinkIoCToAPTRequest(BaseModel):
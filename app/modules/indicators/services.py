@@ -1,11 +1,16 @@
 # app/modules/indicators/services.py
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any, Union, TYPE_CHECKING
+from typing import List, Optional, Dict, Any, Union, Iterable, Iterator, Tuple, TYPE_CHECKING
 from datetime import datetime, timezone, date as date_type, timedelta
+import hashlib
 import json
 import enum
 
 from . import schemas as indicator_schemas, schemas
+from .ioc_store import ioc_store
+from app.core import cache_versions
+from app.core.config import settings
+from app.core.pagination import encode_cursor, decode_cursor, InvalidCursorError, ExpiredCursorError
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
 from elasticsearch import Elasticsearch, exceptions as es_exceptions
 from pydantic import ValidationError
@@ -13,7 +18,96 @@ from pydantic import ValidationError
 # Для type hinting та доступу до APTGroupService для отримання імен/валідації APT
 if TYPE_CHECKING:
     from app.modules.apt_groups.services import APTGroupService
-    from app.database.postgres_models.threat_actor_models import APTGroup
+
+# Усі IoC живуть в одному індексі за аліасом, тож документ за ID — це прямий GET без пошуку по щоденних індексах.
+# Масовий імпорт використовує детермінований ID, тож повторний імпорт фіду оновлює, а не дублює.
+IOC_INDEX = "siem-iocs-store"
+IOC_INDEX_ALIAS = "siem-iocs"
+# Шаблон, що охоплює і новий індекс, і старі щоденні; для читання — лише з settings.IOC_READ_LEGACY_INDICES,
+# бо після migrate_ioc_indices без --delete-old кожен перенесений IoC знайшовся б двічі
+IOC_LEGACY_INDEX_PATTERN = "siem-iocs-*"
+IOC_BULK_BATCH_SIZE = 1000
+# Значень в одному terms-запиті масового пошуку (так, щоб усі збіги вмістились в одну сторінку)
+IOC_LOOKUP_TERMS_CHUNK = 2000
+# PIT курсорної пагінації списку IoC живе стільки між запитами сторінок
+IOC_PAGE_PIT_KEEP_ALIVE = "2m"
+IOC_EXPORT_PAGE_SIZE = 1000
+# Відв'язування APT від IoC: швидкість фонової задачі update_by_query (документів за секунду)
+APT_UNLINK_REQUESTS_PER_SECOND = 2000
+APT_UNLINK_SCRIPT = """
+ctx._source.attributed_apt_group_ids.removeIf(id -> id.longValue() == params.apt_id_to_remove.longValue());
+ctx._source.updated_at_siem = params.now;
+"""
+_ioc_index_ready = False
+
+# Scripted upsert: новий документ береться з params.doc цілком; в існуючому теги й APT ID об'єднуються,
+# last_seen лише зсувається вперед, а описові поля перезаписуються значеннями з фіду
+IOC_BULK_UPSERT_SCRIPT = """
+if (ctx._source.value == null) {
+    ctx._source.putAll(params.doc);
+} else {
+    Set tags = new LinkedHashSet();
+    if (ctx._source.tags != null) { tags.addAll(ctx._source.tags); }
+    tags.addAll(params.doc.tags);
+    ctx._source.tags = new ArrayList(tags);
+    Set aptIds = new LinkedHashSet();
+    if (ctx._source.attributed_apt_group_ids != null) { aptIds.addAll(ctx._source.attributed_apt_group_ids); }
+    aptIds.addAll(params.doc.attributed_apt_group_ids);
+    ctx._source.attributed_apt_group_ids = new ArrayList(aptIds);
+    if (params.doc.last_seen != null && (ctx._source.last_seen == null || params.doc.last_seen.compareTo(ctx._source.last_seen) > 0)) {
+        ctx._source.last_seen = params.doc.last_seen;
+        ctx._source['@timestamp'] = params.doc.last_seen;
+    }
+    if (ctx._source.first_seen == null) { ctx._source.first_seen = params.doc.first_seen; }
+    for (String f : params.overwrite_fields) {
+        if (params.doc.containsKey(f)) { ctx._source[f] = params.doc[f]; }
+    }
+    ctx._source.updated_at_siem = params.doc.updated_at_siem;
+}
+"""
+IOC_BULK_OVERWRITE_FIELDS = ["description", "source_name", "is_active", "confidence", "seen_in_feed_at"]
+# Коли SIEM востаннє бачив IoC у фіді (час отримання, а не дата з фіду, як last_seen). За ним рахується
+# TTL-прострочення, його ж оновлює «touch» незмінених записів і зберігає знімок джерела
+IOC_SEEN_IN_FEED_FIELD = "seen_in_feed_at"
+
+
+class IoCIdentityChangeError(ValueError):
+    """Спроба змінити value чи type існуючого IoC: від них залежить ID документа, тож це новий індикатор."""
+
+
+def ioc_document_id(ioc_type: Any, value: str) -> str:
+    """Детермінований ID документа IoC: sha1 від "тип:значення"."""
+    type_str = ioc_type.value if isinstance(ioc_type, enum.Enum) else str(ioc_type)
+    return hashlib.sha1(f"{type_str}:{value}".encode("utf-8")).hexdigest()
+
+
+def ensure_ioc_index(es_client: Elasticsearch) -> str:
+    """Створює індекс IoC з аліасом (один раз на процес) і повертає аліас для читання й запису."""
+    global _ioc_index_ready
+    if not _ioc_index_ready:
+        try:
+            if not es_client.indices.exists_alias(name=IOC_INDEX_ALIAS):
+                if es_client.indices.exists(index=IOC_INDEX):
+                    es_client.indices.put_alias(index=IOC_INDEX, name=IOC_INDEX_ALIAS)
+                else:
+                    es_client.indices.create(index=IOC_INDEX, aliases={IOC_INDEX_ALIAS: {"is_write_index": True}})
+        except es_exceptions.BadRequestError as e:
+            # Інший процес встиг створити індекс першим
+            if "resource_already_exists_exception" not in str(e): raise
+        _ioc_index_ready = True
+    return IOC_INDEX_ALIAS
+
+
+def ioc_read_index(es_client: Elasticsearch) -> str:
+    """Індекс для пошуку, агрегацій і update_by_query по IoC: аліас або, явно, ще й старі щоденні індекси."""
+    if settings.IOC_READ_LEGACY_INDICES:
+        return IOC_LEGACY_INDEX_PATTERN
+    return ensure_ioc_index(es_client)
+
+
+def _apt_tag(apt_name: str) -> str:
+    safe_apt_name = "".join(c if c.isalnum() else '_' for c in apt_name).lower()
+    return f"apt:{safe_apt_name}"
 
 
 class IndicatorService:
@@ -95,11 +189,8 @@ class IndicatorService:
             current_tags_set.update(str(t) for t in existing_doc.get("tags", []))
 
         if apt_ids_to_process:
-            for apt_id_val in apt_ids_to_process:
-                apt_group_db_obj: Optional['APTGroup'] = apt_service.get_apt_group_by_id(db, apt_id_val)
-                if apt_group_db_obj:
-                    safe_apt_name = "".join(c if c.isalnum() else '_' for c in apt_group_db_obj.name).lower()
-                    current_tags_set.add(f"apt:{safe_apt_name}")
+            apt_names = apt_service.get_apt_group_names_by_ids(db, apt_ids_to_process)
+            current_tags_set.update(_apt_tag(apt_name) for apt_name in apt_names.values())
         doc_to_index["tags"] = sorted(list(current_tags_set))
 
         return doc_to_index
@@ -143,18 +234,15 @@ class IndicatorService:
         if not es_writer or not es_writer.es_client: return None
         valid_apt_ids = []
         if ioc_create_data.attributed_apt_group_ids:
+            known_apt_names = apt_service.get_apt_group_names_by_ids(db, ioc_create_data.attributed_apt_group_ids)
             for apt_id in ioc_create_data.attributed_apt_group_ids:
-                if not apt_service.get_apt_group_by_id(db, apt_id):
+                if apt_id not in known_apt_names:
                     print(f"Warning: APT ID {apt_id} for IoC '{ioc_create_data.value}' not found. Skipping.")
                 else:
                     valid_apt_ids.append(apt_id)
         ioc_create_data.attributed_apt_group_ids = valid_apt_ids
 
         ioc_doc_internal = self._prepare_ioc_document_for_es(db, apt_service, ioc_create_data)
-        timestamp_for_index_name = ioc_doc_internal.get('timestamp', datetime.now(timezone.utc))
-        if not isinstance(timestamp_for_index_name, datetime):
-            timestamp_for_index_name = datetime.now(timezone.utc)
-
         doc_payload_for_es = {}
         for k, v in ioc_doc_internal.items():
             if isinstance(v, datetime):
@@ -168,26 +256,27 @@ class IndicatorService:
         if '@timestamp' not in doc_payload_for_es and 'timestamp' in ioc_doc_internal:
             doc_payload_for_es['@timestamp'] = ioc_doc_internal['timestamp'].isoformat()
 
+        # Той самий детермінований ID і scripted upsert, що й у масовому імпорті: ручне додавання наявного
+        # (тип, значення) зливається з документом фіду, а не створює другий
+        doc_payload_for_es = {k: v for k, v in doc_payload_for_es.items() if v is not None}
+        doc_payload_for_es.setdefault("tags", [])
+        doc_payload_for_es.setdefault("attributed_apt_group_ids", [])
+        ioc_es_id = ioc_document_id(ioc_create_data.type, ioc_create_data.value)
         try:
-            target_index = es_writer._generate_index_name("siem-iocs", timestamp_for_index_name)
-            resp = es_writer.es_client.index(index=target_index, document=doc_payload_for_es)
-            if resp.get('result') in ['created', 'updated']:
-                ioc_es_id = resp.get('_id')
-                # Створюємо відповідь на основі ioc_doc_internal (де дати ще datetime)
-                response_data_dict = ioc_doc_internal.copy()
-                response_data_dict['ioc_id'] = ioc_es_id
-                response_data_dict['created_at_siem'] = ioc_doc_internal["created_at_siem"]  # Вже datetime
-                response_data_dict['updated_at_siem'] = ioc_doc_internal["updated_at_siem"]  # Вже datetime
-                # Тип IoC для відповіді має бути Enum, якщо він був таким у ioc_create_data
-                response_data_dict['type'] = ioc_create_data.type
-                # tags та attributed_apt_group_ids вже оновлені в ioc_doc_internal
-
-                # Поля, які можуть бути відсутні в ioc_doc_internal, але є в IoCBase
-                for base_field in indicator_schemas.IoCBase.model_fields.keys():
-                    if base_field not in response_data_dict:
-                        response_data_dict[base_field] = getattr(ioc_create_data, base_field)
-
-                return indicator_schemas.IoCResponse(**response_data_dict)
+            target_index = ensure_ioc_index(es_writer.es_client)
+            resp = es_writer.es_client.update(
+                index=target_index, id=ioc_es_id, scripted_upsert=True, upsert={}, retry_on_conflict=3,
+                script={"source": IOC_BULK_UPSERT_SCRIPT, "lang": "painless",
+                        "params": {"doc": doc_payload_for_es, "overwrite_fields": IOC_BULK_OVERWRITE_FIELDS}},
+                source=True)
+            if resp.get('result') in ['created', 'updated', 'noop']:
+                cache_versions.bump(cache_versions.IOCS)
+                # Відповідь — з підсумкового документа (теги й APT ID могли злитися з наявними)
+                created_ioc = self._parse_ioc_hit_to_response(
+                    {"_id": ioc_es_id, "_source": resp.get('get', {}).get('_source', {})})
+                if created_ioc:
+                    ioc_store.upsert(created_ioc)
+                return created_ioc
             else:
                 print(f"Failed to index IoC. Response: {resp}");
                 return None
@@ -197,16 +286,183 @@ class IndicatorService:
             traceback.print_exc();
             return None
 
+    def _prepare_bulk_ioc_document(self, ioc: indicator_schemas.IoCCreate, apt_names: Dict[int, str],
+                                   current_time: datetime, seen_in_feed_at: Optional[datetime]) -> Dict[str, Any]:
+        """Документ для _bulk без звернень до БД: APT ID уже перевірені пакетно, теги apt:* — з apt_names."""
+        apt_ids = sorted({apt_id for apt_id in ioc.attributed_apt_group_ids if apt_id in apt_names})
+        tags = set(ioc.tags or []) | {_apt_tag(apt_names[apt_id]) for apt_id in apt_ids}
+        seen_at = ioc.last_seen or ioc.first_seen or current_time
+        doc = {
+            "value": ioc.value, "type": ioc.type.value, "description": ioc.description,
+            "source_name": ioc.source_name, "is_active": ioc.is_active, "confidence": ioc.confidence,
+            "tags": sorted(tags), "attributed_apt_group_ids": apt_ids,
+            "first_seen": ioc.first_seen.isoformat() if ioc.first_seen else None,
+            "last_seen": ioc.last_seen.isoformat() if ioc.last_seen else None,
+            "@timestamp": seen_at.isoformat(),
+            "created_at_siem": current_time.isoformat(), "updated_at_siem": current_time.isoformat(),
+            IOC_SEEN_IN_FEED_FIELD: seen_in_feed_at.isoformat() if seen_in_feed_at else None,
+        }
+        return {k: v for k, v in doc.items() if v is not None}
+
+    def bulk_upsert_iocs(self, db: Session, es_writer: ElasticsearchWriter,
+                         iocs: Iterable[indicator_schemas.IoCCreate], apt_service: 'APTGroupService',
+                         batch_size: int = IOC_BULK_BATCH_SIZE,
+                         seen_in_feed_at: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Масовий імпорт IoC пакетами через _bulk з ідемпотентним upsert за (тип, значення).
+        APT ID кожного пакета перевіряються одним запитом до БД. seen_in_feed_at — час отримання фіду
+        (None для імпорту не з джерела). Повертає лічильники created/updated/failed.
+        """
+        counts = {"created": 0, "updated": 0, "failed": 0}
+        if not es_writer or not es_writer.es_client: return counts
+        batch: List[indicator_schemas.IoCCreate] = []
+        for ioc in iocs:
+            batch.append(ioc)
+            if len(batch) >= batch_size:
+                self._bulk_upsert_batch(db, es_writer.es_client, batch, apt_service, counts, seen_in_feed_at)
+                batch = []
+        if batch:
+            self._bulk_upsert_batch(db, es_writer.es_client, batch, apt_service, counts, seen_in_feed_at)
+        if counts["created"] or counts["updated"]:
+            cache_versions.bump(cache_versions.IOCS)
+        return counts
+
+    def _bulk_upsert_batch(self, db: Session, es_client: Elasticsearch, batch: List[indicator_schemas.IoCCreate],
+                           apt_service: 'APTGroupService', counts: Dict[str, int],
+                           seen_in_feed_at: Optional[datetime] = None):
+        current_time = datetime.now(timezone.utc)
+        requested_apt_ids = {apt_id for ioc in batch for apt_id in ioc.attributed_apt_group_ids}
+        apt_names = apt_service.get_apt_group_names_by_ids(db, list(requested_apt_ids))
+        for missing_apt_id in requested_apt_ids - apt_names.keys():
+            print(f"Warning: APT ID {missing_apt_id} not found. Skipping it for bulk-imported IoCs.")
+
+        # Дублікати в межах пакета зливаються в один документ ще до відправки
+        docs: Dict[str, Dict[str, Any]] = {}
+        for ioc in batch:
+            doc_id = ioc_document_id(ioc.type, ioc.value)
+            doc = self._prepare_bulk_ioc_document(ioc, apt_names, current_time, seen_in_feed_at)
+            previous = docs.get(doc_id)
+            if previous:
+                doc["tags"] = sorted(set(previous["tags"]) | set(doc["tags"]))
+                doc["attributed_apt_group_ids"] = sorted(
+                    set(previous["attributed_apt_group_ids"]) | set(doc["attributed_apt_group_ids"]))
+            docs[doc_id] = doc
+
+        ioc_index = ensure_ioc_index(es_client)
+        operations: List[Dict[str, Any]] = []
+        for doc_id, doc in docs.items():
+            operations.append({"update": {"_index": ioc_index, "_id": doc_id, "retry_on_conflict": 3}})
+            operations.append({"scripted_upsert": True, "upsert": {},
+                               "script": {"source": IOC_BULK_UPSERT_SCRIPT, "lang": "painless",
+                                          "params": {"doc": doc, "overwrite_fields": IOC_BULK_OVERWRITE_FIELDS}}})
+        try:
+            resp = es_client.bulk(operations=operations)
+        except Exception as e:
+            print(f"Error bulk-importing {len(docs)} IoCs: {e}")
+            counts["failed"] += len(docs)
+            return
+        for item in resp.get('items', []):
+            result = item.get('update', {})
+            if result.get('error'):
+                print(f"Failed to upsert IoC {result.get('_id')}: {result.get('error')}")
+                counts["failed"] += 1
+            elif result.get('result') == 'created':
+                counts["created"] += 1
+            else:
+                counts["updated"] += 1
+
+    def bulk_partial_update_iocs(self, es_writer: ElasticsearchWriter, doc_ids: Iterable[str],
+                                 partial_doc: Dict[str, Any], batch_size: int = IOC_BULK_BATCH_SIZE) -> int:
+        """
+        Однакове часткове оновлення (наприклад, is_active=false) для документів індексу IoC пакетами _bulk.
+        Відсутні документи пропускаються. Повертає кількість оновлених.
+        """
+        if not es_writer or not es_writer.es_client: return 0
+        ioc_index = ensure_ioc_index(es_writer.es_client)
+        updated = 0
+        batch: List[str] = []
+
+        def flush():
+            nonlocal updated
+            operations: List[Dict[str, Any]] = []
+            for doc_id in batch:
+                operations.append({"update": {"_index": ioc_index, "_id": doc_id, "retry_on_conflict": 3}})
+                operations.append({"doc": partial_doc})
+            try:
+                resp = es_writer.es_client.bulk(operations=operations)
+            except Exception as e:
+                print(f"Error bulk-updating {len(batch)} IoCs: {e}")
+                return
+            for item in resp.get('items', []):
+                result = item.get('update', {})
+                if result.get('error'):
+                    if result.get('status') != 404:
+                        print(f"Failed to update IoC {result.get('_id')}: {result.get('error')}")
+                elif result.get('result') == 'updated':
+                    updated += 1
+
+        for doc_id in doc_ids:
+            batch.append(doc_id)
+            if len(batch) >= batch_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+        if updated:
+            cache_versions.bump(cache_versions.IOCS)
+        return updated
+
+    def expire_stale_iocs(self, es_writer: ElasticsearchWriter, ttl_days: int) -> int:
+        """
+        Деактивує активні IoC, яких жоден фід не бачив довше за ttl_days (seen_in_feed_at); для IoC без
+        цього поля (додані вручну чи записані до його появи) — за last_seen і updated_at_siem разом, бо
+        last_seen фіду може бути давнім і для щойно імпортованого IoC. Повертає кількість деактивованих.
+        """
+        if not es_writer or not es_writer.es_client or ttl_days <= 0: return 0
+        now_iso = datetime.now(timezone.utc).isoformat()
+        update_by_query_body = {
+            "script": {"source": "ctx._source.is_active = false; ctx._source.updated_at_siem = params.now;",
+                       "lang": "painless", "params": {"now": now_iso}},
+            "query": {"bool": {"filter": [{"term": {"is_active": True}}], "should": [
+                {"range": {IOC_SEEN_IN_FEED_FIELD: {"lt": f"now-{ttl_days}d"}}},
+                {"bool": {"must_not": [{"exists": {"field": IOC_SEEN_IN_FEED_FIELD}}],
+                          "filter": [{"range": {"last_seen": {"lt": f"now-{ttl_days}d"}}},
+                                     {"range": {"updated_at_siem": {"lt": f"now-{ttl_days}d"}}}]}}],
+                "minimum_should_match": 1}}}
+        es_client: Elasticsearch = es_writer.es_client
+        try:
+            response = es_client.update_by_query(index=ioc_read_index(es_client), body=update_by_query_body,
+                                                 wait_for_completion=True, conflicts='proceed')
+        except es_exceptions.ApiError as e:
+            print(f"Error expiring IoCs older than {ttl_days} days: {e}")
+            return 0
+        expired = response.get('updated', 0)
+        if expired:
+            cache_versions.bump(cache_versions.IOCS)
+            print(f"Expired {expired} IoCs not seen for {ttl_days} days.")
+        return expired
+
+    def _get_ioc_hit(self, es_client: Elasticsearch, ioc_elasticsearch_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Документ IoC прямим GET за аліасом. Пошук ids по старих щоденних індексах — лише запасний шлях
+        з settings.IOC_READ_LEGACY_INDICES, доки їх не перенесено скриптом migrate_ioc_indices.
+        """
+        try:
+            return es_client.get(index=ensure_ioc_index(es_client), id=ioc_elasticsearch_id)
+        except es_exceptions.NotFoundError:
+            if not settings.IOC_READ_LEGACY_INDICES:
+                return None
+        search_query = {"query": {"ids": {"values": [ioc_elasticsearch_id]}}}
+        res = es_client.search(index=ioc_read_index(es_client), body=search_query, size=1)
+        return res['hits']['hits'][0] if res['hits']['hits'] else None
+
     def get_ioc_by_es_id(self, es_writer: ElasticsearchWriter, ioc_elasticsearch_id: str) -> Optional[
         indicator_schemas.IoCResponse]:
-        # ... (код без змін)
         if not es_writer or not es_writer.es_client: return None
         es_client: Elasticsearch = es_writer.es_client
         try:
-            search_query = {"query": {"ids": {"values": [ioc_elasticsearch_id]}}}
-            res = es_client.search(index="siem-iocs-*", body=search_query, size=1)
-            if res['hits']['hits']: return self._parse_ioc_hit_to_response(res['hits']['hits'][0])
-            return None
+            hit = self._get_ioc_hit(es_client, ioc_elasticsearch_id)
+            return self._parse_ioc_hit_to_response(hit) if hit else None
         except es_exceptions.NotFoundError:
             return None
         except es_exceptions.ElasticsearchWarning as e:
@@ -221,11 +477,8 @@ class IndicatorService:
         es_client: Elasticsearch = es_writer.es_client
         current_ioc_hit = None
         try:
-            search_query = {"query": {"ids": {"values": [ioc_elasticsearch_id]}}}
-            res = es_client.search(index="siem-iocs-*", body=search_query, size=1)
-            if res['hits']['hits']:
-                current_ioc_hit = res['hits']['hits'][0]
-            else:
+            current_ioc_hit = self._get_ioc_hit(es_client, ioc_elasticsearch_id)
+            if not current_ioc_hit:
                 print(f"IoC ES_ID '{ioc_elasticsearch_id}' not found for update.");
                 return None
         except es_exceptions.ElasticsearchWarning as e:
@@ -234,11 +487,22 @@ class IndicatorService:
         target_index = current_ioc_hit['_index'];
         existing_doc_source = current_ioc_hit['_source']
 
+        # ID документа — sha1("тип:значення"), тому value/type не оновлюються на місці: інакше документ
+        # лишиться під ID старого значення і фід створить дубль. Незмінені поля (форма надсилає їх завжди) допускаються
+        new_type = ioc_update_data.type.value if ioc_update_data.type is not None else None
+        if (ioc_update_data.value is not None and ioc_update_data.value != existing_doc_source.get('value')) or \
+                (new_type is not None and new_type != existing_doc_source.get('type')):
+            raise IoCIdentityChangeError(
+                "IoC value and type cannot be changed; create a new IoC and delete this one instead.")
+        ioc_update_data.value = existing_doc_source.get('value')
+        ioc_update_data.type = existing_doc_source.get('type')
+
         # Валідація APT IDs
         if ioc_update_data.attributed_apt_group_ids is not None:
             valid_apt_ids = []
+            known_apt_names = apt_service.get_apt_group_names_by_ids(db, ioc_update_data.attributed_apt_group_ids)
             for apt_id in ioc_update_data.attributed_apt_group_ids:
-                if not apt_service.get_apt_group_by_id(db, apt_id):
+                if apt_id not in known_apt_names:
                     print(f"Warning: APT ID {apt_id} for IoC update not found. Skipping.")
                 else:
                     valid_apt_ids.append(apt_id)
@@ -265,8 +529,11 @@ class IndicatorService:
             resp = es_client.index(index=target_index, id=ioc_elasticsearch_id,
                                    document=doc_payload_for_es)  # index перезапише
             if resp.get('result') == 'updated':
+                cache_versions.bump(cache_versions.IOCS)
                 updated_hit = es_client.get(index=target_index, id=ioc_elasticsearch_id)
-                return self._parse_ioc_hit_to_response(updated_hit)
+                updated_ioc = self._parse_ioc_hit_to_response(updated_hit)
+                if updated_ioc: ioc_store.upsert(updated_ioc)
+                return updated_ioc
             else:
                 print(f"Failed to update IoC {ioc_elasticsearch_id}. Response: {resp}");
                 return None
@@ -283,13 +550,14 @@ class IndicatorService:
         if not es_writer or not es_writer.es_client: return False
         es_client: Elasticsearch = es_writer.es_client
         try:
-            search_query = {"query": {"ids": {"values": [ioc_elasticsearch_id]}}}
-            res = es_client.search(index="siem-iocs-*", body=search_query, size=1)
-            if not res['hits']['hits']: print(
+            current_ioc_hit = self._get_ioc_hit(es_client, ioc_elasticsearch_id)
+            if not current_ioc_hit: print(
                 f"IoC ES_ID '{ioc_elasticsearch_id}' not found for deletion."); return True
-            target_index = res['hits']['hits'][0]['_index']
+            target_index = current_ioc_hit['_index']
             resp = es_client.delete(index=target_index, id=ioc_elasticsearch_id)
             if resp.get('result') == 'deleted':
+                cache_versions.bump(cache_versions.IOCS)
+                ioc_store.remove(ioc_elasticsearch_id)
                 print(f"IoC {ioc_elasticsearch_id} deleted from {target_index}.");
                 return True
             elif resp.get('result') == 'not_found':
@@ -305,28 +573,126 @@ class IndicatorService:
             print(f"Error deleting IoC {ioc_elasticsearch_id}: {e}");
             return False
 
-    def get_all_iocs(self, es_writer: ElasticsearchWriter, skip: int = 0, limit: int = 100) -> List[
-        indicator_schemas.IoCResponse]:
-        # ... (код без змін, використовує _parse_ioc_hit_to_response) ...
+    @staticmethod
+    def _ioc_list_query(ioc_type: Optional[schemas.IoCTypeEnum] = None, tag: Optional[str] = None,
+                        is_active: Optional[bool] = None) -> Dict[str, Any]:
+        filters: List[Dict[str, Any]] = []
+        if ioc_type is not None: filters.append({"term": {"type.keyword": ioc_type.value}})
+        if tag: filters.append({"term": {"tags": tag}})
+        if is_active is not None: filters.append({"term": {"is_active": is_active}})
+        return {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+    def get_all_iocs(self, es_writer: ElasticsearchWriter, skip: int = 0, limit: int = 100,
+                     ioc_type: Optional[schemas.IoCTypeEnum] = None, tag: Optional[str] = None,
+                     is_active: Optional[bool] = None) -> List[indicator_schemas.IoCResponse]:
         if not es_writer or not es_writer.es_client: return []
         es_client: Elasticsearch = es_writer.es_client
-        query_body = {"query": {"match_all": {}}, "from": skip, "size": limit,
+        query_body = {"query": self._ioc_list_query(ioc_type, tag, is_active), "from": skip, "size": limit,
                       "sort": [{"updated_at_siem": {"order": "desc", "unmapped_type": "date"}},
                                {"created_at_siem": {"order": "desc", "unmapped_type": "date"}}]}
         try:
-            resp = es_client.search(index="siem-iocs-*", body=query_body)
+            resp = es_client.search(index=ioc_read_index(es_client), body=query_body)
             iocs_found = []
             for hit in resp.get('hits', {}).get('hits', []):
                 ioc_resp = self._parse_ioc_hit_to_response(hit)
                 if ioc_resp: iocs_found.append(ioc_resp)
             return iocs_found
         except es_exceptions.NotFoundError:
-            print(f"Index pattern siem-iocs-* not found.");
+            print(f"IoC index not found.");
             return []
         except es_exceptions.ElasticsearchWarning as e:
             print(f"Error getting all IoCs: {e}");
             return []
 
+    def get_iocs_page(self, es_writer: ElasticsearchWriter, limit: int = 100, cursor: Optional[str] = None,
+                      ioc_type: Optional[schemas.IoCTypeEnum] = None, tag: Optional[str] = None,
+                      is_active: Optional[bool] = None) -> Tuple[List[indicator_schemas.IoCResponse], Optional[str]]:
+        """
+        Сторінка IoC через PIT + search_after за (updated_at_siem desc, _shard_doc): глибина сторінки
+        не впливає на вартість запиту і не обмежена 10k вікном from/size. Курсор несе id PIT, позицію
+        search_after і фільтри першої сторінки, тож наступні сторінки бачать той самий знімок індексу.
+        Повертає (IoC, курсор наступної сторінки або None на останній сторінці).
+        """
+        if not es_writer or not es_writer.es_client: return [], None
+        es_client: Elasticsearch = es_writer.es_client
+        if cursor:
+            state = decode_cursor(cursor)
+            pit_id, search_after, filters = state.get("pit"), state.get("after"), state.get("f")
+            if not pit_id or not isinstance(search_after, list) or not isinstance(filters, dict):
+                raise InvalidCursorError("Invalid IoC pagination cursor.")
+            try:
+                ioc_type = schemas.IoCTypeEnum(filters["type"]) if filters.get("type") else None
+            except ValueError:
+                raise InvalidCursorError("Invalid IoC pagination cursor.")
+            tag, is_active = filters.get("tag"), filters.get("active")
+        else:
+            try:
+                pit_id = es_client.open_point_in_time(index=ioc_read_index(es_client),
+                                                      keep_alive=IOC_PAGE_PIT_KEEP_ALIVE)["id"]
+            except es_exceptions.NotFoundError:
+                print(f"IoC index not found.");
+                return [], None
+            search_after = None
+
+        body: Dict[str, Any] = {"size": limit, "query": self._ioc_list_query(ioc_type, tag, is_active),
+                                "track_total_hits": False,
+                                "pit": {"id": pit_id, "keep_alive": IOC_PAGE_PIT_KEEP_ALIVE},
+                                "sort": [{"updated_at_siem": {"order": "desc", "unmapped_type": "date"}},
+                                         {"_shard_doc": "asc"}]}
+        if search_after is not None: body["search_after"] = search_after
+        try:
+            resp = es_client.search(body=body)
+        except es_exceptions.NotFoundError:
+            raise ExpiredCursorError("IoC pagination cursor has expired; restart from the first page.")
+
+        hits = resp.get('hits', {}).get('hits', [])
+        iocs_found = []
+        for hit in hits:
+            ioc_resp = self._parse_ioc_hit_to_response(hit)
+            if ioc_resp: iocs_found.append(ioc_resp)
+        # PIT id може змінюватись між запитами — у курсор кладемо найсвіжіший
+        pit_id = resp.get('pit_id', pit_id)
+        if len(hits) < limit:
+            try:
+                es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(f"Failed to close IoC pagination point in time: {e}")
+            return iocs_found, None
+        return iocs_found, encode_cursor({"pit": pit_id, "after": hits[-1]["sort"], "f": {
+            "type": ioc_type.value if ioc_type else None, "tag": tag, "active": is_active}})
+
+    def iter_iocs_for_export(self, es_writer: ElasticsearchWriter, ioc_type: Optional[schemas.IoCTypeEnum] = None,
+                             tag: Optional[str] = None, is_active: Optional[bool] = None) -> Iterator[
+        indicator_schemas.IoCResponse]:
+        """Усі IoC під фільтром одним PIT-знімком, сторінками по IOC_EXPORT_PAGE_SIZE (для потокового експорту)."""
+        if not es_writer or not es_writer.es_client: return
+        es_client: Elasticsearch = es_writer.es_client
+        try:
+            pit_id = es_client.open_point_in_time(index=ioc_read_index(es_client),
+                                                  keep_alive=IOC_PAGE_PIT_KEEP_ALIVE)["id"]
+        except es_exceptions.NotFoundError:
+            print(f"IoC index not found for export.");
+            return
+        body: Dict[str, Any] = {"size": IOC_EXPORT_PAGE_SIZE, "query": self._ioc_list_query(ioc_type, tag, is_active),
+                                "track_total_hits": False, "sort": [{"_shard_doc": "asc"}]}
+        try:
+            while True:
+                body["pit"] = {"id": pit_id, "keep_alive": IOC_PAGE_PIT_KEEP_ALIVE}
+                resp = es_client.search(body=body)
+                pit_id = resp.get('pit_id', pit_id)
+                hits = resp.get('hits', {}).get('hits', [])
+                for hit in hits:
+                    ioc_resp = self._parse_ioc_hit_to_response(hit)
+                    if ioc_resp: yield ioc_resp
+                if len(hits) < IOC_EXPORT_PAGE_SIZE:
+                    return
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            try:
+                es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(f"Failed to close IoC export point in time: {e}")
+
     def get_iocs_created_today(self, es_writer: ElasticsearchWriter, skip: int = 0, limit: int = 100) -> List[
         indicator_schemas.IoCResponse]:
         # ... (код без змін, використовує _parse_ioc_hit_to_response) ...
@@ -339,14 +705,14 @@ class IndicatorService:
             "range": {"created_at_siem": {"gte": start_of_day_utc.isoformat(), "lt": end_of_day_utc.isoformat()}}},
             "from": skip, "size": limit, "sort": [{"created_at_siem": {"order": "desc"}}]}
         try:
-            resp = es_client.search(index="siem-iocs-*", body=query_body)
+            resp = es_client.search(index=ioc_read_index(es_client), body=query_body)
             iocs_found = []
             for hit in resp.get('hits', {}).get('hits', []):
                 ioc_resp = self._parse_ioc_hit_to_response(hit)
                 if ioc_resp: iocs_found.append(ioc_resp)
             return iocs_found
         except es_exceptions.NotFoundError:
-            print(f"Index pattern siem-iocs-* not found for today's IoCs.");
+            print(f"IoC index not found for today's IoCs.");
             return []
         except es_exceptions.ElasticsearchWarning as e:
             print(f"Error getting today's IoCs: {e}");
@@ -360,10 +726,8 @@ class IndicatorService:
         if not es_writer or not es_writer.es_client: print("ES client not available."); return None
         es_client: Elasticsearch = es_writer.es_client
         try:
-            search_query = {"query": {"ids": {"values": [ioc_es_id]}}}
-            search_res = es_client.search(index="siem-iocs-*", body=search_query)
-            if not search_res['hits']['hits']: print(f"IoC ES_ID '{ioc_es_id}' not found."); return None
-            hit_for_update = search_res['hits']['hits'][0];
+            hit_for_update = self._get_ioc_hit(es_client, ioc_es_id)
+            if not hit_for_update: print(f"IoC ES_ID '{ioc_es_id}' not found."); return None
             target_index = hit_for_update['_index']
             update_script = {
                 "script": {
@@ -379,9 +743,12 @@ class IndicatorService:
                 }
             }
             es_client.update(index=target_index, id=ioc_es_id, body=update_script, refresh=True)
+            cache_versions.bump(cache_versions.IOCS)
             print(f"Successfully linked APT ID {apt_group_id} to IoC ES_ID {ioc_es_id}")
             updated_hit = es_client.get(index=target_index, id=ioc_es_id)
-            return self._parse_ioc_hit_to_response(updated_hit)
+            updated_ioc = self._parse_ioc_hit_to_response(updated_hit)
+            if updated_ioc: ioc_store.upsert(updated_ioc)
+            return updated_ioc
         except es_exceptions.NotFoundError:
             print(f"IoC ES_ID '{ioc_es_id}' not found (NotFoundError).");
             return None
@@ -389,36 +756,66 @@ class IndicatorService:
             print(f"ES error linking IoC {ioc_es_id} to APT {apt_group_id}: {e}");
             return None
 
-    def remove_apt_id_from_all_iocs(self, es_writer: ElasticsearchWriter, apt_group_id_to_remove: int) -> bool:
-        # ... (код без змін) ...
-        if not es_writer or not es_writer.es_client: print("ES client not available."); return False
+    def start_apt_unlink_task(self, es_writer: ElasticsearchWriter, apt_group_id_to_remove: int) -> Optional[str]:
+        """
+        Запускає відв'язування APT-групи від усіх IoC як фонову задачу ES (update_by_query з
+        wait_for_completion=false): запит не чекає на перезапис документів, а задача йде слайсами з
+        обмеженням швидкості й без refresh індексу. Повертає id задачі ES для опитування прогресу.
+        Знімок IoC у пам'яті оновлюється одразу.
+        """
+        if not es_writer or not es_writer.es_client: print("ES client not available."); return None
         es_client: Elasticsearch = es_writer.es_client
         update_by_query_body = {"script": {
-            "source": "if (ctx._source.attributed_apt_group_ids != null && ctx._source.attributed_apt_group_ids.contains(params.apt_id_to_remove)) { ArrayList new_ids = new ArrayList(); for (int id : ctx._source.attributed_apt_group_ids) { if (id != params.apt_id_to_remove) { new_ids.add(id); } } ctx._source.attributed_apt_group_ids = new_ids; ctx._source.updated_at_siem = params.now; } else { ctx.op = 'noop'; }",
-            "lang": "painless",
+            "source": APT_UNLINK_SCRIPT, "lang": "painless",
             "params": {"apt_id_to_remove": apt_group_id_to_remove, "now": datetime.now(timezone.utc).isoformat()}},
             "query": {"term": {"attributed_apt_group_ids": apt_group_id_to_remove}}}
         try:
-            print(f"Attempting to remove APT ID {apt_group_id_to_remove} from linked IoCs in Elasticsearch...")
-            response = es_client.update_by_query(index="siem-iocs-*", body=update_by_query_body, refresh=True,
-                                                 wait_for_completion=True, conflicts='proceed')
-            print(f"ES update_by_query response for removing APT ID {apt_group_id_to_remove} from IoCs: {response}")
-            if response.get('failures') and len(response['failures']) > 0: print(
-                f"WARNING: ES failures during update_by_query for APT ID {apt_group_id_to_remove}: {response['failures']}"); return False
-            return True
-        except es_exceptions.ElasticsearchWarning as e:
-            print(f"Error updating IoCs in ES to remove APT ID {apt_group_id_to_remove}: {e}");
-            return False
+            response = es_client.update_by_query(index=ioc_read_index(es_client), body=update_by_query_body,
+                                                 conflicts='proceed', wait_for_completion=False, slices="auto", refresh=False,
+                                                 requests_per_second=APT_UNLINK_REQUESTS_PER_SECOND)
+        except es_exceptions.NotFoundError:
+            print(f"IoC index not found; nothing to unlink for APT ID {apt_group_id_to_remove}.");
+            return None
+        task_id = response.get('task')
+        print(f"Started ES task {task_id} to remove APT ID {apt_group_id_to_remove} from linked IoCs.")
+        ioc_store.remove_apt_id(apt_group_id_to_remove)
+        cache_versions.bump(cache_versions.IOCS)
+        return task_id
+
+    def get_apt_unlink_task_status(self, es_writer: ElasticsearchWriter, task_id: str) -> Optional[Dict[str, Any]]:
+        """Прогрес задачі відв'язування за даними Tasks API (None — задачу не знайдено)."""
+        if not es_writer or not es_writer.es_client: return None
+        es_client: Elasticsearch = es_writer.es_client
+        try:
+            resp = es_client.tasks.get(task_id=task_id)
+        except es_exceptions.NotFoundError:
+            return None
+        completed = bool(resp.get('completed'))
+        # Для завершеної задачі підсумок у response, для поточної — лише status
+        result = resp.get('response') or resp.get('task', {}).get('status', {})
+        if completed:
+            # Поки задача йшла, кеші могли наповнитись ще не оновленими документами
+            cache_versions.bump(cache_versions.IOCS)
+        return {"task_id": task_id, "completed": completed, "total": result.get('total', 0),
+                "updated": result.get('updated', 0), "noops": result.get('noops', 0),
+                "version_conflicts": result.get('version_conflicts', 0),
+                "failures": len(result.get('failures') or []),
+                "error": (resp.get('error') or {}).get('reason')}
 
     def get_iocs_by_apt_group_id(self, es_writer: ElasticsearchWriter, apt_group_id: int, skip: int = 0,
                                  limit: int = 100) -> List[indicator_schemas.IoCResponse]:
         # ... (код без змін, використовує _parse_ioc_hit_to_response) ...
+        if ioc_store.loaded:
+            # Інвертований індекс APT у пам'яті; порядок як у запиті до ES
+            iocs_found = sorted(ioc_store.find_by_apt(apt_group_id),
+                                key=lambda i: (i.updated_at_siem, i.created_at_siem), reverse=True)
+            return iocs_found[skip:skip + limit]
         if not es_writer or not es_writer.es_client: print("ES client not available."); return []
         es_client: Elasticsearch = es_writer.es_client
         query_body = {"query": {"term": {"attributed_apt_group_ids": apt_group_id}}, "from": skip, "size": limit,
                       "sort": [{"updated_at_siem": {"order": "desc"}}, {"created_at_siem": {"order": "desc"}}]}
         try:
-            resp = es_client.search(index="siem-iocs-*", body=query_body)
+            resp = es_client.search(index=ioc_read_index(es_client), body=query_body)
             iocs_found = []
             for hit in resp.get('hits', {}).get('hits', []):
                 ioc_resp = self._parse_ioc_hit_to_response(hit)
@@ -432,6 +829,9 @@ class IndicatorService:
         """
         Повертає загальну кількість активних IoC, згрупованих за типом.
         """
+        if ioc_store.loaded:
+            # Лічильники знімка ведуться при кожній індексації IoC — без агрегації ES на кожне завантаження дашборду
+            return ioc_store.active_count_by_type()
         if not es_writer or not es_writer.es_client:
             print("Elasticsearch client not available in get_active_ioc_summary_by_type.")
             return {}
@@ -455,7 +855,7 @@ class IndicatorService:
 
         summary: Dict[str, int] = {}
         try:
-            response = es_client.search(index="siem-iocs-*", body=aggregation_query_body)
+            response = es_client.search(index=ioc_read_index(es_client), body=aggregation_query_body)
             buckets = response.get('aggregations', {}).get('iocs_by_type', {}).get('buckets', [])
             for bucket in buckets:
                 ioc_type = bucket.get('key')
@@ -477,6 +877,8 @@ class IndicatorService:
         :param es_writer: Активний клієнт Elasticsearch.
         :return: Відсортований список унікальних тегів.
         """
+        if ioc_store.loaded:
+            return ioc_store.tags()
 
         es_client: Elasticsearch = es_writer.es_client
         # Запит до Elasticsearch для агрегації
@@ -494,7 +896,7 @@ class IndicatorService:
 
         try:
             response = es_client.search(
-                index="siem-iocs-*",  # Шукаємо по всіх індексах з IoC
+                index=ioc_read_index(es_client),
                 body=query_body
             )
 
@@ -521,6 +923,9 @@ class IndicatorService:
         :param ioc_type: Опціональний тип IoC для фільтрації.
         :return: Список знайдених документів IoC.
         """
+        if ioc_store.loaded:
+            return [ioc.model_dump() for ioc in ioc_store.find_by_value(value, ioc_type)]
+
         # 1. Формуємо базовий запит (query)
         # Використовуємо "bool" query, що дозволяє комбінувати умови
         query = {
@@ -546,7 +951,7 @@ class IndicatorService:
 
         es_client = es_writer.es_client
         try:
-            response = es_client.search(index="siem-iocs-*", body=search_body)
+            response = es_client.search(index=ioc_read_index(es_client), body=search_body)
         except es_exceptions.NotFoundError:
             # Індекс не знайдено, повертаємо пустий список
             return []
@@ -559,4 +964,53 @@ class IndicatorService:
             document['ioc_id'] = hit['_id']
             results.append(document)
 
-        return results
\ No newline at end of file
+        return results
+
+    def _search_iocs_by_values(self, es_client: Elasticsearch, values: List[str],
+                               ioc_type: Optional[schemas.IoCTypeEnum]) -> List[indicator_schemas.IoCResponse]:
+        """Один terms-запит на тип (і на кожні IOC_LOOKUP_TERMS_CHUNK значень)."""
+        found: List[indicator_schemas.IoCResponse] = []
+        for i in range(0, len(values), IOC_LOOKUP_TERMS_CHUNK):
+            filters: List[Dict[str, Any]] = [{"terms": {"value.keyword": values[i:i + IOC_LOOKUP_TERMS_CHUNK]}}]
+            if ioc_type:
+                filters.append({"term": {"type.keyword": ioc_type.value}})
+            resp = es_client.search(index=ioc_read_index(es_client), body={
+                "query": {"bool": {"filter": filters}}, "size": 10000, "track_total_hits": False})
+            for hit in resp.get('hits', {}).get('hits', []):
+                ioc_resp = self._parse_ioc_hit_to_response(hit)
+                if ioc_resp: found.append(ioc_resp)
+        return found
+
+    def lookup_iocs(self, db: Session, es_writer: ElasticsearchWriter, lookup: indicator_schemas.IoCLookupRequest,
+                    apt_service: 'APTGroupService') -> indicator_schemas.IoCLookupResponse:
+        """
+        Масовий пошук за значеннями змішаних типів: зі знімка в пам'яті (ioc_store), а поки його не
+        завантажено — одним terms-запитом на тип. Назви APT підтягуються одним запитом до БД.
+        """
+        values_by_type: Dict[Optional[schemas.IoCTypeEnum], set] = {}
+        for item in lookup.items:
+            values_by_type.setdefault(item.type, set()).add(item.value)
+
+        found: List[indicator_schemas.IoCResponse] = []
+        if ioc_store.loaded:
+            for ioc_type, values in values_by_type.items():
+                for value in values:
+                    found.extend(ioc_store.find_by_value(value, ioc_type))
+        else:
+            if not es_writer or not es_writer.es_client: raise ConnectionError("ES client not available.")
+            for ioc_type, values in values_by_type.items():
+                found.extend(self._search_iocs_by_values(es_writer.es_client, sorted(values), ioc_type))
+
+        # Значення без типу і з типом можуть знайти той самий IoC — лишаємо по одному
+        unique_iocs = {ioc.ioc_id: ioc for ioc in found if ioc.is_active or not lookup.only_active}
+        apt_names = apt_service.get_apt_group_names_by_ids(
+            db, list({apt_id for ioc in unique_iocs.values() for apt_id in ioc.attributed_apt_group_ids}))
+        matches = [indicator_schemas.IoCLookupMatch(
+            value=ioc.value, type=ioc.type, ioc_id=ioc.ioc_id, is_active=ioc.is_active, confidence=ioc.confidence,
+            tags=ioc.tags, source_name=ioc.source_name, last_seen=ioc.last_seen,
+            attributed_apts=[indicator_schemas.APTGroupBasicInfo(id=apt_id, name=apt_names[apt_id])
+                             for apt_id in ioc.attributed_apt_group_ids if apt_id in apt_names])
+            for ioc in unique_iocs.values()]
+        matched_values = {ioc.value for ioc in unique_iocs.values()}
+        not_found = sorted({item.value for item in lookup.items} - matched_values)
+        return indicator_schemas.IoCLookupResponse(matches=matches, not_found=not_found)
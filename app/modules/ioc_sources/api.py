@@ -5,6 +5,8 @@ from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body
 from sqlalchemy.orm import Session
 
 from app.core.config import settings  # Для ES налаштувань, якщо створюємо writer тут
+from app.core import cache_versions
+from app.core.response_cache import etag_cache
 from app.core.database import get_db
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter  # Потрібен для fetch
 from . import schemas
@@ -50,7 +52,8 @@ def create_ioc_source_api(
         raise HTTPException(status_code=500, detail=f"Failed to create IoC source: {str(e)}")
 
 
-@router.get("/", response_model=List[schemas.IoCSourceResponse], operation_id="get_all_ioc_sources")
+@router.get("/", response_model=List[schemas.IoCSourceResponse], operation_id="get_all_ioc_sources",
+            dependencies=[etag_cache(cache_versions.IOC_SOURCES)])
 def read_ioc_sources_api(
         skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=200),
         db: Session = Depends(get_db), service: IoCSourceService = Depends(IoCSourceService)
@@ -58,7 +61,8 @@ def read_ioc_sources_api(
     return service.get_all_ioc_sources(db=db, skip=skip, limit=limit)
 
 
-@router.get("/{source_id}", response_model=schemas.IoCSourceResponse, operation_id="get_ioc_source")
+@router.get("/{source_id}", response_model=schemas.IoCSourceResponse, operation_id="get_ioc_source",
+            dependencies=[etag_cache(cache_versions.IOC_SOURCES)])
 def read_ioc_source_api(
         source_id: int = Path(..., ge=1), db: Session = Depends(get_db),
         service: IoCSourceService = Depends(IoCSourceService)
@@ -91,6 +95,7 @@ def delete_ioc_source_api(
 @router.post("/{source_id}/fetch-iocs", response_model=Dict[str, Any], operation_id="fetch_iocs_from_ioc_source")
 def fetch_iocs_from_source_api(
         source_id: int = Path(..., ge=1),
+        force: bool = Query(True, description="Ігнорувати ETag/Last-Modified попереднього отримання"),
         db: Session = Depends(get_db),
         es_writer: ElasticsearchWriter = Depends(get_es_writer),  # <--- ВИКОРИСТАННЯ
         ioc_source_service: IoCSourceService = Depends(IoCSourceService),
@@ -103,7 +108,8 @@ def fetch_iocs_from_source_api(
             source_id=source_id,
             es_writer=es_writer,
             apt_service=apt_service,  # Передаємо
-            indicator_service=indicator_service  # Передаємо
+            indicator_service=indicator_service,  # Передаємо
+            force=force
         )
         if result.get("status") == "error":
             raise HTTPException(status_code=500, detail=result.get("message", "Failed to fetch IoCs."))
@@ -0,0 +1,272 @@
+# app/modules/ioc_sources/feed_parsers.py
+import csv
+import io
+import json
+import os
+import re
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import formatdate
+from typing import List, Dict, Any, Optional, Iterator, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from app.modules.indicators import schemas as indicator_schemas
+
+READ_CHUNK_SIZE = 64 * 1024
+FEED_HTTP_TIMEOUT_SECONDS = 60
+
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[\s,]*")
+
+
+def _array_key_pattern(key: str) -> "re.Pattern":
+    # Ключ об'єкта, за яким іде масив; екранована лапка всередині рядка-значення не рахується
+    return re.compile(r'(?<!\\)"' + re.escape(key) + r'"\s*:\s*\[')
+
+
+def iter_json_array_items(fp: TextIO, key: Optional[str] = None, repeat: bool = False) -> Iterator[Any]:
+    """
+    Інкрементально розбирає JSON і повертає елементи масиву по одному, тримаючи в пам'яті лише
+    поточний елемент і невеликий буфер читання. key=None — масив на верхньому рівні документа;
+    інакше — масив під першим ключем key (на будь-якій глибині), а з repeat=True — під кожним таким ключем.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+
+    def read_more(size: int = READ_CHUNK_SIZE) -> bool:
+        nonlocal buf, pos, eof
+        chunk = fp.read(size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    key_pattern = _array_key_pattern(key) if key else None
+    while True:
+        # 1. Початок масиву
+        if key_pattern is None:
+            while True:
+                pos = _WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or not read_more():
+                    break
+            if pos >= len(buf):
+                return
+            if buf[pos] != "[":
+                raise ValueError("Feed is not a JSON array.")
+            pos += 1
+        else:
+            while True:
+                match = key_pattern.search(buf, pos)
+                if match:
+                    pos = match.end()
+                    break
+                # Хвіст буфера може містити початок ключа — зберігаємо його до наступного читання
+                pos = max(pos, len(buf) - len(key) - 64)
+                if not read_more():
+                    return
+
+        # 2. Елементи масиву
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos >= len(buf):
+                if not read_more():
+                    raise ValueError("Unexpected end of feed inside a JSON array.")
+                continue
+            if buf[pos] == "]":
+                pos += 1
+                break
+            try:
+                item, end = _JSON_DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Буфер росте геометрично, щоб повторний розбір великого елемента лишався лінійним
+                if not read_more(max(READ_CHUNK_SIZE, len(buf) - pos)):
+                    raise
+                continue
+            # Скаляр на межі буфера міг бути обрізаний (12|34) — дочитуємо й розбираємо ще раз
+            if end >= len(buf) and not eof and read_more():
+                continue
+            pos = end
+            yield item
+
+        if key_pattern is None or not repeat:
+            return
+
+
+@dataclass
+class FeedStream:
+    """Відкритий фід (stream=None, якщо джерело відповіло, що фід не змінився) і нові валідатори кешу."""
+    stream: Optional[TextIO]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.stream is None
+
+
+def open_feed_stream(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FeedStream:
+    """
+    Текстовий потік фіду: HTTP(S) читається по частинах з умовним запитом (If-None-Match /
+    If-Modified-Since), тож незмінений фід коштує один обмін без тіла. Для локального файлу
+    роль Last-Modified виконує час його зміни.
+    """
+    if url.startswith(("http://", "https://")):
+        request = urllib.request.Request(url)
+        if etag:
+            request.add_header("If-None-Match", etag)
+        if last_modified:
+            request.add_header("If-Modified-Since", last_modified)
+        try:
+            response = urllib.request.urlopen(request, timeout=FEED_HTTP_TIMEOUT_SECONDS)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return FeedStream(stream=None, etag=etag, last_modified=last_modified)
+            raise
+        return FeedStream(stream=io.TextIOWrapper(response, encoding="utf-8", errors="replace"),
+                          etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+
+    path = url[len("file://"):] if url.startswith("file://") else url
+    file_modified = formatdate(os.path.getmtime(path), usegmt=True)
+    if last_modified and file_modified == last_modified:
+        return FeedStream(stream=None, last_modified=last_modified)
+    return FeedStream(stream=open(path, "r", encoding="utf-8"), last_modified=file_modified)
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _build_ioc(payload: Dict[str, Any]) -> Optional[indicator_schemas.IoCCreate]:
+    cleaned_payload = {k: v for k, v in payload.items() if v is not None}
+    try:
+        return indicator_schemas.IoCCreate(**cleaned_payload)
+    except (ValueError, ValidationError) as e:
+        print(f"Skipping IoC due to error: {e}. Data: {cleaned_payload}")
+        return None
+
+
+# --- CSV ---
+def iter_csv_iocs(fp: TextIO, source_name: str) -> Iterator[indicator_schemas.IoCCreate]:
+    """
+    CSV із заголовком: value, type (обов'язкові), description, confidence, tags (через ';'),
+    is_active, first_seen, last_seen. Читається построково.
+    """
+    for row in csv.DictReader(fp):
+        value = (row.get("value") or "").strip()
+        ioc_type_str = (row.get("type") or "").strip().lower().replace("_", "-")
+        if not value or not ioc_type_str:
+            continue
+        try:
+            ioc_type = indicator_schemas.IoCTypeEnum(ioc_type_str)
+        except ValueError:
+            print(f"Skipping CSV IoC with unsupported type '{ioc_type_str}': {value}")
+            continue
+        confidence = (row.get("confidence") or "").strip()
+        is_active = (row.get("is_active") or "").strip().lower()
+        ioc = _build_ioc({
+            "value": value, "type": ioc_type, "description": row.get("description") or None,
+            "source_name": source_name,
+            "confidence": int(confidence) if confidence.isdigit() else None,
+            "tags": [t.strip() for t in (row.get("tags") or "").split(";") if t.strip()],
+            "is_active": is_active not in ("false", "0", "no") if is_active else None,
+            "first_seen": _parse_datetime(row.get("first_seen")), "last_seen": _parse_datetime(row.get("last_seen")),
+        })
+        if ioc:
+            yield ioc
+
+
+# --- STIX 2.1 ---
+_STIX_PATTERN_TERM = re.compile(r"([\w-]+):([\w.'-]+)\s*=\s*'((?:[^'\\]|\\.)*)'")
+_STIX_OBJECT_TYPES = {
+    "ipv4-addr:value": indicator_schemas.IoCTypeEnum.IPV4_ADDR,
+    "ipv6-addr:value": indicator_schemas.IoCTypeEnum.IPV6_ADDR,
+    "domain-name:value": indicator_schemas.IoCTypeEnum.DOMAIN_NAME,
+    "url:value": indicator_schemas.IoCTypeEnum.URL,
+    "email-addr:value": indicator_schemas.IoCTypeEnum.EMAIL_ADDR,
+    "file:hashes.MD5": indicator_schemas.IoCTypeEnum.MD5_HASH,
+    "file:hashes.'MD5'": indicator_schemas.IoCTypeEnum.MD5_HASH,
+    "file:hashes.'SHA-1'": indicator_schemas.IoCTypeEnum.SHA1_HASH,
+    "file:hashes.'SHA-256'": indicator_schemas.IoCTypeEnum.SHA256_HASH,
+}
+
+
+def parse_stix_pattern(pattern: str) -> List[Tuple[indicator_schemas.IoCTypeEnum, str]]:
+    """Витягує пари (тип, значення) з порівнянь на рівність у STIX-патерні; решту умов ігнорує."""
+    pairs = []
+    for object_type, object_path, value in _STIX_PATTERN_TERM.findall(pattern or ""):
+        ioc_type = _STIX_OBJECT_TYPES.get(f"{object_type}:{object_path}")
+        if ioc_type:
+            pairs.append((ioc_type, value.replace("\\'", "'")))
+    return pairs
+
+
+def iter_stix_bundle_iocs(fp: TextIO, source_name: str) -> Iterator[indicator_schemas.IoCCreate]:
+    """Індикатори з масиву objects STIX 2.1 bundle; інші типи об'єктів пропускаються."""
+    for stix_object in iter_json_array_items(fp, key="objects"):
+        if not isinstance(stix_object, dict) or stix_object.get("type") != "indicator":
+            continue
+        if stix_object.get("revoked"):
+            continue
+        valid_from = _parse_datetime(stix_object.get("valid_from"))
+        for ioc_type, value in parse_stix_pattern(stix_object.get("pattern")):
+            ioc = _build_ioc({
+                "value": value, "type": ioc_type,
+                "description": stix_object.get("description") or stix_object.get("name"),
+                "source_name": source_name, "confidence": stix_object.get("confidence"),
+                "tags": list(stix_object.get("labels") or []) + list(stix_object.get("indicator_types") or []),
+                "first_seen": valid_from, "last_seen": _parse_datetime(stix_object.get("modified")) or valid_from,
+            })
+            if ioc:
+                yield ioc
+
+
+# --- MISP JSON ---
+_MISP_ATTRIBUTE_TYPES = {
+    "ip-src": indicator_schemas.IoCTypeEnum.IPV4_ADDR,
+    "ip-dst": indicator_schemas.IoCTypeEnum.IPV4_ADDR,
+    "domain": indicator_schemas.IoCTypeEnum.DOMAIN_NAME,
+    "hostname": indicator_schemas.IoCTypeEnum.DOMAIN_NAME,
+    "url": indicator_schemas.IoCTypeEnum.URL,
+    "md5": indicator_schemas.IoCTypeEnum.MD5_HASH,
+    "sha1": indicator_schemas.IoCTypeEnum.SHA1_HASH,
+    "sha256": indicator_schemas.IoCTypeEnum.SHA256_HASH,
+    "email-src": indicator_schemas.IoCTypeEnum.EMAIL_ADDR,
+    "email-dst": indicator_schemas.IoCTypeEnum.EMAIL_ADDR,
+}
+
+
+def iter_misp_iocs(fp: TextIO, source_name: str) -> Iterator[indicator_schemas.IoCCreate]:
+    """
+    Атрибути MISP-подій (зокрема вкладені в Object): кожен масив Attribute розбирається потоково.
+    Атрибути з to_ids=false вважаються неактивними.
+    """
+    for attribute in iter_json_array_items(fp, key="Attribute", repeat=True):
+        if not isinstance(attribute, dict):
+            continue
+        ioc_type = _MISP_ATTRIBUTE_TYPES.get(attribute.get("type"))
+        if ioc_type is None or not attribute.get("value"):
+            continue
+        if ioc_type == indicator_schemas.IoCTypeEnum.IPV4_ADDR and ":" in attribute["value"]:
+            ioc_type = indicator_schemas.IoCTypeEnum.IPV6_ADDR
+        seen_at = _parse_datetime(attribute.get("last_seen"))
+        if seen_at is None and str(attribute.get("timestamp", "")).isdigit():
+            seen_at = datetime.fromtimestamp(int(attribute["timestamp"])).astimezone()
+        ioc = _build_ioc({
+            "value": attribute["value"], "type": ioc_type, "description": attribute.get("comment") or None,
+            "source_name": source_name, "is_active": bool(attribute.get("to_ids", True)),
+            "tags": [tag.get("name") for tag in attribute.get("Tag") or [] if tag.get("name")],
+            "first_seen": _parse_datetime(attribute.get("first_seen")), "last_seen": seen_at,
+        })
+        if ioc:
+            yield ioc
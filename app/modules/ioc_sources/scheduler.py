@@ -0,0 +1,118 @@
+# app/modules/ioc_sources/scheduler.py
+import asyncio
+import time
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional, Set
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.database.postgres_models.ioc_source_models import IoCSource
+from app.modules.apt_groups.services import APTGroupService
+from app.modules.correlation.engine.sharding import advisory_task_lock
+from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
+from app.modules.indicators.services import IndicatorService
+from .services import IoCSourceService
+
+MAX_CONCURRENT_SOURCE_FETCHES = 4
+IOC_EXPIRY_INTERVAL_SECONDS = 3600
+
+
+class IoCFetchScheduler:
+    """
+    Фонове отримання IoC з усіх увімкнених джерел, що мають fetch_interval_minutes. Кожні tick_seconds
+    вибираються джерела, чий інтервал минув, і отримуються конкурентно (не більше
+    MAX_CONCURRENT_SOURCE_FETCHES одночасно). Саме отримання синхронне (urllib, клієнт ES, сесія БД),
+    тому кожне джерело обробляється в окремому потоці через asyncio.to_thread. Advisory lock на джерело
+    не дає двом реплікам API отримувати одне джерело одночасно. Раз на годину тут же деактивуються IoC,
+    прострочені за last_seen (settings.IOC_TTL_DAYS).
+    """
+
+    def __init__(self, tick_seconds: int):
+        self.tick_seconds = tick_seconds
+        self.source_service = IoCSourceService()
+        self._es_writer: Optional[ElasticsearchWriter] = None
+        self._in_flight: Set[int] = set()
+        # Event loop тримає задачі лише слабкими посиланнями — без цього набору задачу може зібрати GC
+        self._fetch_tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_expiry_at = 0.0
+
+    def start(self):
+        """Викликається з event loop додатку (lifespan)."""
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_SOURCE_FETCHES)
+        self._task = asyncio.create_task(self._run(), name="ioc-fetch-scheduler")
+        print(f"IoCFetchScheduler started (tick {self.tick_seconds}s).")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        print("IoCFetchScheduler stopped.")
+
+    async def _run(self):
+        while True:
+            try:
+                due_source_ids = await asyncio.to_thread(self._due_source_ids)
+                for source_id in due_source_ids:
+                    if source_id not in self._in_flight:
+                        self._in_flight.add(source_id)
+                        fetch_task = asyncio.create_task(self._fetch(source_id))
+                        self._fetch_tasks.add(fetch_task)
+                        fetch_task.add_done_callback(self._fetch_tasks.discard)
+            except Exception as e:
+                print(f"IoCFetchScheduler: Failed to select due sources: {e}")
+            if settings.IOC_TTL_DAYS > 0 and time.monotonic() - self._last_expiry_at >= IOC_EXPIRY_INTERVAL_SECONDS:
+                self._last_expiry_at = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._expire_stale_iocs)
+                except Exception as e:
+                    print(f"IoCFetchScheduler: IoC expiry failed: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def _due_source_ids(self) -> List[int]:
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            sources = db.query(IoCSource).filter(IoCSource.is_enabled.is_(True),
+                                                 IoCSource.fetch_interval_minutes.isnot(None)).all()
+            return [source.id for source in sources if source.last_fetched is None
+                    or source.last_fetched + timedelta(minutes=source.fetch_interval_minutes) <= now]
+        finally:
+            db.close()
+
+    async def _fetch(self, source_id: int):
+        try:
+            async with self._semaphore:
+                await asyncio.to_thread(self._fetch_source, source_id)
+        except Exception as e:
+            print(f"IoCFetchScheduler: Fetch of source {source_id} failed: {e}")
+        finally:
+            self._in_flight.discard(source_id)
+
+    def _get_es_writer(self) -> ElasticsearchWriter:
+        if self._es_writer is None:
+            self._es_writer = ElasticsearchWriter(
+                es_hosts=[f"http://{settings.ELASTICSEARCH_HOST}:{settings.ELASTICSEARCH_PORT_API}"])
+        return self._es_writer
+
+    def _expire_stale_iocs(self):
+        with advisory_task_lock("ioc_ttl_expiry") as acquired:
+            if acquired:
+                IndicatorService().expire_stale_iocs(self._get_es_writer(), settings.IOC_TTL_DAYS)
+
+    def _fetch_source(self, source_id: int):
+        with advisory_task_lock(f"ioc_source:{source_id}") as acquired:
+            if not acquired:
+                return
+            db = SessionLocal()
+            try:
+                result = self.source_service.fetch_and_store_iocs_from_source(
+                    db=db, source_id=source_id, es_writer=self._get_es_writer(), apt_service=APTGroupService(),
+                    indicator_service=IndicatorService())
+                print(f"IoCFetchScheduler: Source {source_id}: {result.get('message')}")
+            finally:
+                db.close()
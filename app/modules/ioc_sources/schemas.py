@@ -18,6 +18,7 @@ class IoCSourceBase(BaseModel):
     url: Optional[HttpUrl] = Field(None, description="URL для доступу до джерела (API endpoint, feed URL)")
     description: Optional[str] = Field(None)
     is_enabled: bool = Field(default=True, description="Чи активне це джерело для отримання IoC")
+    fetch_interval_minutes: Optional[int] = Field(None, ge=1, description="Інтервал автоматичного отримання (хв); порожньо — лише вручну")
 
 class IoCSourceCreate(IoCSourceBase):
     pass
@@ -28,10 +29,17 @@ class IoCSourceUpdate(BaseModel):
     url: Optional[HttpUrl] = None
     description: Optional[str] = None
     is_enabled: Optional[bool] = None
+    fetch_interval_minutes: Optional[int] = Field(None, ge=1)
 
 class IoCSourceResponse(IoCSourceBase):
     id: int
     last_fetched: Optional[datetime] = None
+    last_fetch_status: Optional[str] = None
+    last_fetch_duration_ms: Optional[int] = None
+    last_fetch_added: Optional[int] = None
+    last_fetch_updated: Optional[int] = None
+    last_fetch_failed: Optional[int] = None
+    last_fetch_removed: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
@@ -1,15 +1,26 @@
 # app/modules/ioc_sources/services.py
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, TextIO
 from datetime import datetime, timezone
 import os
-import json
+import time
 
+from app.core import cache_versions
+from app.core.config import settings
 from app.database.postgres_models.ioc_source_models import IoCSource
 from . import schemas as ioc_source_schemas
+from .feed_parsers import (
+    FeedStream,
+    iter_csv_iocs,
+    iter_json_array_items,
+    iter_misp_iocs,
+    iter_stix_bundle_iocs,
+    open_feed_stream
+)
+from .snapshot import SourceSnapshotDiff, doc_ids_held_by_other_sources, touch_cutoff
 from app.modules.apt_groups.services import APTGroupService  # Для взаємодії з APT
 from app.modules.apt_groups import schemas as apt_schemas  # Потрібно для type hint APTGroupService
-from app.modules.indicators.services import IndicatorService  # Для взаємодії з IoC
+from app.modules.indicators.services import IOC_SEEN_IN_FEED_FIELD, IndicatorService  # Для взаємодії з IoC
 from app.modules.indicators import schemas as indicator_schemas  # Потрібно для type hint IndicatorService
 from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
 from pydantic import ValidationError
@@ -19,6 +30,13 @@ CURRENT_DIR_IOC_SOURCES = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT_DIR_IOC_SOURCES = os.path.join(CURRENT_DIR_IOC_SOURCES, "..", "..", "..")
 MOCK_DATA_FILE_PATH_IOC_SOURCES = os.path.join(PROJECT_ROOT_DIR_IOC_SOURCES, "data", "apt_iocs_data.json")
 
+# Потокові парсери для джерел, що мають URL фіду
+FEED_PARSERS_BY_SOURCE_TYPE = {
+    ioc_source_schemas.IoCSourceTypeEnum.STIX_FEED: iter_stix_bundle_iocs,
+    ioc_source_schemas.IoCSourceTypeEnum.CSV_URL: iter_csv_iocs,
+    ioc_source_schemas.IoCSourceTypeEnum.MISP: iter_misp_iocs,
+}
+
 
 class IoCSourceService:
     def create_ioc_source(self, db: Session, source_create: ioc_source_schemas.IoCSourceCreate) -> IoCSource:
@@ -28,11 +46,13 @@ class IoCSourceService:
         db_source = IoCSource(
             name=source_create.name, type=source_create.type,
             url=str(source_create.url) if source_create.url else None,
-            description=source_create.description, is_enabled=source_create.is_enabled
+            description=source_create.description, is_enabled=source_create.is_enabled,
+            fetch_interval_minutes=source_create.fetch_interval_minutes
         )
         db.add(db_source);
         db.commit();
         db.refresh(db_source)
+        cache_versions.bump(cache_versions.IOC_SOURCES)
         return db_source
 
     def get_ioc_source_by_id(self, db: Session, source_id: int) -> Optional[IoCSource]:
@@ -51,6 +71,10 @@ class IoCSourceService:
         update_data = source_update.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             if key == "url" and value is not None:
+                if str(value) != db_source.url:
+                    # Інший фід — кешовані валідатори умовного запиту більше не дійсні
+                    db_source.http_etag = None
+                    db_source.http_last_modified = None
                 setattr(db_source, key, str(value))
             elif key == "type" and value is not None:
                 setattr(db_source, key, ioc_source_schemas.IoCSourceTypeEnum(value))
@@ -59,23 +83,70 @@ class IoCSourceService:
         db.add(db_source);
         db.commit();
         db.refresh(db_source)
+        cache_versions.bump(cache_versions.IOC_SOURCES)
         return db_source
 
     def delete_ioc_source(self, db: Session, source_id: int) -> bool:
         db_source = self.get_ioc_source_by_id(db, source_id)
-        if db_source: db.delete(db_source); db.commit(); return True
+        if db_source:
+            db.delete(db_source); db.commit()
+            cache_versions.bump(cache_versions.IOC_SOURCES)
+            return True
         return False
 
-    def _load_mock_data_from_file(self) -> List[Dict[str, Any]]:
-        try:
-            if not os.path.exists(MOCK_DATA_FILE_PATH_IOC_SOURCES):
-                print(f"ERROR: Mock data file not found at {MOCK_DATA_FILE_PATH_IOC_SOURCES}")
-                return []
-            with open(MOCK_DATA_FILE_PATH_IOC_SOURCES, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data
-        except Exception as e:
-            print(f"ERROR loading mock data: {e}"); return []
+    def _iter_mock_feed_iocs(self, db: Session, feed: TextIO, ioc_source: IoCSource, apt_service: APTGroupService,
+                             relevant_apt_names: Optional[List[str]]) -> Iterator[indicator_schemas.IoCCreate]:
+        """Потоково читає mock-файл по одному запису APT; APT-угруповання створюються в міру появи."""
+        current_time = datetime.now(timezone.utc)
+        for apt_entry in iter_json_array_items(feed):
+            apt_name_from_file = apt_entry.get("name")
+            if relevant_apt_names is not None and apt_name_from_file not in relevant_apt_names:
+                continue
+            apt_db_id = None
+            try:
+                # Використовуємо метод з apt_service для створення/перевірки APT-угруповань
+                apt_db_id = apt_service._ensure_apt_groups_exist_from_data(db, [apt_entry]).get(apt_name_from_file)
+            except Exception as e:
+                print(f"Error ensuring APT groups exist via apt_service: {e}")
+
+            for ioc_json in apt_entry.get("iocs", []):
+                try:
+                    ioc_type_str = ioc_json.get("type", "").lower().replace("_", "-")
+                    ioc_type_enum = indicator_schemas.IoCTypeEnum(ioc_type_str)
+                    ioc_create_payload = {
+                        "value": ioc_json.get("value"), "type": ioc_type_enum,
+                        "description": ioc_json.get("description"), "source_name": ioc_source.name,
+                        "is_active": ioc_json.get("is_active", True), "confidence": ioc_json.get("confidence"),
+                        "tags": ioc_json.get("tags", []),
+                        "first_seen": current_time, "last_seen": current_time,
+                        "attributed_apt_group_ids": [apt_db_id] if apt_db_id else []
+                    }
+                    cleaned_payload = {k: v for k, v in ioc_create_payload.items() if v is not None}
+                    yield indicator_schemas.IoCCreate(**cleaned_payload)
+                except (ValueError, ValidationError) as e:
+                    print(f"Skipping IoC due to error: {e}. Data: {ioc_json}")
+
+    def _record_fetch(self, db: Session, ioc_source: IoCSource, status: str, started: float,
+                      counts: Optional[Dict[str, int]] = None, feed: Optional[FeedStream] = None):
+        ioc_source.last_fetched = datetime.now(timezone.utc)
+        ioc_source.last_fetch_status = status
+        ioc_source.last_fetch_duration_ms = int((time.monotonic() - started) * 1000)
+        counts = counts or {}
+        ioc_source.last_fetch_added = counts.get("created", 0)
+        ioc_source.last_fetch_updated = counts.get("updated", 0)
+        ioc_source.last_fetch_failed = counts.get("failed", 0)
+        ioc_source.last_fetch_removed = counts.get("removed", 0)
+        # Валідатори кешу оновлюються лише після повністю обробленого фіду; після часткового — скидаються,
+        # щоб наступне отримання не отримало 304 і повторило записи, що не потрапили в ES
+        if feed is not None and status == "success":
+            ioc_source.http_etag = feed.etag
+            ioc_source.http_last_modified = feed.last_modified
+        elif status == "partial":
+            ioc_source.http_etag = None
+            ioc_source.http_last_modified = None
+        db.add(ioc_source);
+        db.commit()
+        cache_versions.bump(cache_versions.IOC_SOURCES)
 
     def fetch_and_store_iocs_from_source(
             self,
@@ -83,8 +154,15 @@ class IoCSourceService:
             source_id: int,
             es_writer: ElasticsearchWriter,
             apt_service: APTGroupService,  # Тепер це екземпляр APTGroupService
-            indicator_service: IndicatorService  # Тепер це екземпляр IndicatorService
+            indicator_service: IndicatorService,  # Тепер це екземпляр IndicatorService
+            force: bool = False
     ) -> Dict[str, Any]:
+        """
+        IoC читаються з фіду потоково й одразу пакетами йдуть у bulk upsert, тож пам'ять не залежить
+        від розміру фіду. Джерела STIX/CSV/MISP з URL читаються з URL, решта — з mock-файлу.
+        Запит умовний (ETag / Last-Modified з попереднього отримання), якщо не задано force.
+        """
+        started = time.monotonic()
         ioc_source = self.get_ioc_source_by_id(db, source_id)
         if not ioc_source or not ioc_source.is_enabled:
             return {"status": "error", "message": f"IoC Source ID {source_id} not found or disabled.", "added_iocs": 0,
@@ -92,89 +170,128 @@ class IoCSourceService:
 
         print(f"Fetching IoCs for source: {ioc_source.name} (Type: {ioc_source.type.value})...")
 
-        all_apt_data_from_file = self._load_mock_data_from_file()
-        if not all_apt_data_from_file:
-            return {"status": "success", "message": "Mock data file empty or not found.", "added_iocs": 0,
-                    "failed_iocs": 0}
-
-        apt_name_to_id_map: Dict[str, int] = {}
-        try:
-            # Використовуємо метод з apt_service для створення/перевірки APT-угруповань
-            apt_name_to_id_map = apt_service._ensure_apt_groups_exist_from_data(db, all_apt_data_from_file)
-        except Exception as e:
-            print(f"Error ensuring APT groups exist via apt_service: {e}")
-
-        iocs_to_create: List[indicator_schemas.IoCCreate] = []
-        current_time = datetime.now(timezone.utc)
-
-        source_type_filter_map = {
-            ioc_source_schemas.IoCSourceTypeEnum.MISP: ["APT28", "Gamaredon"],
-            ioc_source_schemas.IoCSourceTypeEnum.OPENCTI: ["Sandworm", "Turla"],
-            ioc_source_schemas.IoCSourceTypeEnum.MOCK_APT_REPORT: [apt.get("name") for apt in all_apt_data_from_file]
-        }
-        relevant_apt_names_for_source = source_type_filter_map.get(ioc_source.type)
-        if relevant_apt_names_for_source is None and ioc_source.type != ioc_source_schemas.IoCSourceTypeEnum.INTERNAL:
-            relevant_apt_names_for_source = [apt.get("name") for apt in all_apt_data_from_file]
         if ioc_source.type == ioc_source_schemas.IoCSourceTypeEnum.INTERNAL:
             print(f"Source '{ioc_source.name}' is INTERNAL, no IoCs auto-generated from mock file for it.")
-            ioc_source.last_fetched = datetime.now(timezone.utc);
-            db.add(ioc_source);
-            db.commit()
+            self._record_fetch(db, ioc_source, "success", started)
             return {"status": "success", "message": "Internal source, no auto-fetch.", "added_iocs": 0,
                     "failed_iocs": 0}
+        if not es_writer:
+            return {"status": "error", "message": "ES writer not configured.", "added_iocs": 0, "failed_iocs": 0}
 
-        for apt_entry in all_apt_data_from_file:
-            apt_name_from_file = apt_entry.get("name")
-            if relevant_apt_names_for_source is not None and apt_name_from_file not in relevant_apt_names_for_source:
-                continue
-            apt_db_id = apt_name_to_id_map.get(apt_name_from_file)
+        is_remote_feed = bool(ioc_source.url) and ioc_source.type in FEED_PARSERS_BY_SOURCE_TYPE
+        if not is_remote_feed and not os.path.exists(MOCK_DATA_FILE_PATH_IOC_SOURCES):
+            print(f"ERROR: Mock data file not found at {MOCK_DATA_FILE_PATH_IOC_SOURCES}")
+            # Фіксуємо спробу, інакше last_fetched не зсувається й планувальник повторює її на кожному такті
+            self._record_fetch(db, ioc_source, "error", started)
+            return {"status": "success", "message": "Mock data file empty or not found.", "added_iocs": 0,
+                    "failed_iocs": 0}
+        etag = None if force else ioc_source.http_etag
+        last_modified = None if force else ioc_source.http_last_modified
+        try:
+            feed = open_feed_stream(ioc_source.url if is_remote_feed else MOCK_DATA_FILE_PATH_IOC_SOURCES,
+                                    etag=etag, last_modified=last_modified)
+        except (OSError, ValueError) as e:
+            self._record_fetch(db, ioc_source, "error", started)
+            return {"status": "error", "message": f"Failed to open feed of source '{ioc_source.name}': {e}",
+                    "added_iocs": 0, "failed_iocs": 0}
+        fetched_at = datetime.now(timezone.utc)
+        if feed.not_modified:
+            # Фід не змінився, тож усі записи знімка досі в ньому — їх теж треба «торкнути», інакше
+            # TTL-прострочення деактивує IoC незмінного фіду
+            snapshot = SourceSnapshotDiff.load(db, ioc_source.id)
+            cutoff = touch_cutoff(fetched_at, settings.IOC_TTL_DAYS)
+            if cutoff is not None:
+                touched_doc_ids = snapshot.stale_doc_ids(cutoff)
+                self._touch_listed_iocs(es_writer, touched_doc_ids, fetched_at, indicator_service)
+                snapshot.apply(db, fetched_at, touched_doc_ids, [])
+            self._record_fetch(db, ioc_source, "not_modified", started)
+            return {"status": "success", "message": f"Feed of '{ioc_source.name}' not modified since last fetch.",
+                    "added_iocs": 0, "updated_iocs": 0, "failed_iocs": 0}
 
-            for ioc_json in apt_entry.get("iocs", []):
-                try:
-                    ioc_type_str = ioc_json.get("type", "").lower().replace("_", "-")
-                    ioc_type_enum = indicator_schemas.IoCTypeEnum(ioc_type_str)
-                    ioc_create_payload = {
-                        "value": ioc_json.get("value"), "type": ioc_type_enum,
-                        "description": ioc_json.get("description"), "source_name": ioc_source.name,
-                        "is_active": ioc_json.get("is_active", True), "confidence": ioc_json.get("confidence"),
-                        "tags": ioc_json.get("tags", []),
-                        "first_seen": current_time, "last_seen": current_time,
-                        "attributed_apt_group_ids": [apt_db_id] if apt_db_id else []
-                    }
-                    cleaned_payload = {k: v for k, v in ioc_create_payload.items() if v is not None}
-                    iocs_to_create.append(indicator_schemas.IoCCreate(**cleaned_payload))
-                except (ValueError, ValidationError) as e:
-                    print(f"Skipping IoC due to error: {e}. Data: {ioc_json}")
+        with feed.stream:
+            if is_remote_feed:
+                iocs_to_store = FEED_PARSERS_BY_SOURCE_TYPE[ioc_source.type](feed.stream, ioc_source.name)
+            else:
+                source_type_filter_map = {
+                    ioc_source_schemas.IoCSourceTypeEnum.MISP: ["APT28", "Gamaredon"],
+                    ioc_source_schemas.IoCSourceTypeEnum.OPENCTI: ["Sandworm", "Turla"],
+                }
+                iocs_to_store = self._iter_mock_feed_iocs(db, feed.stream, ioc_source, apt_service,
+                                                          source_type_filter_map.get(ioc_source.type))
+            # У bulk upsert ідуть лише нові та змінені відносно знімка попереднього отримання записи
+            snapshot = SourceSnapshotDiff.load(db, ioc_source.id)
+            try:
+                counts = indicator_service.bulk_upsert_iocs(
+                    db=db,
+                    es_writer=es_writer,
+                    iocs=snapshot.changed_only(iocs_to_store, send_all=force),
+                    apt_service=apt_service,
+                    seen_in_feed_at=fetched_at
+                )
+            except (OSError, ValueError) as e:
+                # Помилка читання чи розбору фіду; пакети, надіслані до неї, уже збережені
+                self._record_fetch(db, ioc_source, "error", started)
+                return {"status": "error", "message": f"Failed to read feed of source '{ioc_source.name}': {e}",
+                        "added_iocs": 0, "failed_iocs": 0}
+        if counts["failed"]:
+            # Невідомо, які саме записи не потрапили в ES, тому знімок не оновлюємо: наступне отримання
+            # надішле ту саму дельту ще раз (upsert ідемпотентний), а деактивацію відкладаємо
+            print(f"Source '{ioc_source.name}': {counts['failed']} IoCs failed, snapshot left unchanged.")
+            fetch_status = "partial"
+        else:
+            fetch_status = "success"
+            counts["removed"] = self._apply_snapshot_delta(db, es_writer, ioc_source, snapshot, indicator_service,
+                                                           fetched_at)
+        added_count, updated_count, failed_count = counts["created"], counts["updated"], counts["failed"]
+        removed_count = counts.get("removed", 0)
 
-        if not iocs_to_create:
-            ioc_source.last_fetched = datetime.now(timezone.utc);
-            db.add(ioc_source);
-            db.commit()
+        self._record_fetch(db, ioc_source, fetch_status, started, counts, feed)
+        if not (added_count or updated_count or failed_count or removed_count):
             return {"status": "success", "message": "No new relevant IoCs to create for this source.", "added_iocs": 0,
                     "failed_iocs": 0}
+        message = (f"Fetched from '{ioc_source.name}'. Added IoCs: {added_count}. "
+                   f"Updated: {updated_count}. Deactivated: {removed_count}. Failed: {failed_count}.")
+        return {"status": "success", "message": message, "added_iocs": added_count, "updated_iocs": updated_count,
+                "removed_iocs": removed_count, "failed_iocs": failed_count}
 
-        added_count = 0;
-        failed_count = 0
-        if not es_writer:
-            return {"status": "error", "message": "ES writer not configured.", "added_iocs": 0,
-                    "failed_iocs": len(iocs_to_create)}
-
-        for ioc_to_add_schema in iocs_to_create:
-            # Викликаємо метод з IndicatorService для додавання одного IoC
-            created_ioc_response = indicator_service.add_ioc(
-                db=db,  # db потрібен для IndicatorService для валідації APT ID
-                es_writer=es_writer,
-                ioc_create_data=ioc_to_add_schema,
-                apt_service=apt_service  # Передаємо екземпляр APTGroupService
-            )
-            if created_ioc_response:
-                added_count += 1
-            else:
-                failed_count += 1
-
-        if ioc_source:  # Перевірка, що ioc_source не None
-            ioc_source.last_fetched = datetime.now(timezone.utc);
-            db.add(ioc_source);
-            db.commit()
-        message = f"Fetched from '{ioc_source.name if ioc_source else 'N/A'}'. Added IoCs: {added_count}. Failed: {failed_count}."
-        return {"status": "success", "message": message, "added_iocs": added_count, "failed_iocs": failed_count}
\ No newline at end of file
+    def _apply_snapshot_delta(self, db: Session, es_writer: ElasticsearchWriter, ioc_source: IoCSource,
+                              snapshot: SourceSnapshotDiff, indicator_service: IndicatorService,
+                              now: datetime) -> int:
+        """
+        Після повного успішного отримання: деактивує IoC, що зникли з фіду (якщо їх не тримає інше джерело),
+        оновлює seen_in_feed_at давно не переписаних незмінених записів і зберігає дельту знімка.
+        now — час отримання, з яким записи фіду пішли в ES. Повертає кількість деактивованих IoC.
+        """
+        removed_doc_ids = snapshot.removed_doc_ids()
+        held_elsewhere = doc_ids_held_by_other_sources(db, ioc_source.id, removed_doc_ids) if removed_doc_ids else set()
+        deactivated = indicator_service.bulk_partial_update_iocs(
+            es_writer, [doc_id for doc_id in removed_doc_ids if doc_id not in held_elsewhere],
+            {"is_active": False, "updated_at_siem": now.isoformat()})
+
+        touched_doc_ids: List[str] = []
+        cutoff = touch_cutoff(now, settings.IOC_TTL_DAYS)
+        if cutoff is not None:
+            touched_doc_ids = snapshot.stale_unchanged_doc_ids(cutoff)
+            self._touch_listed_iocs(es_writer, touched_doc_ids, now, indicator_service)
+
+        snapshot.apply(db, now, touched_doc_ids, removed_doc_ids)
+        delta = snapshot.delta
+        print(f"Source '{ioc_source.name}' delta: added {delta.added}, changed {delta.changed}, "
+              f"unchanged {delta.unchanged}, removed {delta.removed} (deactivated {deactivated}), "
+              f"seen_in_feed_at refreshed {delta.touched}.")
+        return deactivated
+
+    def _touch_listed_iocs(self, es_writer: ElasticsearchWriter, doc_ids: List[str], now: datetime,
+                           indicator_service: IndicatorService) -> int:
+        """
+        Записи, що досі є у фіді: оновлює seen_in_feed_at (поле TTL-прострочення) і знову активує ті,
+        що встигли прострочитися, наприклад, коли інтервал отримання довший за половину TTL.
+        """
+        if not doc_ids:
+            return 0
+        touched = indicator_service.bulk_partial_update_iocs(
+            es_writer, doc_ids, {IOC_SEEN_IN_FEED_FIELD: now.isoformat(), "is_active": True,
+                                 "updated_at_siem": now.isoformat()})
+        if touched:
+            cache_versions.bump(cache_versions.IOCS)
+        return touched
@@ -0,0 +1,145 @@
+# app/modules/ioc_sources/snapshot.py
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Set, Iterable, Iterator
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.database.postgres_models.ioc_source_models import IoCSourceSnapshotEntry
+from app.modules.indicators import schemas as indicator_schemas
+from app.modules.indicators.services import ioc_document_id
+
+SNAPSHOT_WRITE_BATCH_SIZE = 1000
+
+
+def ioc_content_hash(ioc: indicator_schemas.IoCCreate) -> str:
+    """
+    Відбиток змістовних полів запису фіду. first_seen/last_seen не входять: для mock-фіду це час
+    отримання, тож інакше кожен запис щоразу вважався б зміненим.
+    """
+    content = ioc.model_dump(mode="json", exclude={"first_seen", "last_seen"})
+    content["tags"] = sorted(content.get("tags") or [])
+    content["attributed_apt_group_ids"] = sorted(content.get("attributed_apt_group_ids") or [])
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SnapshotDelta:
+    added: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    touched: int = 0
+
+
+class SourceSnapshotDiff:
+    """
+    Порівнює поточне отримання фіду зі знімком попереднього (doc_id -> content_hash). В індексатор
+    пропускаються лише нові та змінені записи; після успішного отримання знімок оновлюється дельтою,
+    а записи, що зникли з фіду, повертаються як кандидати на деактивацію.
+
+    Незмінені записи в ES не переписуються, тож їхній seen_in_feed_at не рухається. Щоб TTL-прострочення
+    (теж за seen_in_feed_at) не деактивувало IoC, які досі є у фіді, це поле оновлюється («touch»), коли
+    записане значення (es_last_seen знімка) старше за touch_after.
+    """
+
+    def __init__(self, source_id: int, previous: Dict[str, str], previous_last_seen: Dict[str, datetime]):
+        self.source_id = source_id
+        self.previous = previous
+        self.previous_last_seen = previous_last_seen
+        self.delta = SnapshotDelta()
+        self._upserts: Dict[str, str] = {}
+        self._seen: Set[str] = set()
+
+    @classmethod
+    def load(cls, db: Session, source_id: int) -> "SourceSnapshotDiff":
+        rows = db.query(IoCSourceSnapshotEntry.doc_id, IoCSourceSnapshotEntry.content_hash,
+                        IoCSourceSnapshotEntry.es_last_seen).filter(
+            IoCSourceSnapshotEntry.source_id == source_id).yield_per(10_000)
+        previous: Dict[str, str] = {}
+        previous_last_seen: Dict[str, datetime] = {}
+        for row in rows:
+            previous[row.doc_id] = row.content_hash
+            previous_last_seen[row.doc_id] = row.es_last_seen
+        return cls(source_id, previous, previous_last_seen)
+
+    def changed_only(self, iocs: Iterable[indicator_schemas.IoCCreate],
+                     send_all: bool = False) -> Iterator[indicator_schemas.IoCCreate]:
+        """Пропускає нові й змінені записи (send_all — усі, але знімок однаково рахується)."""
+        for ioc in iocs:
+            doc_id = ioc_document_id(ioc.type, ioc.value)
+            if doc_id in self._seen:
+                # Дублікат у межах фіду: bulk upsert однаково зіллє теги, тож просто передаємо далі
+                yield ioc
+                continue
+            self._seen.add(doc_id)
+            content_hash = ioc_content_hash(ioc)
+            previous_hash = self.previous.get(doc_id)
+            if previous_hash is None:
+                self.delta.added += 1
+            elif previous_hash != content_hash:
+                self.delta.changed += 1
+            else:
+                self.delta.unchanged += 1
+                if not send_all:
+                    continue
+            self._upserts[doc_id] = content_hash
+            yield ioc
+
+    def removed_doc_ids(self) -> List[str]:
+        return [doc_id for doc_id in self.previous if doc_id not in self._seen]
+
+    def stale_unchanged_doc_ids(self, touch_after: datetime) -> List[str]:
+        return [doc_id for doc_id in self._seen if doc_id not in self._upserts
+                and self.previous_last_seen.get(doc_id, touch_after) < touch_after]
+
+    def stale_doc_ids(self, touch_after: datetime) -> List[str]:
+        """Для фіду без змін (304): усі записи знімка досі у фіді, «торкнути» треба застарілі з них."""
+        return [doc_id for doc_id, last_seen in self.previous_last_seen.items() if last_seen < touch_after]
+
+    def apply(self, db: Session, now: datetime, touched_doc_ids: List[str], removed_doc_ids: List[str]):
+        """
+        Записує дельту знімка: нові/змінені й «торкнуті» рядки — upsert з es_last_seen = now (саме це значення
+        seen_in_feed_at записано в ES), зниклі з фіду — видалення.
+        """
+        rows = [{"source_id": self.source_id, "doc_id": doc_id, "content_hash": content_hash, "es_last_seen": now}
+                for doc_id, content_hash in self._upserts.items()]
+        rows += [{"source_id": self.source_id, "doc_id": doc_id, "content_hash": self.previous[doc_id],
+                  "es_last_seen": now} for doc_id in touched_doc_ids]
+        try:
+            for i in range(0, len(rows), SNAPSHOT_WRITE_BATCH_SIZE):
+                stmt = pg_insert(IoCSourceSnapshotEntry).values(rows[i:i + SNAPSHOT_WRITE_BATCH_SIZE])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[IoCSourceSnapshotEntry.source_id, IoCSourceSnapshotEntry.doc_id],
+                    set_={"content_hash": stmt.excluded.content_hash, "es_last_seen": stmt.excluded.es_last_seen})
+                db.execute(stmt)
+            for i in range(0, len(removed_doc_ids), SNAPSHOT_WRITE_BATCH_SIZE):
+                db.execute(delete(IoCSourceSnapshotEntry).where(
+                    IoCSourceSnapshotEntry.source_id == self.source_id,
+                    IoCSourceSnapshotEntry.doc_id.in_(removed_doc_ids[i:i + SNAPSHOT_WRITE_BATCH_SIZE])))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        self.delta.removed = len(removed_doc_ids)
+        self.delta.touched = len(touched_doc_ids)
+
+
+def doc_ids_held_by_other_sources(db: Session, source_id: int, doc_ids: List[str]) -> Set[str]:
+    """IoC, які ще є у знімку іншого джерела, не деактивуються лише через зникнення з цього фіду."""
+    held: Set[str] = set()
+    for i in range(0, len(doc_ids), SNAPSHOT_WRITE_BATCH_SIZE):
+        rows = db.query(IoCSourceSnapshotEntry.doc_id).filter(
+            IoCSourceSnapshotEntry.source_id != source_id,
+            IoCSourceSnapshotEntry.doc_id.in_(doc_ids[i:i + SNAPSHOT_WRITE_BATCH_SIZE])).distinct().all()
+        held.update(row.doc_id for row in rows)
+    return held
+
+
+def touch_cutoff(now: datetime, ttl_days: int) -> Optional[datetime]:
+    """last_seen незмінених записів оновлюється, коли минула половина TTL (None — TTL вимкнено)."""
+    return now - timedelta(days=ttl_days) / 2 if ttl_days > 0 else None
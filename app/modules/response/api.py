@@ -5,6 +5,8 @@ from fastapi import APIRouter, Depends, HTTPException, Path, Body
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.core import cache_versions
+from app.core.response_cache import etag_cache
 from app.core.database import get_db
 from app.database.postgres_models.correlation_models import Offence as OffenceModel  # Для отримання з БД
 # Для тестового запуску execute_response_for_offence
@@ -35,7 +37,7 @@ def create_response_action_api(
 
 
 @router.get("/actions/", response_model=List[response_schemas.ResponseActionResponse],
-            operation_id="response_get_all_actions")
+            operation_id="response_get_all_actions", dependencies=[etag_cache(cache_versions.RESPONSE)])
 def get_all_response_actions_api(
         skip: int = 0, limit: int = 100,
         db: Session = Depends(get_db),
@@ -45,7 +47,7 @@ def get_all_response_actions_api(
 
 
 @router.get("/actions/{action_id}", response_model=response_schemas.ResponseActionResponse,
-            operation_id="response_get_action_by_id")
+            operation_id="response_get_action_by_id", dependencies=[etag_cache(cache_versions.RESPONSE)])
 def get_response_action_by_id_api(
         action_id: int = Path(..., ge=1),
         db: Session = Depends(get_db),
@@ -101,7 +103,7 @@ def create_response_pipeline_api(
 
 
 @router.get("/pipelines/", response_model=List[response_schemas.ResponsePipelineResponse],
-            operation_id="response_get_all_pipelines")
+            operation_id="response_get_all_pipelines", dependencies=[etag_cache(cache_versions.RESPONSE)])
 def get_all_response_pipelines_api(
         skip: int = 0, limit: int = 100,
         db: Session = Depends(get_db),
@@ -111,7 +113,7 @@ def get_all_response_pipelines_api(
 
 
 @router.get("/pipelines/{pipeline_id}", response_model=response_schemas.ResponsePipelineResponse,
-            operation_id="response_get_pipeline_by_id")
+            operation_id="response_get_pipeline_by_id", dependencies=[etag_cache(cache_versions.RESPONSE)])
 def get_response_pipeline_by_id_api(
         pipeline_id: int = Path(..., ge=1),
         db: Session = Depends(get_db),
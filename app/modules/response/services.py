@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone
 
+from app.core import cache_versions
 from . import schemas as response_schemas
 from ..indicators import schemas as indicator_schemas
 from app.database.postgres_models.response_models import ResponseAction, ResponsePipeline
@@ -18,6 +19,7 @@ class ResponseService:
         db.add(db_action);
         db.commit();
         db.refresh(db_action)
+        cache_versions.bump(cache_versions.RESPONSE)
         return db_action
 
     def get_action(self, db: Session, action_id: int) -> Optional[ResponseAction]:
@@ -35,11 +37,15 @@ class ResponseService:
         db.add(db_action);
         db.commit();
         db.refresh(db_action)
+        cache_versions.bump(cache_versions.RESPONSE)
         return db_action
 
     def delete_action(self, db: Session, action_id: int) -> bool:
         db_action = self.get_action(db, action_id)
-        if db_action: db.delete(db_action); db.commit(); return True
+        if db_action:
+            db.delete(db_action); db.commit()
+            cache_versions.bump(cache_versions.RESPONSE)
+            return True
         return False
 
     # --- CRUD для ResponsePipeline ---
@@ -63,6 +69,7 @@ class ResponseService:
         db.add(db_pipeline);
         db.commit();
         db.refresh(db_pipeline)
+        cache_versions.bump(cache_versions.RESPONSE)
         return db_pipeline
 
     def get_pipeline(self, db: Session, pipeline_id: int) -> Optional[ResponsePipeline]:
@@ -94,13 +101,24 @@ class ResponseService:
         db.add(db_pipeline);
         db.commit();
         db.refresh(db_pipeline)
+        cache_versions.bump(cache_versions.RESPONSE)
         return db_pipeline
 
     def delete_pipeline(self, db: Session, pipeline_id: int) -> bool:
         db_pipeline = self.get_pipeline(db, pipeline_id)
-        if db_pipeline: db.delete(db_pipeline); db.commit(); return True
+        if db_pipeline:
+            db.delete(db_pipeline); db.commit()
+            cache_versions.bump(cache_versions.RESPONSE)
+            return True
         return False
 
+    def has_enabled_pipeline_for_rule(self, db: Session, correlation_rule_id: int) -> bool:
+        """Дешева перевірка перед пакетним реагуванням: чи є взагалі активний пайплайн для правила."""
+        return db.query(ResponsePipeline.id).filter(
+            ResponsePipeline.trigger_correlation_rule_id == correlation_rule_id,
+            ResponsePipeline.is_enabled == True
+        ).first() is not None
+
     # --- Виконання Пайплайна Реагування ---
     def execute_response_for_offence(
             self,
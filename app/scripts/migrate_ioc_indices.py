@@ -0,0 +1,121 @@
+# app/scripts/migrate_ioc_indices.py
+"""
+Перенесення IoC зі старих щоденних індексів siem-iocs-YYYY.MM.DD в єдиний індекс за аліасом siem-iocs.
+
+Документи переносяться під детермінованим ID sha1("тип:значення") (ioc_document_id), тож наступний імпорт
+фіду оновлює їх, а не створює другий документ; op_type=create робить повторний запуск безпечним. Щоденні
+індекси йдуть від найновішого: з кількох копій одного IoC лишається найсвіжіша, а документ, уже записаний
+у новий індекс фідом, має перевагу. matched_ioc_details старих офенсів зберігають попередній ioc_id — це
+знімок на момент спрацювання, поточний IoC за ним шукається за значенням і типом.
+Після перенесення IoC з випадковими ID у новому індексі (ручно додані ще без детермінованого ID)
+зливаються з документом під детермінованим ID і видаляються. Старі індекси видаляються лише з
+--delete-old і лише якщо кожен їхній документ є в новому індексі. Застосунок читає лише аліас (якщо не
+ввімкнено IOC_READ_LEGACY_INDICES), тож залишені старі індекси не дублюють IoC у пошуку й агрегаціях.
+
+    python app/scripts/migrate_ioc_indices.py [--delete-old]
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.core.config import settings
+from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
+from app.modules.indicators.services import (
+    IOC_BULK_OVERWRITE_FIELDS,
+    IOC_BULK_UPSERT_SCRIPT,
+    IOC_INDEX,
+    ensure_ioc_index,
+    ioc_document_id
+)
+
+# Painless-доповнення String.sha1() дає той самий шістнадцятковий sha1, що й ioc_document_id
+REKEY_SCRIPT = "if (ctx._source.type != null && ctx._source.value != null) " \
+               "{ ctx._id = (ctx._source.type + ':' + ctx._source.value).sha1(); }"
+REKEY_PAGE_SIZE = 1000
+
+
+def rekey_store_iocs(es_client) -> int:
+    """Зливає документи нового індексу з недетермінованим ID у документ під ioc_document_id. Повертає кількість."""
+    pit_id = es_client.open_point_in_time(index=IOC_INDEX, keep_alive="2m")["id"]
+    body = {"size": REKEY_PAGE_SIZE, "query": {"match_all": {}}, "pit": {"id": pit_id, "keep_alive": "2m"},
+            "sort": [{"_shard_doc": "asc"}], "track_total_hits": False}
+    rekeyed = 0
+    try:
+        while True:
+            hits = es_client.search(body=body)['hits']['hits']
+            operations, old_ids = [], []
+            for hit in hits:
+                doc = hit['_source']
+                if not doc.get('type') or not doc.get('value'):
+                    continue
+                doc_id = ioc_document_id(doc['type'], doc['value'])
+                if doc_id == hit['_id']:
+                    continue
+                doc = {k: v for k, v in doc.items() if v is not None}
+                doc.setdefault("tags", [])
+                doc.setdefault("attributed_apt_group_ids", [])
+                operations.append({"update": {"_index": IOC_INDEX, "_id": doc_id, "retry_on_conflict": 3}})
+                operations.append({"scripted_upsert": True, "upsert": {},
+                                   "script": {"source": IOC_BULK_UPSERT_SCRIPT, "lang": "painless",
+                                              "params": {"doc": doc, "overwrite_fields": IOC_BULK_OVERWRITE_FIELDS}}})
+                old_ids.append(hit['_id'])
+            if operations:
+                items = es_client.bulk(operations=operations, refresh=True)['items']
+                # Старий документ видаляється лише після успішного злиття
+                merged_old_ids = [old_id for old_id, item in zip(old_ids, items) if not item['update'].get('error')]
+                if merged_old_ids:
+                    es_client.bulk(operations=[{"delete": {"_index": IOC_INDEX, "_id": old_id}}
+                                               for old_id in merged_old_ids])
+                rekeyed += len(merged_old_ids)
+            if len(hits) < REKEY_PAGE_SIZE:
+                return rekeyed
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        es_client.close_point_in_time(id=pit_id)
+
+
+def migrate_ioc_indices(delete_old: bool = False):
+    es_writer = ElasticsearchWriter(es_hosts=[f"http://{settings.ELASTICSEARCH_HOST}:{settings.ELASTICSEARCH_PORT_API}"])
+    es_client = es_writer.es_client
+    ensure_ioc_index(es_client)
+
+    legacy_indices = sorted((name for name in es_client.indices.get(index="siem-iocs-*") if name != IOC_INDEX),
+                            reverse=True)
+    if not legacy_indices:
+        print("No legacy daily IoC indices found.")
+
+    for legacy_index in legacy_indices:
+        total = es_client.count(index=legacy_index)['count']
+        resp = es_client.reindex(
+            source={"index": legacy_index}, dest={"index": IOC_INDEX, "op_type": "create"},
+            script={"source": REKEY_SCRIPT, "lang": "painless"},
+            conflicts="proceed", wait_for_completion=True, refresh=True)
+        created, conflicts = resp.get('created', 0), resp.get('version_conflicts', 0)
+        failures = resp.get('failures') or []
+        print(f"{legacy_index}: {total} docs, {created} copied, {conflicts} already present, {len(failures)} failures.")
+        if failures:
+            print(f"  Failures: {failures[:5]}")
+            continue
+
+        if delete_old:
+            if created + conflicts == total:
+                es_client.indices.delete(index=legacy_index)
+                print(f"  Deleted {legacy_index}.")
+            else:
+                print(f"  Kept {legacy_index}: copied + present ({created + conflicts}) != total ({total}).")
+
+    rekeyed = rekey_store_iocs(es_client)
+    print(f"{IOC_INDEX}: merged {rekeyed} IoCs with random IDs into their deterministic documents.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reindex daily IoC indices into the single aliased IoC index.")
+    parser.add_argument("--delete-old", action="store_true", help="Delete daily indices after a complete copy.")
+    args = parser.parse_args()
+
+    print("-" * 50)
+    migrate_ioc_indices(delete_old=args.delete_old)
+    print("Script finished.")
+    print("-" * 50)
@@ -139,12 +139,12 @@ const IndicatorFormModal = ({
                 {formError && <Alert severity="error" sx={{mb: 2}}>{formError}</Alert>}
                 <TextField margin="dense" name="value" label="Значення IoC" value={formData.value}
                            onChange={handleChange} error={!!errors.value} helperText={errors.value} fullWidth
-                           disabled={isLoading}/>
+                           disabled={isLoading || !!initialData}/>
 
                 <FormControl fullWidth margin="dense" variant="outlined" error={!!errors.type}>
                     <InputLabel id="ioc-type-select-label">Тип IoC</InputLabel>
                     <Select labelId="ioc-type-select-label" name="type" value={formData.type} onChange={handleChange}
-                            label="Тип IoC" disabled={isLoading}>
+                            label="Тип IoC" disabled={isLoading || !!initialData}>
                         {iocTypeOptions.map(opt => <MenuItem key={opt.value} value={opt.value}>{opt.label}</MenuItem>)}
                     </Select>
                     {errors.type && <Typography color="error" variant="caption" sx={{ml: 2}}>{errors.type}</Typography>}
@@ -9,9 +9,18 @@ from app.modules.device_interaction import api as device_interaction_api
 from app.modules.data_ingestion.service import DataIngestionService  # <--- Імпортуй твій сервіс
 
 from app.modules.ioc_sources import api as ioc_sources_api  # <--- НОВИЙ
+from app.modules.ioc_sources.scheduler import IoCFetchScheduler
 from app.modules.apt_groups import api as apt_groups_api  # <--- НОВИЙ
 from app.modules.indicators import api as indicators_api  # <--- НОВИЙ
+from app.modules.indicators.ioc_store import ioc_store
+from app.modules.indicators.services import IndicatorService, ioc_read_index
+from app.modules.data_ingestion.writers.elasticsearch_writer import ElasticsearchWriter
 from app.modules.correlation import api as correlation_api
+from app.modules.correlation.engine.stream import streaming_correlation_engine
+from app.modules.correlation.engine.scheduler import CorrelationScheduler, OffenceMaintenanceScheduler
+from app.core.config import settings
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.response_cache import ETAG_HEADER
 from app.modules.response import api as response_api # <--- ДОДАНО
 from app.modules.auth import api as auth_api
 from app.modules.users import api as users_api
@@ -32,6 +41,20 @@ data_ingestion_service = DataIngestionService(
     syslog_port=SYSLOG_LISTEN_PORT
 )
 
+# Потокова кореляція (послідовності та порогові stream-правила) отримує події напряму від сервісу прийому даних
+data_ingestion_service.add_event_observer(streaming_correlation_engine.on_event)
+
+# Періодичний цикл кореляції з розподілом правил між репліками (вимкнено, якщо інтервал 0)
+correlation_scheduler = CorrelationScheduler(settings.CORRELATION_INTERVAL_SECONDS) \
+    if settings.CORRELATION_INTERVAL_SECONDS > 0 else None
+
+# Секції offences і прибирання лічильників — завжди, навіть якщо цикл кореляції вимкнено
+offence_maintenance_scheduler = OffenceMaintenanceScheduler()
+
+# Фонове отримання IoC із джерел за їхніми інтервалами (вимкнено, якщо крок 0)
+ioc_fetch_scheduler = IoCFetchScheduler(settings.IOC_FETCH_TICK_SECONDS) \
+    if settings.IOC_FETCH_TICK_SECONDS > 0 else None
+
 
 # --- Обробники подій життєвого циклу (lifespan) ---
 @asynccontextmanager
@@ -47,6 +70,38 @@ async def lifespan(app: FastAPI):
     # except Exception as e:
     #     print(f"Error creating database tables: {e}")
 
+    # Місячні секції offences наперед (і прибирання прострочених) одразу при старті, далі — щогодини
+    offence_maintenance_scheduler.run_once()
+    try:
+        offence_maintenance_scheduler.start()
+    except Exception as e:
+        print(f"Error starting offence maintenance scheduler: {e}")
+
+    # Знімок IoC у пам'яті: повне завантаження у фоні, далі інкрементальні оновлення
+    try:
+        ioc_store.start(
+            lambda: ElasticsearchWriter(
+                es_hosts=[f"http://{settings.ELASTICSEARCH_HOST}:{settings.ELASTICSEARCH_PORT_API}"]).es_client,
+            ioc_read_index, IndicatorService()._parse_ioc_hit_to_response)
+    except Exception as e:
+        print(f"Error starting IoC store: {e}")
+
+    try:
+        streaming_correlation_engine.start()
+    except Exception as e:
+        print(f"Error starting streaming correlation engine: {e}")
+    if correlation_scheduler:
+        try:
+            correlation_scheduler.start()
+        except Exception as e:
+            print(f"Error starting correlation scheduler: {e}")
+
+    if ioc_fetch_scheduler:
+        try:
+            ioc_fetch_scheduler.start()
+        except Exception as e:
+            print(f"Error starting IoC fetch scheduler: {e}")
+
     # Запуск слухачів сервісу прийому даних
     try:
         print(f"Starting data ingestion listeners (Syslog on {SYSLOG_LISTEN_HOST}:{SYSLOG_LISTEN_PORT})...")
@@ -64,6 +119,28 @@ async def lifespan(app: FastAPI):
         data_ingestion_service.stop_listeners()
     except Exception as e:
         print(f"Error stopping data ingestion listeners: {e}")
+    if ioc_fetch_scheduler:
+        try:
+            await ioc_fetch_scheduler.stop()
+        except Exception as e:
+            print(f"Error stopping IoC fetch scheduler: {e}")
+    if correlation_scheduler:
+        try:
+            correlation_scheduler.stop()
+        except Exception as e:
+            print(f"Error stopping correlation scheduler: {e}")
+    try:
+        offence_maintenance_scheduler.stop()
+    except Exception as e:
+        print(f"Error stopping offence maintenance scheduler: {e}")
+    try:
+        streaming_correlation_engine.stop()
+    except Exception as e:
+        print(f"Error stopping streaming correlation engine: {e}")
+    try:
+        ioc_store.stop()
+    except Exception as e:
+        print(f"Error stopping IoC store: {e}")
 
 
 # --- Створення екземпляра FastAPI з lifespan ---
@@ -85,6 +162,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER, apt_groups_api.APT_UNLINK_TASK_HEADER],
 )
 # Підключаємо роутер для модуля взаємодії з пристроями
 app.include_router(auth_api.router)